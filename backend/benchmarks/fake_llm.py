@@ -0,0 +1,86 @@
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+UNKNOWN_QUESTION_RESPONSE = "ERROR: I'm sorry, I can't generate an answer for that query based on the current database."
+
+
+class FakeOpenAIClient:
+    """
+    Deterministic local stand-in for openai.OpenAI.
+
+    Exposes the same ``client.chat.completions.create(...)`` call shape that
+    OpenAIProvider uses and answers with canned SQL from a question -> SQL
+    mapping, so the full request pipeline can be exercised without network
+    access or API spend. ``slow_rate`` of the calls take an extra ``slow_ms``,
+    imitating the latency spikes that request hedging is meant to absorb.
+    """
+
+    def __init__(
+        self,
+        answers: dict,
+        latency_ms=0.0,
+        jitter_ms=0.0,
+        error_rate=0.0,
+        slow_rate=0.0,
+        slow_ms=0.0,
+        seed=0,
+    ):
+        self.answers = answers
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.seed = seed
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, temperature=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call_number = self.calls
+
+        system_prompt = next(
+            (m["content"] for m in messages if m["role"] == "system"), ""
+        )
+        question = messages[-1]["content"]
+
+        # Seed per question and call so runs are reproducible regardless of scheduling
+        rng = random.Random(f"{self.seed}:{question}:{call_number}")
+        delay_ms = self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)
+        if rng.random() < self.slow_rate:
+            delay_ms += self.slow_ms
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+        if rng.random() < self.error_rate:
+            raise RuntimeError("Simulated LLM provider failure")
+
+        sql_query = self.answers.get(question, UNKNOWN_QUESTION_RESPONSE)
+        content = json.dumps({"sql_query": sql_query})
+
+        # Rough token estimate (~4 characters per token) mirroring the real usage block
+        prompt_tokens = (len(system_prompt) + len(question)) // 4
+        completion_tokens = len(content) // 4
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+def fake_provider(name: str, answers: dict, **client_options):
+    """An OpenAIProvider backed by a FakeOpenAIClient, for use in an LLMRouter"""
+    from services.llm_providers import OpenAIProvider
+
+    return OpenAIProvider(
+        name, "fake", client=FakeOpenAIClient(answers, **client_options)
+    )
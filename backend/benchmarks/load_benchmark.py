@@ -0,0 +1,355 @@
+# /// script
+# dependencies = [
+#   "fastapi",
+#   "httpx",
+#   "duckdb",
+#   "pandas",
+#   "python-multipart",
+#   "python-dotenv",
+#   "openai",
+# ]
+# ///
+"""
+Offline end-to-end load benchmark for the /process_query/ pipeline.
+
+The FastAPI app runs in-process behind httpx's ASGI transport and the LLM
+providers are replaced by deterministic local stand-ins that answer with canned
+SQL from benchmarks/workload.py, so no network access or API spend is needed.
+With --alternate the router gets a second stand-in provider to hedge to.
+Latency is reported overall and per pipeline stage (quota, retrieval, llm,
+validation, execution, serialization, logging, plus time spent waiting on an
+identical in-flight request) as returned in the Server-Timing header. Requests
+turned away by admission control are counted by status code and left out of
+the admitted latency summary.
+
+Build the dataset once, then run from the backend directory:
+
+    python json_to_database.py
+    python -m benchmarks.load_benchmark --requests 500 --concurrency 16
+    python -m benchmarks.load_benchmark --llm-latency-ms 300 --llm-slow-rate 0.05 \
+        --llm-slow-ms 3000 --alternate
+    python -m benchmarks.load_benchmark --rate 40 --distinct --llm-latency-ms 3000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.fake_llm import fake_provider
+from benchmarks.workload import WORKLOAD
+from models.dataset_snapshots import resolve_dataset
+
+STAGES = [
+    "admission_wait",
+    "quota",
+    "retrieval",
+    "llm",
+    "llm_wait",
+    "validation",
+    "execution",
+    "execution_wait",
+    "serialization",
+    "logging",
+]
+
+
+def parse_server_timing(header: str) -> dict:
+    """Parse a Server-Timing header into {stage: duration_ms}"""
+    timings = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = float(value)
+    return timings
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(
+        0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1)
+    )
+    return sorted_values[rank]
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+    }
+
+
+def prepare_environment(db_path: Path, llm_router):
+    """
+    Run the app from a scratch directory so benchmark traffic never touches the
+    real ip_tracking.db or log files, then import it with the stand-in LLM router.
+    """
+    if not db_path.exists():
+        sys.exit(
+            f"Dataset not found at {db_path}. Run `python json_to_database.py` first."
+        )
+
+    work_dir = Path(tempfile.mkdtemp(prefix="nl_to_sql_bench_"))
+    (work_dir / "ipl_data.db").symlink_to(db_path.resolve())
+    (work_dir / "system_prompt.txt").symlink_to(BACKEND_DIR / "system_prompt.txt")
+    os.chdir(work_dir)
+    os.environ.setdefault("API_KEY", "offline-benchmark")
+
+    import main
+    import services.ip_tracker as ip_tracker
+    from utils.logger import logger
+
+    # Keep console output readable; the file handler still runs as in production
+    app_logger = getattr(logger, "logger", logger)
+    for handler in list(app_logger.handlers):
+        if type(handler) is logging.StreamHandler:
+            app_logger.removeHandler(handler)
+
+    # Every benchmark request comes from its own IP, but the global cap still applies
+    ip_tracker.MAX_TOTAL_DAILY_REQUESTS = 10**9
+    main.sql_generator.llm = llm_router
+    return main.app, work_dir
+
+
+def distinct_question(question: str, index: int) -> str:
+    return f"{question} (request {index})"
+
+
+async def run_load(
+    app, total_requests, concurrency, warmup, seed, rate=0.0, distinct=False
+):
+    import httpx
+
+    rng = random.Random(seed)
+    plan = [rng.choice(WORKLOAD) for _ in range(warmup + total_requests)]
+    next_index = iter(range(len(plan)))
+    results = []
+
+    # ASGITransport doesn't send lifespan events, so run startup as uvicorn would
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark", timeout=None
+    ) as client:
+
+        async def send(index):
+            item = plan[index]
+            question = item["question"]
+            if distinct:
+                question = distinct_question(question, index)
+            start = time.perf_counter()
+            response = await client.post(
+                "/process_query/",
+                data={"user_query": question},
+                headers={
+                    "X-Forwarded-For": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+                },
+            )
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            body = response.json()
+            if response.status_code != 200:
+                outcome = f"http_{response.status_code}"
+            elif "result" in body:
+                outcome = "success"
+            else:
+                outcome = "error_response"
+            return {
+                "name": item["name"],
+                "latency_ms": elapsed_ms,
+                "outcome": outcome,
+                "stages_ms": parse_server_timing(
+                    response.headers.get("Server-Timing", "")
+                ),
+            }
+
+        async def worker():
+            for index in next_index:
+                result = await send(index)
+                if index >= warmup:
+                    results.append(result)
+
+        async def arrivals():
+            # Open loop: Poisson arrivals whether or not earlier requests finished
+            tasks = []
+            for index in next_index:
+                tasks.append(asyncio.create_task(send(index)))
+                await asyncio.sleep(rng.expovariate(rate))
+            for index, result in enumerate(await asyncio.gather(*tasks)):
+                if index >= warmup:
+                    results.append(result)
+
+        start = time.perf_counter()
+        if rate > 0:
+            await arrivals()
+        else:
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall_time = time.perf_counter() - start
+
+    return results, wall_time
+
+
+def build_report(results, wall_time, args, llm_router):
+    stage_samples = defaultdict(list)
+    for result in results:
+        for stage in STAGES:
+            stage_samples[stage].append(result["stages_ms"].get(stage, 0.0))
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "distinct": args.distinct,
+            "warmup": args.warmup,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_error_rate": args.llm_error_rate,
+            "llm_slow_rate": args.llm_slow_rate,
+            "llm_slow_ms": args.llm_slow_ms,
+            "alternate": args.alternate,
+            "seed": args.seed,
+        },
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(len(results) / wall_time, 2) if wall_time else 0.0,
+        "outcomes": dict(Counter(r["outcome"] for r in results)),
+        "latency": summarize([r["latency_ms"] for r in results]),
+        "admitted_latency": summarize(
+            [r["latency_ms"] for r in results if not r["outcome"].startswith("http_")]
+        ),
+        "stages": {stage: summarize(stage_samples[stage]) for stage in STAGES},
+        "llm_providers": llm_router.status(),
+    }
+
+
+def print_report(report):
+    print(
+        f"\n{report['latency']['count']} requests in {report['wall_time_s']}s "
+        f"({report['throughput_rps']} req/s), outcomes: {report['outcomes']}\n"
+    )
+    header = f"{'stage':<15}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["stages"].items()) + [("total", report["latency"])]
+    for stage, stats in rows:
+        print(
+            f"{stage:<15}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+        )
+    admitted = report["admitted_latency"]
+    print(
+        f"{'admitted':<15}{admitted['mean_ms']:>10.2f}{admitted['p50_ms']:>10.2f}"
+        f"{admitted['p95_ms']:>10.2f}{admitted['p99_ms']:>10.2f}"
+    )
+    print("(milliseconds)")
+    for provider in report["llm_providers"]:
+        print(
+            f"{provider['provider']}: {provider['samples']} answers, "
+            f"p90 {provider['p90_ms'] or 0:.0f} ms, circuit {provider['circuit']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Open-loop arrival rate in requests/s instead of --concurrency clients",
+    )
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument(
+        "--distinct",
+        action="store_true",
+        help="Make every question unique so no two requests share an LLM call",
+    )
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--llm-slow-rate", type=float, default=0.0, help="Share of slow LLM calls"
+    )
+    parser.add_argument(
+        "--llm-slow-ms", type=float, default=0.0, help="Extra latency of a slow call"
+    )
+    parser.add_argument(
+        "--alternate",
+        action="store_true",
+        help="Add a second stand-in provider for hedged requests",
+    )
+    parser.add_argument("--hedge-default-ms", type=float, default=8000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--db", type=Path, default=resolve_dataset(BACKEND_DIR / "ipl_data.db")
+    )
+    parser.add_argument("--json", type=Path, help="Also write the report to this file")
+    args = parser.parse_args()
+    db_path = args.db.resolve()
+    json_path = args.json.resolve() if args.json else None
+
+    answers = {item["question"]: item["sql"] for item in WORKLOAD}
+    if args.distinct:
+        answers = {
+            distinct_question(question, index): sql
+            for question, sql in answers.items()
+            for index in range(args.warmup + args.requests)
+        }
+    client_options = dict(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        error_rate=args.llm_error_rate,
+        slow_rate=args.llm_slow_rate,
+        slow_ms=args.llm_slow_ms,
+    )
+    providers = [fake_provider("primary", answers, seed=args.seed, **client_options)]
+    if args.alternate:
+        providers.append(
+            fake_provider("alternate", answers, seed=args.seed + 1, **client_options)
+        )
+
+    from services.llm_providers import LLMRouter
+
+    llm_router = LLMRouter(providers, hedge_default_ms=args.hedge_default_ms)
+    app, work_dir = prepare_environment(db_path, llm_router)
+
+    results, wall_time = asyncio.run(
+        run_load(
+            app,
+            args.requests,
+            args.concurrency,
+            args.warmup,
+            args.seed,
+            args.rate,
+            args.distinct,
+        )
+    )
+    report = build_report(results, wall_time, args, llm_router)
+    print_report(report)
+
+    if json_path:
+        json_path.write_text(json.dumps(report, indent=2))
+        print(f"Report written to {json_path}")
+    print(f"Scratch databases and logs kept in {work_dir}")
+
+
+if __name__ == "__main__":
+    main()
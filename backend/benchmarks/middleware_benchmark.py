@@ -0,0 +1,129 @@
+"""
+Middleware overhead benchmark.
+
+Calls a trivial FastAPI endpoint directly through ASGI, with no server or
+socket in the way, once bare, once behind RequestContextMiddleware and once
+behind two no-op BaseHTTPMiddleware layers (what the error logging and
+Server-Timing middleware used to be), and reports the cost per request of
+each stack over the bare app. Run from the backend directory:
+
+    python -m benchmarks.middleware_benchmark --requests 20000
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi import FastAPI
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from middleware.request_context import RequestContextMiddleware
+from utils.metrics import stage
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        with stage("handler"):
+            return {"ok": True}
+
+    return app
+
+
+async def passthrough(request, call_next):
+    return await call_next(request)
+
+
+def build_stacks() -> dict:
+    legacy = build_app()
+    legacy.add_middleware(BaseHTTPMiddleware, dispatch=passthrough)
+    legacy.add_middleware(BaseHTTPMiddleware, dispatch=passthrough)
+
+    current = build_app()
+    current.add_middleware(RequestContextMiddleware)
+
+    return {"bare": build_app(), "request_context": current, "base_http_x2": legacy}
+
+
+SCOPE = {
+    "type": "http",
+    "asgi": {"version": "3.0"},
+    "http_version": "1.1",
+    "method": "GET",
+    "scheme": "http",
+    "path": "/ping",
+    "raw_path": b"/ping",
+    "root_path": "",
+    "query_string": b"",
+    "headers": [(b"host", b"bench"), (b"x-request-id", b"bench-1")],
+    "client": ("127.0.0.1", 50000),
+    "server": ("bench", 80),
+}
+
+
+async def call(app) -> float:
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    start = time.perf_counter()
+    await app(dict(SCOPE), receive, send)
+    return time.perf_counter() - start
+
+
+async def measure(app, requests: int, warmup: int) -> list:
+    for _ in range(warmup):
+        await call(app)
+    return [await call(app) for _ in range(requests)]
+
+
+def summarize(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p50_us": round(samples[len(samples) // 2] * 1e6, 1),
+        "p99_us": round(samples[int(len(samples) * 0.99)] * 1e6, 1),
+    }
+
+
+async def run(requests: int, warmup: int) -> dict:
+    stacks = build_stacks()
+    results = {
+        name: summarize(await measure(app, requests, warmup))
+        for name, app in stacks.items()
+    }
+    bare = results["bare"]
+    for name, result in results.items():
+        if name != "bare":
+            result["overhead_mean_us"] = round(result["mean_us"] - bare["mean_us"], 1)
+            result["overhead_p99_us"] = round(result["p99_us"] - bare["p99_us"], 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=1000)
+    parser.add_argument("--json", type=Path, help="Also write the report here")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.requests, args.warmup))
+    print(json.dumps(report, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
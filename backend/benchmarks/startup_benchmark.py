@@ -0,0 +1,127 @@
+"""
+Worker cold-start benchmark.
+
+Starts fresh interpreters that import main and run the app's startup
+(lifespan) exactly as uvicorn would, and reports time to import, time until
+the worker is ready to serve and the slowest imports. The first run starts
+from an empty tracking database; later runs reuse it, as a restarted
+container would. Run from the backend directory:
+
+    python -m benchmarks.startup_benchmark --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from models.dataset_snapshots import resolve_dataset
+
+# Executed in the child interpreter; prints one JSON line with its timings
+_CHILD = """
+import asyncio, json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print("STARTUP_RESULT " + json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "ready_ms": (ready - start) * 1000,
+    "report": main.app.state.startup_report,
+}))
+"""
+
+_IMPORT_TIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def run_once(work_dir: Path) -> dict:
+    env = dict(os.environ, PYTHONPATH=str(BACKEND_DIR))
+    env.setdefault("API_KEY", "startup-benchmark")
+
+    spawned = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=work_dir,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    wall_ms = (time.perf_counter() - spawned) * 1000
+
+    result_line = next(
+        line
+        for line in completed.stdout.splitlines()
+        if line.startswith("STARTUP_RESULT ")
+    )
+    result = json.loads(result_line.split(" ", 1)[1])
+    result["process_wall_ms"] = wall_ms
+
+    # Direct imports (one level of nesting) by cumulative time, including the
+    # ones the background preload thread performs after startup
+    imports = []
+    for match in _IMPORT_TIME_LINE.finditer(completed.stderr):
+        _, cumulative_us, indent, module = match.groups()
+        if len(indent) == 3:
+            imports.append((int(cumulative_us) / 1000, module))
+    result["top_imports_ms"] = {
+        module: round(ms, 1) for ms, module in sorted(imports, reverse=True)[:10]
+    }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", type=Path, help="Also write the report to this file")
+    args = parser.parse_args()
+
+    work_dir = Path(tempfile.mkdtemp(prefix="nl_to_sql_startup_"))
+    (work_dir / "system_prompt.txt").symlink_to(BACKEND_DIR / "system_prompt.txt")
+    db_path = resolve_dataset(BACKEND_DIR / "ipl_data.db")
+    if db_path.exists():
+        (work_dir / "ipl_data.db").symlink_to(db_path.resolve())
+
+    try:
+        runs = [run_once(work_dir) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    restarts = runs[1:] or runs
+    report = {
+        "first_start": {
+            "process_wall_ms": round(runs[0]["process_wall_ms"], 1),
+            "import_ms": round(runs[0]["import_ms"], 1),
+            "ready_ms": round(runs[0]["ready_ms"], 1),
+            "steps": runs[0]["report"],
+        },
+        "restart_median": {
+            key: round(statistics.median(run[key] for run in restarts), 1)
+            for key in ("process_wall_ms", "import_ms", "ready_ms")
+        },
+        "top_imports_ms": runs[-1]["top_imports_ms"],
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
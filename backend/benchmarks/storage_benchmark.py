@@ -0,0 +1,319 @@
+# /// script
+# dependencies = [
+#   "duckdb",
+# ]
+# ///
+"""
+SQL execution micro-benchmark across storage layouts.
+
+Loads the dataset built by json_to_database.py into each layout below and runs
+the analytic queries from benchmarks/workload.py against it through DuckDB:
+
+    sqlite          SQLite file read through DuckDB's scanner
+    sqlite_indexed  SQLite file with indexes on the join and filter columns
+    memory          SQLite file copied into in-memory DuckDB (what fetch_data does today)
+    duckdb          native DuckDB database file
+    duckdb_indexed  native DuckDB file with ART indexes on the same columns
+    duckdb_preagg   native DuckDB file plus the PREAGGREGATES tables
+    parquet         one Parquet file per table, exposed as views
+    parquet_seasons export_parquet.py output: fact tables partitioned by season
+
+Every layout stores the key-encoded base tables and answers the workload
+through the name-resolving serving views from models/dataset_schema.py.
+
+Every query is run cold (fresh process, fresh connection) and warm (repeated on
+an open connection), and latency, peak memory, result rows and on-disk size are
+reported per layout as JSON. Run from the backend directory:
+
+    python json_to_database.py
+    python -m benchmarks.storage_benchmark --repeat 10 --output storage.json
+"""
+
+import argparse
+import hashlib
+import json
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.workload import PREAGGREGATES, WORKLOAD
+from export_parquet import export_dataset
+from models.dataset_schema import BASE_TABLES, create_serving_views, parquet_source
+from models.dataset_snapshots import resolve_dataset
+
+# Columns the workload joins and filters on
+INDEXES = {
+    "fact_deliveries": [
+        ["match_id", "inning", "over", "ball"],
+        ["batter_key"],
+        ["bowler_key"],
+    ],
+    "fact_wickets": [["match_id", "inning", "over", "ball"], ["bowler_key"]],
+    "match_players": [["match_id", "player_key"]],
+    "match_teams": [["match_id"]],
+    "match_info": [["season_key"]],
+}
+
+LAYOUTS = [
+    "sqlite",
+    "sqlite_indexed",
+    "memory",
+    "duckdb",
+    "duckdb_indexed",
+    "duckdb_preagg",
+    "parquet",
+    "parquet_seasons",
+]
+
+QUERIES = [item for item in WORKLOAD if not item["sql"].startswith("ERROR:")]
+
+
+def _create_index_statements():
+    for table, index_columns in INDEXES.items():
+        for columns in index_columns:
+            name = f"idx_{table}_{'_'.join(columns)}"
+            quoted = ", ".join(f'"{column}"' for column in columns)
+            yield f"CREATE INDEX {name} ON {table} ({quoted})"
+
+
+def build_layout(layout: str, source_db: Path, work_dir: Path) -> Path:
+    """Materialize the source dataset in the given layout and return its path"""
+    import duckdb
+
+    if layout.startswith("sqlite") or layout == "memory":
+        target = work_dir / f"{layout}.db"
+        shutil.copyfile(source_db, target)
+        if layout == "sqlite_indexed":
+            conn = sqlite3.connect(target)
+            for statement in _create_index_statements():
+                conn.execute(statement)
+            conn.execute("ANALYZE")
+            conn.commit()
+            conn.close()
+        return target
+
+    if layout == "parquet_seasons":
+        target = work_dir / layout
+        export_dataset(source_db, target)
+        return target
+
+    if layout == "parquet":
+        target = work_dir / "parquet"
+        target.mkdir()
+        con = duckdb.connect()
+        con.execute(f"ATTACH '{source_db}' AS src (TYPE sqlite, READ_ONLY)")
+        for table in BASE_TABLES:
+            con.execute(
+                f"COPY (SELECT * FROM src.{table}) TO '{target / table}.parquet' (FORMAT parquet)"
+            )
+        con.close()
+        return target
+
+    target = work_dir / f"{layout}.duckdb"
+    con = duckdb.connect(str(target))
+    con.execute(f"ATTACH '{source_db}' AS src (TYPE sqlite, READ_ONLY)")
+    for table in BASE_TABLES:
+        con.execute(f"CREATE TABLE {table} AS SELECT * FROM src.{table}")
+    con.execute("DETACH src")
+    create_serving_views(con)
+    if layout == "duckdb_indexed":
+        for statement in _create_index_statements():
+            con.execute(statement)
+    if layout == "duckdb_preagg":
+        for name, select in PREAGGREGATES.items():
+            con.execute(f"CREATE TABLE {name} AS {select}")
+    con.execute("CHECKPOINT")
+    con.close()
+    return target
+
+
+def open_layout(layout: str, path: Path):
+    """Open a read-only DuckDB connection exposing the layout's tables"""
+    import duckdb
+
+    if layout == "parquet":
+        con = duckdb.connect()
+        for table in BASE_TABLES:
+            con.execute(
+                f"CREATE VIEW {table} AS SELECT * FROM read_parquet('{path / table}.parquet')"
+            )
+        create_serving_views(con)
+        return con
+    if layout == "parquet_seasons":
+        con = duckdb.connect()
+        for table in BASE_TABLES:
+            con.execute(
+                f"CREATE VIEW {table} AS SELECT * FROM {parquet_source(path, table)}"
+            )
+        create_serving_views(con)
+        return con
+    if layout == "memory":
+        con = duckdb.connect()
+        con.execute(f"ATTACH '{path}' AS src (TYPE sqlite, READ_ONLY)")
+        for table in BASE_TABLES:
+            con.execute(f"CREATE TABLE {table} AS SELECT * FROM src.{table}")
+        con.execute("DETACH src")
+        create_serving_views(con)
+        return con
+    return duckdb.connect(database=str(path), read_only=True)
+
+
+def query_for(layout: str, item: dict) -> str:
+    if layout == "duckdb_preagg" and "preagg_sql" in item:
+        return item["preagg_sql"]
+    return item["sql"]
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss survives fork+exec, so a spawned worker would report the parent's
+    # high-water mark; VmHWM belongs to the new address space and starts fresh
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _checksum(rows) -> str:
+    return hashlib.sha1(repr(rows).encode()).hexdigest()[:12]
+
+
+def run_cold(layout: str, path: str, name: str) -> dict:
+    """Run one query in a fresh process: nothing cached in DuckDB or the connection"""
+    item = next(q for q in QUERIES if q["name"] == name)
+    baseline_rss = _peak_rss_kb()
+
+    start = time.perf_counter()
+    con = open_layout(layout, Path(path))
+    connected = time.perf_counter()
+    rows = con.execute(query_for(layout, item)).fetchall()
+    finished = time.perf_counter()
+    con.close()
+
+    return {
+        "connect_ms": round((connected - start) * 1000, 3),
+        "cold_ms": round((finished - start) * 1000, 3),
+        "cold_peak_rss_kb": _peak_rss_kb() - baseline_rss,
+        "rows": len(rows),
+        "checksum": _checksum(rows),
+    }
+
+
+def run_warm(layout: str, path: str, repeat: int) -> dict:
+    """Run every query repeatedly on one open connection after a warmup pass"""
+    baseline_rss = _peak_rss_kb()
+    con = open_layout(layout, Path(path))
+    results = {}
+    for item in QUERIES:
+        sql = query_for(layout, item)
+        con.execute(sql).fetchall()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            con.execute(sql).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        results[item["name"]] = {
+            "warm_min_ms": round(timings[0], 3),
+            "warm_p50_ms": round(timings[len(timings) // 2], 3),
+            "warm_p95_ms": round(
+                timings[min(len(timings) - 1, int(len(timings) * 0.95))], 3
+            ),
+        }
+    con.close()
+    return {"queries": results, "peak_rss_kb": _peak_rss_kb() - baseline_rss}
+
+
+def _disk_size(path: Path) -> int:
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    size = path.stat().st_size
+    wal = path.with_name(path.name + ".wal")
+    return size + (wal.stat().st_size if wal.exists() else 0)
+
+
+def benchmark_layout(layout: str, source_db: Path, work_dir: Path, repeat: int) -> dict:
+    build_start = time.perf_counter()
+    path = build_layout(layout, source_db, work_dir)
+    build_s = time.perf_counter() - build_start
+
+    spawn = get_context("spawn")
+    queries = {}
+    # One short-lived process per cold query so no cache survives between runs
+    with ProcessPoolExecutor(1, mp_context=spawn, max_tasks_per_child=1) as pool:
+        for item in QUERIES:
+            queries[item["name"]] = pool.submit(
+                run_cold, layout, str(path), item["name"]
+            ).result()
+    with ProcessPoolExecutor(1, mp_context=spawn) as pool:
+        warm = pool.submit(run_warm, layout, str(path), repeat).result()
+
+    for name, stats in warm["queries"].items():
+        queries[name].update(stats)
+
+    return {
+        "file_size_bytes": _disk_size(path),
+        "build_s": round(build_s, 3),
+        "warm_peak_rss_kb": warm["peak_rss_kb"],
+        "total_cold_ms": round(sum(q["cold_ms"] for q in queries.values()), 3),
+        "total_warm_p50_ms": round(sum(q["warm_p50_ms"] for q in queries.values()), 3),
+        "queries": queries,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--db", type=Path, default=resolve_dataset(BACKEND_DIR / "ipl_data.db")
+    )
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=LAYOUTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    if not args.db.exists():
+        sys.exit(
+            f"Dataset not found at {args.db}. Run `python json_to_database.py` first."
+        )
+
+    work_dir = Path(tempfile.mkdtemp(prefix="nl_to_sql_storage_"))
+    report = {"source_db": str(args.db.resolve()), "repeat": args.repeat, "layouts": {}}
+    try:
+        for layout in args.layouts:
+            print(f"Benchmarking {layout}...", file=sys.stderr)
+            report["layouts"][layout] = benchmark_layout(
+                layout, args.db.resolve(), work_dir, args.repeat
+            )
+            stats = report["layouts"][layout]
+            print(
+                f"  size={stats['file_size_bytes'] / 1e6:.1f}MB "
+                f"cold={stats['total_cold_ms']:.0f}ms "
+                f"warm_p50={stats['total_warm_p50_ms']:.0f}ms "
+                f"warm_rss={stats['warm_peak_rss_kb'] / 1024:.0f}MB",
+                file=sys.stderr,
+            )
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
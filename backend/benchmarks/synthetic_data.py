@@ -0,0 +1,612 @@
+"""
+Synthetic Cricsheet match generator.
+
+Writes T20 match JSON in the structure of the Cricsheet files in
+ipl_json.zip, for loading with json_to_database.py at many times the size of
+the real corpus. Run from the backend directory:
+
+    python -m benchmarks.synthetic_data synthetic.zip --matches 100000 --workers 4
+    python json_to_database.py synthetic.zip --db synthetic.db --rebuild --workers 4
+
+The output is a zip archive when its name ends in .zip, otherwise a
+directory of <match_id>.json files. Every match is generated from its own
+random stream seeded by --seed and the match's index, so the same arguments
+always produce the same bytes, whatever --workers is.
+
+Matches are spread over --competitions leagues (each with its own teams,
+players, venues and umpires) and --seasons seasons per league, so scaling
+up adds matches per season rather than centuries of seasons. Ball outcomes
+follow the rates of the IPL corpus per phase of the innings (powerplay,
+middle and death overs), nudged by per-player batting and bowling skill so
+that leaderboards look like real ones. Chases stop when the target is
+reached; ties are recorded as results without super overs.
+"""
+
+import argparse
+import functools
+import json
+import random
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+OVERS = 20
+BALLS_PER_OVER = 6
+# A bowler may bowl at most a fifth of the overs
+MAX_OVERS_PER_BOWLER = OVERS // 5
+# Far above the match IDs Cricsheet has issued, so synthetic and real matches
+# can be loaded into the same database
+FIRST_MATCH_ID = 90_000_000
+# Matches handed to a worker at a time
+CHUNK_SIZE = 64
+
+# Per phase (overs 1-6, 7-15, 16-20), measured on the IPL corpus: wides and
+# no-balls per delivery; wickets, byes and leg byes per legal delivery; and
+# the runs off the bat of a legal delivery that is not a wicket
+PHASE_END_OVERS = (6, 15, OVERS)
+WIDE_RATE = (0.034, 0.0268, 0.0415)
+NO_BALL_RATE = (0.004, 0.0027, 0.0074)
+WICKET_RATE = (0.0399, 0.043, 0.0842)
+BYE_RATE = (0.0018, 0.0019, 0.0052)
+LEG_BYE_RATE = (0.0174, 0.0134, 0.0186)
+BAT_RUNS = (0, 1, 2, 3, 4, 6)
+BAT_RUN_WEIGHTS = (
+    (0.4666, 0.2787, 0.0445, 0.0047, 0.1652, 0.0396),
+    (0.3075, 0.4759, 0.0702, 0.0025, 0.0952, 0.0486),
+    (0.2501, 0.4269, 0.0993, 0.0028, 0.1299, 0.0910),
+)
+WIDE_RUNS = ((1, 2, 3, 5), (0.945, 0.04, 0.007, 0.008))
+NO_BALL_BAT_RUNS = ((0, 1, 2, 4, 6), (0.43, 0.315, 0.055, 0.12, 0.08))
+BYE_RUNS = ((1, 2, 4), (0.84, 0.05, 0.11))
+WICKET_KINDS = (
+    ("caught", 0.628),
+    ("bowled", 0.171),
+    ("run out", 0.0834),
+    ("lbw", 0.0615),
+    ("caught and bowled", 0.0284),
+    ("stumped", 0.0248),
+    ("hit wicket", 0.0011),
+)
+# Share of run outs that dismiss the non-striker
+NON_STRIKER_RUN_OUT = 0.475
+FIELD_FIRST_RATE = 0.65
+NO_RESULT_RATE = 0.005
+NEUTRAL_VENUE_RATE = 0.1
+
+# Spread of player skill and of how much a match's conditions favour the
+# batters, tuned so innings totals and wickets match the IPL's (166 +- 32
+# runs and 5.9 wickets an innings)
+BATTING_SPREAD = 0.12
+BOWLING_SPREAD = 0.08
+TAIL_BATTING = 0.8
+CONDITIONS_SPREAD = 0.15
+
+# Squad makeup per team: a pool per role per 17 seasons, and how many of
+# each a season's squad and a match's playing XI take (openers first in the
+# batting order). Players have careers of a few seasons to over a decade,
+# so a league's player count grows with its seasons as the IPL's does
+ROLE_POOLS = {"batter": 25, "allrounder": 12, "bowler": 25}
+SEASON_SQUAD = {"batter": 7, "allrounder": 4, "bowler": 7}
+CAREER_SEASONS = (2, 16)
+PLAYING_XI = {"batter": 5, "allrounder": 2, "bowler": 4}
+
+SYLLABLES = (
+    "ba ra ka ma na sa ta va da la ja pa ha ga ya "
+    "dev rin sh an el or um ik as ol ur en it ay"
+).split()
+TEAM_MASCOTS = (
+    "Kings Royals Chargers Titans Warriors Riders Strikers Giants Hurricanes "
+    "Thunder Stars Capitals Tuskers Falcons Panthers Gladiators Sixers Heat"
+).split()
+VENUE_KINDS = ("Stadium", "Cricket Ground", "Oval", "Park", "Arena")
+
+
+def _word(rng, parts=(2, 3)) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.choice(parts))).title()
+
+
+def _person_id(rng) -> str:
+    """An 8 hex digit identifier like the ones in Cricsheet registries"""
+    return f"{rng.getrandbits(32):08x}"
+
+
+def _unique(make, taken: set) -> str:
+    while True:
+        value = make()
+        if value not in taken:
+            taken.add(value)
+            return value
+
+
+class Player:
+    __slots__ = ("name", "person_id", "role", "batting", "bowling", "seasons")
+
+    def __init__(self, name, person_id, role, batting, bowling, seasons):
+        self.name = name
+        self.person_id = person_id
+        self.role = role
+        # range of the seasons the player is available for
+        self.seasons = seasons
+        # Multipliers around 1: how hard to dismiss and how freely scoring,
+        # and how much a bowler's deliveries take wickets and stem runs
+        self.batting = batting
+        self.bowling = bowling
+
+
+class Team:
+    def __init__(self, name, city, venue, pools):
+        self.name = name
+        self.city = city
+        self.venue = venue
+        self.pools = pools
+
+
+class League:
+    """The teams, players, venues and officials of one competition
+
+    Built from the seed alone, so every worker process rebuilds the same one.
+    """
+
+    def __init__(self, seed: int, index: int, teams: int, seasons: int, names: set):
+        rng = random.Random(f"{seed}:league:{index}")
+        self.seasons = seasons
+        self.index = index
+        self.name = f"Synthetic T20 League {index + 1}"
+        self.teams = []
+        for _ in range(teams):
+            city = _unique(lambda: _word(rng), names)
+            venue = f"{_word(rng)} {rng.choice(VENUE_KINDS)}"
+            team_name = _unique(lambda: f"{city} {rng.choice(TEAM_MASCOTS)}", names)
+            pools = {
+                role: [
+                    self._player(rng, role, names)
+                    for _ in range(max(size * seasons // 17, SEASON_SQUAD[role]))
+                ]
+                for role, size in ROLE_POOLS.items()
+            }
+            self.teams.append(Team(team_name, city, venue, pools))
+        self.neutral_venues = [
+            (f"{_word(rng)} {rng.choice(VENUE_KINDS)}", _word(rng)) for _ in range(4)
+        ]
+        self.officials = [
+            (self._name(rng, names), _person_id(rng)) for _ in range(teams * 3)
+        ]
+        self.pairings = [
+            (home, away)
+            for home in range(teams)
+            for away in range(teams)
+            if home != away
+        ]
+
+    @staticmethod
+    def _name(rng, names: set) -> str:
+        """Initials and a surname, the way Cricsheet names players"""
+        return _unique(
+            lambda: "".join(
+                rng.choice("ABCDGHJKMNPRSTVY") for _ in range(rng.choice((1, 2)))
+            )
+            + " "
+            + _word(rng, (2, 3, 4)),
+            names,
+        )
+
+    def _player(self, rng, role: str, names: set) -> Player:
+        # Centred so that skill spreads results without shifting the averages
+        batting = rng.lognormvariate(BATTING_SPREAD**2 / 2, BATTING_SPREAD)
+        if role == "bowler":
+            batting *= TAIL_BATTING
+        bowling = rng.lognormvariate(-(BOWLING_SPREAD**2) / 2, BOWLING_SPREAD)
+        career = rng.randint(*CAREER_SEASONS)
+        debut = rng.randrange(1 - career, self.seasons)
+        return Player(
+            self._name(rng, names),
+            _person_id(rng),
+            role,
+            batting,
+            bowling,
+            range(debut, debut + career),
+        )
+
+    def squad(self, seed: int, team: int, season: int) -> dict:
+        """The players of a team's pool picked for a season, by role
+
+        Players in their career that season come first; if there are too
+        few, the ones whose careers are nearest fill the squad.
+        """
+        rng = random.Random(f"{seed}:squad:{self.index}:{team}:{season}")
+        squad = {}
+        for role, size in SEASON_SQUAD.items():
+            pool = self.teams[team].pools[role]
+            active = [player for player in pool if season in player.seasons]
+            if len(active) < size:
+                active = sorted(
+                    pool,
+                    key=lambda player: min(
+                        abs(season - player.seasons.start),
+                        abs(season - player.seasons.stop + 1),
+                    ),
+                )[:size]
+            squad[role] = rng.sample(active, size)
+        return squad
+
+    def fixture(self, seed: int, season: int, number: int):
+        """(home, away) team indexes of a season's match number"""
+        rng = random.Random(f"{seed}:fixtures:{self.index}:{season}")
+        pairings = self.pairings[:]
+        rng.shuffle(pairings)
+        return pairings[number % len(pairings)]
+
+
+@functools.lru_cache(maxsize=1)
+def build_leagues(seed: int, competitions: int, teams: int, seasons: int) -> list:
+    """Every league, built once per process"""
+    names = set()
+    return [League(seed, index, teams, seasons, names) for index in range(competitions)]
+
+
+def _playing_xi(rng, squad: dict) -> list:
+    """Batting order of a playing XI; the first batter keeps wicket"""
+    picked = {role: rng.sample(squad[role], size) for role, size in PLAYING_XI.items()}
+    return picked["batter"] + picked["allrounder"] + picked["bowler"]
+
+
+def _phase(over: int) -> int:
+    return next(i for i, end in enumerate(PHASE_END_OVERS) if over < end)
+
+
+def _bowling_plan(rng, xi: list) -> list:
+    """Bowler of each over, none more than their quota or twice in a row"""
+    bowlers = [player for player in xi if player.role != "batter"]
+    overs_left = {player.name: MAX_OVERS_PER_BOWLER for player in bowlers}
+    plan = []
+    for _ in range(OVERS):
+        choices = [
+            player
+            for player in bowlers
+            if overs_left[player.name] and (not plan or player is not plan[-1])
+        ] or [player for player in bowlers if overs_left[player.name]]
+        bowler = rng.choices(choices, [player.bowling for player in choices])[0]
+        overs_left[bowler.name] -= 1
+        plan.append(bowler)
+    return plan
+
+
+def simulate_innings(
+    rng,
+    batting_team: str,
+    batting: list,
+    fielding: list,
+    overs: int = OVERS,
+    target: int = None,
+    conditions: float = 1.0,
+):
+    """One innings as Cricsheet JSON plus its total and wickets
+
+    Stops after `overs` overs, ten wickets, or once `target` runs are
+    reached. conditions above 1 favour the batters, below 1 the bowlers.
+    """
+    plan = _bowling_plan(rng, fielding)
+    keeper = fielding[0]
+    striker, non_striker = batting[0], batting[1]
+    next_batter = 2
+    total = wickets = 0
+    played = []
+
+    for over in range(overs):
+        phase = _phase(over)
+        bowler = plan[over]
+        deliveries = []
+        legal = 0
+        while legal < BALLS_PER_OVER:
+            delivery = {
+                "batter": striker.name,
+                "bowler": bowler.name,
+                "non_striker": non_striker.name,
+            }
+            bat_runs = extra_runs = 0
+            extras = {}
+            dismissed = None
+            roll = rng.random()
+            if roll < WIDE_RATE[phase]:
+                extra_runs = rng.choices(*WIDE_RUNS)[0]
+                extras["wides"] = extra_runs
+            elif roll < WIDE_RATE[phase] + NO_BALL_RATE[phase]:
+                bat_runs = rng.choices(*NO_BALL_BAT_RUNS)[0]
+                extra_runs = 1
+                extras["noballs"] = 1
+            else:
+                legal += 1
+                edge = striker.batting * conditions / bowler.bowling
+                if rng.random() < WICKET_RATE[phase] / edge:
+                    kind = rng.choices(*zip(*WICKET_KINDS))[0]
+                    dismissed = striker
+                    if kind == "run out" and rng.random() < NON_STRIKER_RUN_OUT:
+                        dismissed = non_striker
+                    wicket = {"player_out": dismissed.name, "kind": kind}
+                    if kind in ("caught", "run out"):
+                        fielder = rng.choice([p for p in fielding if p is not bowler])
+                        wicket["fielders"] = [{"name": fielder.name}]
+                    elif kind == "stumped":
+                        wicket["fielders"] = [{"name": keeper.name}]
+                    delivery["wickets"] = [wicket]
+                else:
+                    weights = BAT_RUN_WEIGHTS[phase]
+                    bat_runs = rng.choices(
+                        BAT_RUNS,
+                        [
+                            weights[0] / edge,
+                            *weights[1:4],
+                            *(w * edge for w in weights[4:]),
+                        ],
+                    )[0]
+                    # The bye rates are per legal ball, and byes only come off dots
+                    if not bat_runs:
+                        roll = rng.random() * weights[0]
+                        if roll < BYE_RATE[phase]:
+                            extra_runs = rng.choices(*BYE_RUNS)[0]
+                            extras["byes"] = extra_runs
+                        elif roll < BYE_RATE[phase] + LEG_BYE_RATE[phase]:
+                            extra_runs = rng.choices(*BYE_RUNS)[0]
+                            extras["legbyes"] = extra_runs
+
+            delivery["runs"] = {
+                "batter": bat_runs,
+                "extras": extra_runs,
+                "total": bat_runs + extra_runs,
+            }
+            if extras:
+                delivery["extras"] = extras
+            # Cricsheet puts "wickets" after "runs" and "extras"
+            if "wickets" in delivery:
+                delivery["wickets"] = delivery.pop("wickets")
+            deliveries.append(delivery)
+            total += bat_runs + extra_runs
+
+            # Runs taken between the wickets swap ends; wides that reach the
+            # boundary (5) and byes count the same way
+            if (bat_runs + extra_runs - ("wides" in extras or "noballs" in extras)) % 2:
+                striker, non_striker = non_striker, striker
+            if dismissed is not None:
+                wickets += 1
+                if wickets == 10 or next_batter == len(batting):
+                    break
+                incoming = batting[next_batter]
+                next_batter += 1
+                if dismissed is striker:
+                    striker = incoming
+                else:
+                    non_striker = incoming
+            if target is not None and total >= target:
+                break
+
+        played.append({"over": over, "deliveries": deliveries})
+        if wickets == 10 or (target is not None and total >= target):
+            break
+        striker, non_striker = non_striker, striker
+
+    innings = {"team": batting_team, "overs": played}
+    if len(played) > 5:
+        last_ball = min(len(played[5]["deliveries"]), 9)
+        innings["powerplays"] = [
+            {"from": 0.1, "to": 5 + last_ball / 10, "type": "mandatory"}
+        ]
+    return innings, total, wickets
+
+
+def generate_match(
+    leagues: list, seed: int, index: int, per_season: int, first_season: int
+):
+    """(match_id, Cricsheet JSON dict) of the match at index"""
+    rng = random.Random(f"{seed}:match:{index}")
+    league = leagues[index % len(leagues)]
+    slot = index // len(leagues)
+    season, number = divmod(slot, per_season)
+    home, away = league.fixture(seed, season, number)
+    teams = [league.teams[home], league.teams[away]]
+    xis = [_playing_xi(rng, league.squad(seed, team, season)) for team in (home, away)]
+
+    # Seasons start in April with up to two matches a day
+    played = date(first_season + season, 4, 1) + timedelta(
+        days=number * 60 // max(per_season, 1)
+    )
+    if rng.random() < NEUTRAL_VENUE_RATE:
+        venue, city = rng.choice(league.neutral_venues)
+    else:
+        venue, city = teams[0].venue, teams[0].city
+
+    conditions = rng.lognormvariate(0, CONDITIONS_SPREAD)
+    toss_winner = rng.randrange(2)
+    decision = "field" if rng.random() < FIELD_FIRST_RATE else "bat"
+    first = toss_winner if decision == "bat" else 1 - toss_winner
+    second = 1 - first
+
+    innings = []
+    if rng.random() < NO_RESULT_RATE:
+        # Rain: the first innings is cut short and the match abandoned
+        played_overs = rng.randrange(1, OVERS)
+        inning, _, _ = simulate_innings(
+            rng,
+            teams[first].name,
+            xis[first],
+            xis[second],
+            overs=played_overs,
+            conditions=conditions,
+        )
+        innings.append(inning)
+        outcome = {"result": "no result"}
+        player_of_match = []
+    else:
+        inning, first_total, _ = simulate_innings(
+            rng, teams[first].name, xis[first], xis[second], conditions=conditions
+        )
+        innings.append(inning)
+        inning, second_total, second_wickets = simulate_innings(
+            rng,
+            teams[second].name,
+            xis[second],
+            xis[first],
+            target=first_total + 1,
+            conditions=conditions,
+        )
+        inning["target"] = {"overs": OVERS, "runs": first_total + 1}
+        innings.append(inning)
+        if second_total > first_total:
+            winner = second
+            outcome = {
+                "by": {"wickets": 10 - second_wickets},
+                "winner": teams[second].name,
+            }
+        elif second_total < first_total:
+            winner = first
+            outcome = {
+                "by": {"runs": first_total - second_total},
+                "winner": teams[first].name,
+            }
+        else:
+            winner = None
+            outcome = {"result": "tie"}
+        player_of_match = [
+            _top_scorer(innings, xis[winner if winner is not None else first])
+        ]
+
+    officials = rng.sample(league.officials, 5)
+    people = {player.name: player.person_id for xi in xis for player in xi}
+    people.update(officials)
+    match_number = number + 1
+    event = {"name": league.name, "match_number": match_number}
+    data = {
+        "meta": {
+            "data_version": "1.0.0",
+            "created": (played + timedelta(days=2)).isoformat(),
+            "revision": 1,
+        },
+        "info": {
+            "balls_per_over": BALLS_PER_OVER,
+            "city": city,
+            "dates": [played.isoformat()],
+            "event": event,
+            "gender": "male",
+            "match_type": "T20",
+            "officials": {
+                "match_referees": [officials[0][0]],
+                "reserve_umpires": [officials[1][0]],
+                "tv_umpires": [officials[2][0]],
+                "umpires": [officials[3][0], officials[4][0]],
+            },
+            "outcome": outcome,
+            "overs": OVERS,
+            "player_of_match": player_of_match,
+            "players": {
+                team.name: [player.name for player in xi]
+                for team, xi in zip(teams, xis)
+            },
+            "registry": {"people": dict(sorted(people.items()))},
+            "season": first_season + season,
+            "team_type": "club",
+            "teams": [team.name for team in teams],
+            "toss": {"decision": decision, "winner": teams[toss_winner].name},
+            "venue": venue,
+        },
+        "innings": innings,
+    }
+    if not player_of_match:
+        del data["info"]["player_of_match"]
+    return str(FIRST_MATCH_ID + index), data
+
+
+def _top_scorer(innings: list, xi: list) -> str:
+    """The player of the XI with the most runs off the bat in the match"""
+    names = {player.name for player in xi}
+    runs = {name: 0 for name in names}
+    for inning in innings:
+        for over in inning["overs"]:
+            for delivery in over["deliveries"]:
+                if delivery["batter"] in names:
+                    runs[delivery["batter"]] += delivery["runs"]["batter"]
+    return max(xi, key=lambda player: runs[player.name]).name
+
+
+def generate_chunk(task):
+    """Serialized (file name, JSON bytes) of a range of match indexes"""
+    seed, competitions, teams, seasons, per_season, first_season, start, stop = task
+    leagues = build_leagues(seed, competitions, teams, seasons)
+    files = []
+    for index in range(start, stop):
+        match_id, data = generate_match(leagues, seed, index, per_season, first_season)
+        files.append((f"{match_id}.json", json.dumps(data, indent=2).encode()))
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output", type=Path, help="Zip archive or directory to write")
+    parser.add_argument("--matches", type=int, default=11200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--competitions", type=int, default=1)
+    parser.add_argument("--seasons", type=int, default=17, help="Seasons per league")
+    parser.add_argument("--teams", type=int, default=10, help="Teams per league")
+    parser.add_argument("--first-season", type=int, default=2008)
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Processes generating matches"
+    )
+    args = parser.parse_args()
+    if args.teams < 2:
+        parser.error("--teams must be at least 2")
+
+    per_season = -(-args.matches // (args.competitions * args.seasons))
+    tasks = [
+        (
+            args.seed,
+            args.competitions,
+            args.teams,
+            args.seasons,
+            per_season,
+            args.first_season,
+            start,
+            min(start + CHUNK_SIZE, args.matches),
+        )
+        for start in range(0, args.matches, CHUNK_SIZE)
+    ]
+
+    start = time.perf_counter()
+    written = 0
+    executor = ProcessPoolExecutor(args.workers) if args.workers > 1 else None
+    archive = None
+    try:
+        if args.output.suffix == ".zip":
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            archive = zipfile.ZipFile(args.output, "w", zipfile.ZIP_DEFLATED)
+        else:
+            args.output.mkdir(parents=True, exist_ok=True)
+        # Chunks come back in task order, so the output never depends on timing
+        chunks = (
+            executor.map(generate_chunk, tasks)
+            if executor
+            else map(generate_chunk, tasks)
+        )
+        for files in chunks:
+            for name, content in files:
+                if archive is not None:
+                    # A fixed timestamp keeps the archive byte-for-byte repeatable
+                    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+                    archive.writestr(info, content, zipfile.ZIP_DEFLATED)
+                else:
+                    (args.output / name).write_bytes(content)
+                written += len(content)
+    finally:
+        if archive is not None:
+            archive.close()
+        if executor:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(
+        f"✅ Done! {args.matches} matches ({written / 2**20:.0f} MiB of JSON) "
+        f"written to {args.output} in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
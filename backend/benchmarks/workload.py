@@ -0,0 +1,227 @@
+"""
+Fixed benchmark workload: realistic IPL questions paired with the SQL the LLM
+is expected to produce for them. The SQL follows the patterns taught in
+system_prompt.txt so timings reflect the shape of real traffic.
+
+Entries with a ``preagg_sql`` have an equivalent query over the PREAGGREGATES
+tables, used by storage layouts that materialize them.
+"""
+
+# Pre-aggregated tables built by storage layouts that opt into them
+PREAGGREGATES = {
+    "batter_season_stats": (
+        "SELECT m.season, d.batter, SUM(d.runs_batter) AS runs, COUNT(*) AS balls, "
+        "SUM(CASE WHEN d.runs_batter = 6 THEN 1 ELSE 0 END) AS sixes "
+        "FROM deliveries d JOIN matches m ON d.match_id = m.match_id "
+        "GROUP BY m.season, d.batter"
+    ),
+    "innings_over_runs": (
+        "SELECT f.match_id, f.inning, f.over, f.phase, f.batting_team, "
+        "SUM(f.runs_total) AS runs, COUNT(*) AS balls FROM delivery_facts f "
+        "GROUP BY f.match_id, f.inning, f.over, f.phase, f.batting_team"
+    ),
+}
+
+WORKLOAD = [
+    {
+        "name": "top_teams_by_wins",
+        "question": "Top three teams with number of matches won and total matches played",
+        "sql": (
+            "SELECT t.team_name, COUNT(DISTINCT CASE WHEN m.match_winner = t.team_name "
+            "THEN m.match_id END) AS matches_won, COUNT(DISTINCT t.match_id) AS matches_played "
+            "FROM teams t LEFT JOIN matches m ON t.match_id = m.match_id "
+            "GROUP BY t.team_name ORDER BY matches_won DESC LIMIT 3;"
+        ),
+    },
+    {
+        "name": "player_total_runs",
+        "question": "Total runs scored by Virat Kohli",
+        "sql": "SELECT SUM(d.runs_batter) AS total_runs FROM deliveries d WHERE d.batter = 'V Kohli';",
+        "preagg_sql": (
+            "SELECT SUM(b.runs) AS total_runs FROM batter_season_stats b WHERE b.batter = 'V Kohli';"
+        ),
+    },
+    {
+        "name": "big_wins_batting_first",
+        "question": "Matches where the team batting first won by more than 50 runs",
+        "sql": (
+            "SELECT m.match_id, m.date, m.match_winner, m.win_by_runs FROM matches m "
+            "WHERE m.win_by_runs > 50 ORDER BY m.win_by_runs DESC;"
+        ),
+    },
+    {
+        "name": "season_wins",
+        "question": "Teams with most wins in 2022 season",
+        "sql": (
+            "SELECT m.match_winner AS team_name, COUNT(*) AS wins FROM matches m "
+            "WHERE m.season = '2022' GROUP BY m.match_winner ORDER BY wins DESC;"
+        ),
+    },
+    {
+        "name": "best_bowling_figures",
+        "question": "Best bowling figures in a single match",
+        "sql": (
+            "WITH BowlingFigures AS (SELECT w.match_id, d.bowler, COUNT(w.player_out) AS wickets, "
+            "SUM(d.runs_total) AS runs_conceded FROM wickets w JOIN deliveries d "
+            "ON w.match_id = d.match_id AND w.inning = d.inning AND w.over = d.over AND w.ball = d.ball "
+            "WHERE w.kind != 'run out' GROUP BY w.match_id, d.bowler) "
+            "SELECT bf.match_id, m.date, bf.bowler, bf.wickets, bf.runs_conceded FROM BowlingFigures bf "
+            "JOIN matches m ON bf.match_id = m.match_id "
+            "ORDER BY bf.wickets DESC, bf.runs_conceded ASC LIMIT 1;"
+        ),
+    },
+    {
+        "name": "powerplay_runs_by_batting_team",
+        "question": "Which team has scored the most runs in the powerplay?",
+        "sql": (
+            "SELECT f.batting_team, SUM(f.runs_total) AS powerplay_runs FROM delivery_facts f "
+            "WHERE f.phase = 'powerplay' GROUP BY f.batting_team ORDER BY powerplay_runs DESC LIMIT 1;"
+        ),
+        "preagg_sql": (
+            "SELECT o.batting_team, SUM(o.runs) AS powerplay_runs FROM innings_over_runs o "
+            "WHERE o.phase = 'powerplay' GROUP BY o.batting_team ORDER BY powerplay_runs DESC LIMIT 1;"
+        ),
+    },
+    {
+        "name": "first_innings_batting_team",
+        "question": "How many times has each team batted first?",
+        "sql": (
+            "SELECT f.batting_team, COUNT(DISTINCT f.match_id) AS times_batted_first "
+            "FROM delivery_facts f WHERE f.inning = 1 GROUP BY f.batting_team "
+            "ORDER BY times_batted_first DESC;"
+        ),
+        "preagg_sql": (
+            "SELECT o.batting_team, COUNT(DISTINCT o.match_id) AS times_batted_first "
+            "FROM innings_over_runs o WHERE o.inning = 1 GROUP BY o.batting_team "
+            "ORDER BY times_batted_first DESC;"
+        ),
+    },
+    {
+        "name": "season_run_leaderboard",
+        "question": "Top 5 run scorers in the 2016 season",
+        "sql": (
+            "SELECT d.batter, SUM(d.runs_batter) AS total_runs FROM deliveries d "
+            "JOIN matches m ON d.match_id = m.match_id WHERE m.season = '2016' "
+            "GROUP BY d.batter ORDER BY total_runs DESC LIMIT 5;"
+        ),
+        "preagg_sql": (
+            "SELECT b.batter, b.runs AS total_runs FROM batter_season_stats b "
+            "WHERE b.season = '2016' ORDER BY total_runs DESC LIMIT 5;"
+        ),
+    },
+    {
+        "name": "all_season_leaders",
+        "question": "Who was the highest run scorer in every season?",
+        "sql": (
+            "WITH season_runs AS (SELECT m.season, d.batter, SUM(d.runs_batter) AS total_runs "
+            "FROM deliveries d JOIN matches m ON d.match_id = m.match_id GROUP BY m.season, d.batter), "
+            "ranked AS (SELECT season, batter, total_runs, ROW_NUMBER() OVER "
+            "(PARTITION BY season ORDER BY total_runs DESC) AS rn FROM season_runs) "
+            "SELECT season, batter, total_runs FROM ranked WHERE rn = 1 ORDER BY season;"
+        ),
+        "preagg_sql": (
+            "WITH ranked AS (SELECT season, batter, runs AS total_runs, ROW_NUMBER() OVER "
+            "(PARTITION BY season ORDER BY runs DESC) AS rn FROM batter_season_stats) "
+            "SELECT season, batter, total_runs FROM ranked WHERE rn = 1 ORDER BY season;"
+        ),
+    },
+    {
+        "name": "per_over_run_rate",
+        "question": "Average runs scored in each over of an innings",
+        "sql": (
+            "SELECT d.over, ROUND(SUM(d.runs_total) * 1.0 / COUNT(DISTINCT d.match_id || '-' || d.inning), 2) "
+            "AS avg_runs FROM deliveries d GROUP BY d.over ORDER BY d.over;"
+        ),
+        "preagg_sql": (
+            "SELECT o.over, ROUND(SUM(o.runs) * 1.0 / COUNT(DISTINCT o.match_id || '-' || o.inning), 2) "
+            "AS avg_runs FROM innings_over_runs o GROUP BY o.over ORDER BY o.over;"
+        ),
+    },
+    {
+        "name": "top_wicket_takers",
+        "question": "Top 10 wicket takers of all time",
+        "sql": (
+            "SELECT w.bowler, COUNT(*) AS wickets FROM wickets w "
+            "WHERE w.kind NOT IN ('run out', 'retired hurt', 'obstructing the field') "
+            "GROUP BY w.bowler ORDER BY wickets DESC LIMIT 10;"
+        ),
+    },
+    {
+        "name": "highest_individual_score",
+        "question": "What is the highest individual score in a match?",
+        "sql": (
+            "SELECT d.match_id, d.batter, SUM(d.runs_batter) AS runs FROM deliveries d "
+            "GROUP BY d.match_id, d.batter ORDER BY runs DESC LIMIT 1;"
+        ),
+    },
+    {
+        "name": "player_strike_rate",
+        "question": "What is the strike rate of MS Dhoni?",
+        "sql": (
+            "SELECT d.batter, ROUND(SUM(d.runs_batter) * 100.0 / COUNT(*), 2) AS strike_rate "
+            "FROM deliveries d WHERE d.batter = 'MS Dhoni' "
+            "AND d.wides = 0 GROUP BY d.batter;"
+        ),
+    },
+    {
+        "name": "death_over_economy",
+        "question": "Economy rate of Jasprit Bumrah in death overs",
+        "sql": (
+            "SELECT d.bowler, ROUND(SUM(d.runs_total) * 6.0 / SUM(d.is_legal_delivery), 2) AS economy_rate "
+            "FROM deliveries d WHERE d.bowler = 'JJ Bumrah' AND d.over >= 15 GROUP BY d.bowler;"
+        ),
+    },
+    {
+        "name": "venue_death_over_run_rate",
+        "question": "Which venues have the highest run rate in the death overs?",
+        "sql": (
+            "SELECT f.venue, ROUND(SUM(f.runs_total) * 6.0 / COUNT(*), 2) AS run_rate "
+            "FROM delivery_facts f WHERE f.phase = 'death' GROUP BY f.venue "
+            "ORDER BY run_rate DESC LIMIT 5;"
+        ),
+    },
+    {
+        "name": "season_sixes",
+        "question": "Who hit the most sixes in the 2019 season?",
+        "sql": (
+            "SELECT d.batter, COUNT(*) AS sixes FROM deliveries d "
+            "JOIN matches m ON d.match_id = m.match_id "
+            "WHERE m.season = '2019' AND d.runs_batter = 6 "
+            "GROUP BY d.batter ORDER BY sixes DESC LIMIT 1;"
+        ),
+        "preagg_sql": (
+            "SELECT b.batter, b.sixes FROM batter_season_stats b "
+            "WHERE b.season = '2019' ORDER BY b.sixes DESC LIMIT 1;"
+        ),
+    },
+    {
+        "name": "season_death_overs_by_team",
+        "question": "Which team scored the most death over runs in the 2023 season?",
+        "sql": (
+            "SELECT batting_team, SUM(runs_total) AS runs FROM delivery_facts "
+            "WHERE season = '2023' AND phase = 'death' "
+            "GROUP BY batting_team ORDER BY runs DESC LIMIT 1;"
+        ),
+    },
+    {
+        "name": "player_of_match_awards",
+        "question": "Which players have won the most player of the match awards?",
+        "sql": (
+            "SELECT m.player_of_match, COUNT(*) AS awards FROM matches m "
+            "GROUP BY m.player_of_match ORDER BY awards DESC LIMIT 5;"
+        ),
+    },
+    {
+        "name": "busiest_venues",
+        "question": "Which venues have hosted the most matches?",
+        "sql": (
+            "SELECT m.venue, COUNT(*) AS matches_hosted FROM matches m "
+            "GROUP BY m.venue ORDER BY matches_hosted DESC LIMIT 5;"
+        ),
+    },
+    {
+        "name": "out_of_domain",
+        "question": "What will the weather be like in Mumbai tomorrow?",
+        "sql": "ERROR: Please ask a question related to IPL cricket data.",
+    },
+]
@@ -0,0 +1,171 @@
+# /// script
+# dependencies = [
+#    "duckdb",
+# ]
+# ///
+"""
+Export the dataset built by json_to_database.py to season-partitioned Parquet.
+
+The fact tables are written as one hive-style directory per season_key,
+sorted by match and ball, so DuckDB skips the partitions (and row groups) a
+season-filtered query cannot match. The small dimension and match tables are
+one file each. manifest.json records per-partition row counts, match_id
+ranges and sizes, and is written last: the query engine treats it as the
+dataset version. Serve the export with DATA_LAYOUT=parquet.
+
+    python export_parquet.py                   # export every season
+    python export_parquet.py --seasons 2025    # rewrite only the 2025 partitions
+"""
+
+import argparse
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from models.dataset_snapshots import resolve_dataset
+from models.dataset_schema import (
+    BASE_TABLES,
+    PARQUET_MANIFEST,
+    PARTITION_COLUMN,
+    PARTITIONED_TABLES,
+)
+
+DB_NAME = "ipl_data.db"
+PARQUET_DIR = "ipl_parquet"
+
+FACT_ORDER = 'match_id, inning, "over", ball'
+
+
+def _copy(con, select: str, target: Path):
+    """Write select to target as Parquet, replacing any existing file atomically"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp = target.with_name(target.name + ".tmp")
+    con.execute(f"COPY ({select}) TO '{tmp}' (FORMAT parquet, COMPRESSION zstd)")
+    os.replace(tmp, target)
+
+
+def _check_keys_unchanged(con, output_dir: Path):
+    """Partitions kept from an earlier export are only valid if no key was reassigned"""
+    for table in BASE_TABLES:
+        if not table.startswith("dim_"):
+            continue
+        previous = output_dir / f"{table}.parquet"
+        changed = con.execute(
+            f"""
+            SELECT COUNT(*) FROM (
+                SELECT * FROM read_parquet('{previous}')
+                EXCEPT SELECT * FROM src.{table}
+            )
+            """
+        ).fetchone()[0]
+        if changed:
+            raise ValueError(
+                f"{table} keys changed since the last export; run a full export"
+            )
+
+
+def export_dataset(db_path, output_dir, seasons=None) -> dict:
+    """Export db_path to output_dir and return the manifest
+
+    With seasons, only those seasons' partitions are rewritten and the rest of
+    a previous export is kept.
+    """
+    import duckdb
+
+    output_dir = Path(output_dir)
+    manifest_path = output_dir / PARQUET_MANIFEST
+    con = duckdb.connect()
+    con.execute(f"ATTACH '{db_path}' AS src (TYPE sqlite, READ_ONLY)")
+    season_keys = dict(
+        con.execute("SELECT season, season_key FROM src.dim_season").fetchall()
+    )
+
+    if seasons:
+        unknown = sorted(set(seasons) - set(season_keys))
+        if unknown:
+            raise ValueError(f"Seasons not in the dataset: {', '.join(unknown)}")
+        if not manifest_path.exists():
+            raise ValueError(f"No previous export in {output_dir}; run a full export")
+        _check_keys_unchanged(con, output_dir)
+        manifest = json.loads(manifest_path.read_text())
+        selected = {season_keys[season] for season in seasons}
+    else:
+        manifest = {"tables": {}}
+        selected = set(season_keys.values())
+
+    for table in BASE_TABLES:
+        if table in PARTITIONED_TABLES:
+            continue
+        target = output_dir / f"{table}.parquet"
+        _copy(con, f"SELECT * FROM src.{table}", target)
+        rows = con.execute(f"SELECT COUNT(*) FROM src.{table}").fetchone()[0]
+        manifest["tables"][table] = {"rows": rows, "bytes": target.stat().st_size}
+
+    for table in PARTITIONED_TABLES:
+        partitions = manifest["tables"].get(table, {}).get("partitions", {})
+        for season, key in sorted(season_keys.items(), key=lambda item: item[1]):
+            if key not in selected:
+                continue
+            target = output_dir / table / f"{PARTITION_COLUMN}={key}" / "data.parquet"
+            # The key comes from the directory name, not the file
+            _copy(
+                con,
+                f"SELECT * EXCLUDE ({PARTITION_COLUMN}) FROM src.{table} "
+                f"WHERE {PARTITION_COLUMN} = {key} ORDER BY {FACT_ORDER}",
+                target,
+            )
+            rows, min_match_id, max_match_id = con.execute(
+                f"SELECT COUNT(*), MIN(match_id), MAX(match_id) FROM read_parquet('{target}')"
+            ).fetchone()
+            partitions[str(key)] = {
+                "season": season,
+                "rows": rows,
+                "min_match_id": min_match_id,
+                "max_match_id": max_match_id,
+                "bytes": target.stat().st_size,
+            }
+
+        if not seasons:
+            # Drop partitions of seasons that are no longer in the dataset
+            current = {f"{PARTITION_COLUMN}={key}" for key in season_keys.values()}
+            for directory in (output_dir / table).iterdir():
+                if directory.name not in current:
+                    shutil.rmtree(directory)
+
+        manifest["tables"][table] = {
+            "partitioned_by": PARTITION_COLUMN,
+            "partitions": partitions,
+        }
+    con.close()
+
+    manifest["source"] = str(Path(db_path).resolve())
+    manifest["exported_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default=str(resolve_dataset(DB_NAME)))
+    parser.add_argument("--output", default=PARQUET_DIR)
+    parser.add_argument(
+        "--seasons", nargs="+", help="Rewrite only these seasons' partitions"
+    )
+    args = parser.parse_args()
+
+    try:
+        manifest = export_dataset(args.db, args.output, args.seasons)
+    except ValueError as e:
+        parser.error(str(e))
+    for table in PARTITIONED_TABLES:
+        partitions = manifest["tables"][table]["partitions"]
+        rows = sum(stats["rows"] for stats in partitions.values())
+        print(f"{table}: {rows} rows in {len(partitions)} season partitions")
+    print("✅ Done! Dataset exported to", args.output)
+
+
+if __name__ == "__main__":
+    main()
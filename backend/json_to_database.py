@@ -1,37 +1,105 @@
-import os
+"""
+Load Cricsheet match JSON into a new snapshot of the IPL dataset.
+
+Sources are zip archives or directories of match files. Zip members are
+decoded straight from the compressed stream, so nothing is extracted to disk.
+Matches already in the database are skipped, so new archives or directories
+of new files can be loaded incrementally:
+
+    python json_to_database.py                          # ipl_json.zip
+    python json_to_database.py new_matches.zip more/    # add new matches
+    python json_to_database.py --rebuild --workers 4    # start from scratch
+
+Each run writes a new immutable snapshot under datasets/ (see
+models/dataset_snapshots.py), starting from a copy of the current one unless
+--rebuild is given, and publishes it only once the load has finished, so a
+running server switches to it without ever reading a half-written file.
+Older snapshots beyond --keep are deleted. --db loads into a plain SQLite
+file in place instead.
+
+player_over_stats, which the /players/ endpoints serve, is recomputed from
+the fact tables at the end of every load.
+"""
+
+import argparse
 import json
+import os
 import sqlite3
 import zipfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from models.dataset_schema import BASE_TABLES, DERIVED_TABLES, create_serving_views
+from models import dataset_snapshots
 
 # === CONFIG ===
 ZIP_PATH = "ipl_json.zip"
-EXTRACT_DIR = "ipl_json"
-DB_NAME = "ipl_data.db"
+# Match files handed to a worker at a time
+CHUNK_SIZE = 64
+
+
+EXTRAS_KINDS = ["wides", "noballs", "byes", "legbyes", "penalty"]
+
 
-# === UNZIP ===
-with zipfile.ZipFile(ZIP_PATH, "r") as zip_ref:
-    zip_ref.extractall(EXTRACT_DIR)
+def extras_columns(extras):
+    """Typed extras columns plus is_legal_delivery (not a wide or no-ball)"""
+    values = [int(extras.get(kind, 0)) for kind in EXTRAS_KINDS]
+    is_legal_delivery = int(not extras.get("wides") and not extras.get("noballs"))
+    return values + [is_legal_delivery]
 
-# === INIT DB ===
-conn = sqlite3.connect(DB_NAME)
-cursor = conn.cursor()
 
-# === SCHEMA CREATION ===
-cursor.executescript(
+class Dimension:
+    """Assigns a compact integer key to each distinct value of a dimension
+
+    Keys already stored in the database are kept, so an incremental load only
+    appends the values it has not seen before.
     """
-DROP TABLE IF EXISTS matches;
-DROP TABLE IF EXISTS teams;
-DROP TABLE IF EXISTS players;
-DROP TABLE IF EXISTS deliveries;
-DROP TABLE IF EXISTS wickets;
-DROP TABLE IF EXISTS officials;
-
-CREATE TABLE matches (
+
+    def __init__(self, rows=()):
+        self.keys = {tuple(value): key for key, *value in rows}
+        self.next_key = max(self.keys.values(), default=0) + 1
+        self.new_rows = []
+
+    def key(self, *value):
+        key = self.keys.get(value)
+        if key is not None or all(part is None for part in value):
+            return key
+        key = self.keys[value] = self.next_key
+        self.new_rows.append((key, *value))
+        self.next_key += 1
+        return key
+
+
+# === SCHEMA ===
+# Players, teams, venues and seasons are stored once in dim_* tables and
+# referenced by integer key; the views from models/dataset_schema.py resolve
+# the keys back to the name-based tables the system prompt describes
+SCHEMA = """
+CREATE TABLE dim_player (
+    player_key INTEGER PRIMARY KEY,
+    player_id TEXT,
+    player_name TEXT
+);
+
+CREATE TABLE dim_team (
+    team_key INTEGER PRIMARY KEY,
+    team_name TEXT
+);
+
+CREATE TABLE dim_venue (
+    venue_key INTEGER PRIMARY KEY,
+    venue TEXT,
+    city TEXT
+);
+
+CREATE TABLE dim_season (
+    season_key INTEGER PRIMARY KEY,
+    season TEXT
+);
+
+CREATE TABLE match_info (
     match_id TEXT PRIMARY KEY,
     date TEXT,
-    city TEXT,
-    venue TEXT,
+    venue_key INTEGER,
     match_number INTEGER,
     teams_name TEXT,
     overs INTEGER,
@@ -40,79 +108,177 @@ CREATE TABLE matches (
     team_type TEXT,
     gender TEXT,
     match_type TEXT,
-    season TEXT,
-    toss_winner TEXT,
+    season_key INTEGER,
+    toss_winner_key INTEGER,
     toss_decision TEXT,
-    match_winner TEXT,
+    match_winner_key INTEGER,
     player_of_match TEXT,
     win_by_runs INTEGER
 );
 
-CREATE TABLE teams (
+CREATE TABLE match_teams (
     match_id TEXT,
-    team_name TEXT
+    team_key INTEGER
 );
 
-CREATE TABLE players (
+CREATE TABLE match_players (
     match_id TEXT,
-    team_name TEXT,
-    player_id TEXT,
-    player_name TEXT
+    team_key INTEGER,
+    player_key INTEGER
+);
+
+CREATE TABLE officials (
+    match_id TEXT,
+    role TEXT,
+    name TEXT
 );
 
-CREATE TABLE deliveries (
+-- One row per delivery; the deliveries and delivery_facts views are both
+-- built on it. Only the first dismissal is kept here, fact_wickets has all.
+-- The fact tables carry season_key so exports can partition them by season
+CREATE TABLE fact_deliveries (
     match_id TEXT,
+    season_key INTEGER,
     inning INTEGER,
     over INTEGER,
     ball INTEGER,
-    batter TEXT,
-    bowler TEXT,
-    non_striker TEXT,
+    super_over INTEGER,
+    batting_team_key INTEGER,
+    bowling_team_key INTEGER,
+    batter_key INTEGER,
+    bowler_key INTEGER,
+    non_striker_key INTEGER,
     runs_batter INTEGER,
     runs_total INTEGER,
-    extras TEXT
+    wides INTEGER,
+    noballs INTEGER,
+    byes INTEGER,
+    legbyes INTEGER,
+    penalty INTEGER,
+    is_legal_delivery INTEGER,
+    player_out_key INTEGER,
+    wicket_kind TEXT
 );
 
-CREATE TABLE wickets (
+CREATE TABLE fact_wickets (
     match_id TEXT,
+    season_key INTEGER,
     inning INTEGER,
     over INTEGER,
     ball INTEGER,
-    player_out TEXT,
-    bowler TEXT,
+    player_out_key INTEGER,
+    bowler_key INTEGER,
     kind TEXT
 );
+"""
 
-CREATE TABLE officials (
-    match_id TEXT,
-    role TEXT,
-    name TEXT
+# Per player and 0-based over, for the player charts served by
+# routes/player_routes.py. Keyed by registry id, which stays the same when a
+# player appears under more than one name; player_name is the latest one
+PLAYER_OVER_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS player_over_stats (
+    player_id TEXT,
+    player_name TEXT,
+    over INTEGER,
+    innings_batted INTEGER,
+    min_runs INTEGER,
+    max_runs INTEGER,
+    avg_runs REAL,
+    wickets INTEGER,
+    PRIMARY KEY (player_id, over)
 );
 """
+
+# Runs are what a batter scored in one over of one innings; wickets only
+# count dismissals credited to the bowler. Super overs are left out
+PLAYER_OVER_STATS = """
+WITH players AS (
+    SELECT player_key, player_id,
+        FIRST_VALUE(player_name) OVER (
+            PARTITION BY player_id ORDER BY player_key DESC
+        ) AS player_name
+    FROM dim_player
+),
+batting AS (
+    SELECT player_id, player_name, over, COUNT(*) AS innings_batted,
+        MIN(runs) AS min_runs, MAX(runs) AS max_runs, AVG(runs) AS avg_runs
+    FROM (
+        SELECT p.player_id, p.player_name, f.match_id, f.inning, f.over,
+            SUM(f.runs_batter) AS runs
+        FROM fact_deliveries f
+        JOIN players p ON p.player_key = f.batter_key
+        WHERE f.super_over = 0
+        GROUP BY p.player_id, p.player_name, f.match_id, f.inning, f.over
+    )
+    GROUP BY player_id, player_name, over
+),
+bowling AS (
+    SELECT p.player_id, p.player_name, w.over, COUNT(*) AS wickets
+    FROM fact_wickets w
+    JOIN players p ON p.player_key = w.bowler_key
+    WHERE w.kind NOT IN ('run out', 'retired hurt', 'retired out', 'obstructing the field')
+        AND (w.match_id, w.inning) NOT IN (
+            SELECT match_id, inning FROM fact_deliveries WHERE super_over = 1
+        )
+    GROUP BY p.player_id, p.player_name, w.over
 )
-conn.commit()
+SELECT player_id, player_name, over, MAX(innings_batted), MAX(min_runs),
+    MAX(max_runs), MAX(avg_runs), COALESCE(MAX(wickets), 0)
+FROM (
+    SELECT player_id, player_name, over, innings_batted, min_runs, max_runs,
+        avg_runs, NULL AS wickets
+    FROM batting
+    UNION ALL
+    SELECT player_id, player_name, over, NULL, NULL, NULL, NULL, wickets
+    FROM bowling
+)
+GROUP BY player_id, player_name, over
+"""
+
+
+# === SOURCES ===
+def list_matches(source):
+    """Sorted match file names in a zip archive or directory"""
+    source = Path(source)
+    if source.is_dir():
+        return sorted(file.name for file in source.glob("*.json"))
+    with zipfile.ZipFile(source) as archive:
+        return sorted(name for name in archive.namelist() if name.endswith(".json"))
+
+
+def read_matches(source, names):
+    """Yield (match_id, data) for the named files of one source"""
+    source = Path(source)
+    if source.is_dir():
+        for name in names:
+            with open(source / name) as f:
+                yield Path(name).stem, json.load(f)
+        return
+    with zipfile.ZipFile(source) as archive:
+        for name in names:
+            with archive.open(name) as f:
+                yield Path(name).stem, json.load(f)
+
 
-# === PROCESS EACH FILE ===
-for file in Path(EXTRACT_DIR).glob("*.json"):
-    with open(file) as f:
-        data = json.load(f)
+# === PARSING ===
+def parse_match(match_id, data):
+    """Rows of one match with players, teams, venue and season still as names
 
-    match_id = file.stem
+    Players are (registry id, name) pairs; the loader turns names into keys.
+    """
     info = data["info"]
     registry = info.get("registry", {}).get("people", {})
     outcome = info.get("outcome", {})
     event = info.get("event", {})
 
-    # Insert match record
-    cursor.execute(
-        """
-        INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """,
-        (
-            match_id,
-            info["dates"][0],
-            info.get("city"),
-            info["venue"],
+    def player(name):
+        return (registry.get(name), name) if name else None
+
+    match = {
+        "match_id": match_id,
+        "date": info["dates"][0],
+        "venue": (info["venue"], info.get("city")),
+        "details": (
             event.get("match_number"),
             json.dumps([info["teams"][0], info["teams"][1]]),
             info.get("overs"),
@@ -121,83 +287,316 @@ for file in Path(EXTRACT_DIR).glob("*.json"):
             info.get("team_type"),
             info["gender"],
             info["match_type"],
-            info["season"],
-            info["toss"]["winner"],
-            info["toss"]["decision"],
-            outcome.get("winner"),
-            ",".join(info.get("player_of_match", [])),
-            outcome.get("by", {}).get("runs"),
         ),
-    )
+        # Some files give the season as a number, others as a string
+        "season": str(info["season"]),
+        "toss_winner": info["toss"]["winner"],
+        "toss_decision": info["toss"]["decision"],
+        "match_winner": outcome.get("winner"),
+        "player_of_match": ",".join(info.get("player_of_match", [])),
+        "win_by_runs": outcome.get("by", {}).get("runs"),
+        "teams": info["teams"],
+        "players": [
+            (team, player(name))
+            for team, names in info["players"].items()
+            for name in names
+        ],
+        "officials": [
+            (role, name)
+            for role, names in info.get("officials", {}).items()
+            for name in names
+        ],
+        "deliveries": [],
+        "wickets": [],
+    }
 
-    # Teams
-    for team in info["teams"]:
-        cursor.execute("INSERT INTO teams VALUES (?, ?)", (match_id, team))
-
-    # Players
-    for team, players in info["players"].items():
-        for player in players:
-            player_id = registry.get(player)
-            cursor.execute(
-                "INSERT INTO players VALUES (?, ?, ?, ?)",
-                (match_id, team, player_id, player),
-            )
-
-    # Officials
-    for role, names in info.get("officials", {}).items():
-        for name in names:
-            cursor.execute(
-                "INSERT INTO officials VALUES (?, ?, ?)", (match_id, role, name)
-            )
-
-    # Deliveries + Wickets
     for inning_index, inning in enumerate(data.get("innings", []), 1):
         team = inning["team"]
+        bowling_team = next((t for t in info["teams"] if t != team), None)
+        super_over = int(inning.get("super_over", False))
         for over in inning["overs"]:
             over_num = over["over"]
             for ball_index, delivery in enumerate(over["deliveries"]):
-                batter = delivery["batter"]
-                bowler = delivery["bowler"]
-                non_striker = delivery["non_striker"]
+                position = (inning_index, over_num, ball_index + 1)
+                bowler = player(delivery["bowler"])
                 runs = delivery["runs"]
-                extras = json.dumps(delivery.get("extras", {}))
-                cursor.execute(
-                    """
-                    INSERT INTO deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
+                # Only the first dismissal is kept on the fact row
+                first_wicket = delivery.get("wickets", [{}])[0]
+                match["deliveries"].append(
                     (
-                        match_id,
-                        inning_index,
-                        over_num,
-                        ball_index + 1,
-                        batter,
+                        position,
+                        super_over,
+                        team,
+                        bowling_team,
+                        player(delivery["batter"]),
                         bowler,
-                        non_striker,
-                        runs["batter"],
-                        runs["total"],
-                        extras,
-                    ),
+                        player(delivery["non_striker"]),
+                        (runs["batter"], runs["total"]),
+                        extras_columns(delivery.get("extras", {})),
+                        player(first_wicket.get("player_out")),
+                        first_wicket.get("kind"),
+                    )
+                )
+                for wicket in delivery.get("wickets", []):
+                    match["wickets"].append(
+                        (position, player(wicket["player_out"]), bowler, wicket["kind"])
+                    )
+    return match
+
+
+def parse_chunk(task):
+    """Read and parse a chunk of match files; runs in a worker process"""
+    source, names = task
+    return [
+        parse_match(match_id, data) for match_id, data in read_matches(source, names)
+    ]
+
+
+# === LOADING ===
+class Loader:
+    """Assigns dimension keys to parsed matches and inserts their rows"""
+
+    def __init__(self, conn):
+        self.cursor = conn.cursor()
+        self.dimensions = {
+            table: Dimension(self.cursor.execute(f"SELECT * FROM {table}").fetchall())
+            for table in ("dim_player", "dim_team", "dim_venue", "dim_season")
+        }
+        self.players = self.dimensions["dim_player"]
+        self.teams = self.dimensions["dim_team"]
+        self.match_ids = {
+            match_id
+            for (match_id,) in self.cursor.execute("SELECT match_id FROM match_info")
+        }
+        self.loaded = 0
+
+    def player_key(self, player):
+        return self.players.key(*player) if player else None
+
+    def insert(self, match):
+        match_id = match["match_id"]
+        season_key = self.dimensions["dim_season"].key(match["season"])
+        self.cursor.execute(
+            """
+            INSERT INTO match_info VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                match_id,
+                match["date"],
+                self.dimensions["dim_venue"].key(*match["venue"]),
+                *match["details"],
+                season_key,
+                self.teams.key(match["toss_winner"]),
+                match["toss_decision"],
+                self.teams.key(match["match_winner"]),
+                match["player_of_match"],
+                match["win_by_runs"],
+            ),
+        )
+        self.cursor.executemany(
+            "INSERT INTO match_teams VALUES (?, ?)",
+            [(match_id, self.teams.key(team)) for team in match["teams"]],
+        )
+        self.cursor.executemany(
+            "INSERT INTO match_players VALUES (?, ?, ?)",
+            [
+                (match_id, self.teams.key(team), self.player_key(player))
+                for team, player in match["players"]
+            ],
+        )
+        self.cursor.executemany(
+            "INSERT INTO officials VALUES (?, ?, ?)",
+            [(match_id, role, name) for role, name in match["officials"]],
+        )
+        self.cursor.executemany(
+            """
+            INSERT INTO fact_deliveries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            [
+                (
+                    match_id,
+                    season_key,
+                    *position,
+                    super_over,
+                    self.teams.key(team),
+                    self.teams.key(bowling_team),
+                    self.player_key(batter),
+                    self.player_key(bowler),
+                    self.player_key(non_striker),
+                    *runs,
+                    *extras,
+                    self.player_key(player_out),
+                    wicket_kind,
+                )
+                for (
+                    position,
+                    super_over,
+                    team,
+                    bowling_team,
+                    batter,
+                    bowler,
+                    non_striker,
+                    runs,
+                    extras,
+                    player_out,
+                    wicket_kind,
+                ) in match["deliveries"]
+            ],
+        )
+        self.cursor.executemany(
+            "INSERT INTO fact_wickets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    match_id,
+                    season_key,
+                    *position,
+                    self.player_key(player_out),
+                    self.player_key(bowler),
+                    kind,
                 )
+                for position, player_out, bowler, kind in match["wickets"]
+            ],
+        )
+        self.match_ids.add(match_id)
+        self.loaded += 1
+
+    def flush_dimensions(self):
+        """Insert the dimension values first seen in this load"""
+        for table, dimension in self.dimensions.items():
+            if dimension.new_rows:
+                placeholders = ", ".join("?" * len(dimension.new_rows[0]))
+                self.cursor.executemany(
+                    f"INSERT INTO {table} VALUES ({placeholders})", dimension.new_rows
+                )
+                dimension.new_rows = []
+
+
+def create_schema(conn):
+    """Drop every table and view, then create the key-encoded tables and views"""
+    # Earlier builds created the serving tables as plain tables, so drop
+    # whatever exists rather than a fixed list of tables
+    existing = conn.execute(
+        "SELECT type, name FROM sqlite_master WHERE type IN ('table', 'view')"
+    ).fetchall()
+    for kind, name in existing:
+        conn.execute(f"DROP {kind.upper()} IF EXISTS {name}")
+    conn.executescript(SCHEMA)
+    create_serving_views(conn)
+    conn.commit()
+
+
+def has_schema(conn):
+    tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return set(BASE_TABLES) - set(DERIVED_TABLES) <= {name for (name,) in tables}
+
+
+def refresh_player_over_stats(conn):
+    """Recompute player_over_stats from the fact tables"""
+    conn.execute(PLAYER_OVER_STATS_TABLE)
+    conn.execute("DELETE FROM player_over_stats")
+    conn.execute(f"INSERT INTO player_over_stats {PLAYER_OVER_STATS}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "sources",
+        nargs="*",
+        default=[ZIP_PATH],
+        help="Zip archives or directories of match JSON",
+    )
+    parser.add_argument(
+        "--db", help="Load into this SQLite file in place instead of a snapshot"
+    )
+    parser.add_argument(
+        "--datasets-dir",
+        default=str(dataset_snapshots.datasets_dir()),
+        help="Directory of dataset snapshots",
+    )
+    parser.add_argument(
+        "--keep",
+        type=int,
+        default=int(os.getenv("DATASET_KEEP", "3")),
+        help="Snapshots to keep, the new one included (at least 2)",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Processes parsing match files"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Drop the existing data first"
+    )
+    args = parser.parse_args()
+
+    if args.db:
+        load(args.db, args.sources, args.workers, args.rebuild)
+        return
+
+    root = Path(args.datasets_dir)
+    current = dataset_snapshots.current_snapshot(root)
+    base = None if args.rebuild or current is None else current[1]
+    version, db_path = dataset_snapshots.stage_snapshot(root, base)
+    try:
+        loaded = load(db_path, args.sources, args.workers, args.rebuild)
+    except BaseException:
+        dataset_snapshots.discard_staging(root, version)
+        raise
+    if base is not None and not loaded:
+        dataset_snapshots.discard_staging(root, version)
+        print(f"No new matches, {current[0]} stays current")
+        return
+    dataset_snapshots.publish_snapshot(root, version)
+    print(f"Published dataset version {version}")
+    removed = dataset_snapshots.collect_garbage(root, args.keep)
+    if removed:
+        print(f"Removed old snapshots: {', '.join(removed)}")
+
+
+def load(db_path, sources, workers, rebuild) -> int:
+    """Load sources into the SQLite file db_path and return the matches added"""
+    conn = sqlite3.connect(db_path)
+    rebuild = rebuild or not has_schema(conn)
+    if rebuild:
+        create_schema(conn)
+    loader = Loader(conn)
+
+    # Chunks in source order, skipping matches that are already loaded
+    tasks = []
+    for source in sources:
+        names = [
+            name
+            for name in list_matches(source)
+            if Path(name).stem not in loader.match_ids
+        ]
+        tasks += [
+            (source, names[i : i + CHUNK_SIZE])
+            for i in range(0, len(names), CHUNK_SIZE)
+        ]
+
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        # Chunks come back in task order, so keys never depend on worker timing
+        chunks = (
+            executor.map(parse_chunk, tasks) if executor else map(parse_chunk, tasks)
+        )
+        for matches in chunks:
+            for match in matches:
+                # The same match can appear in more than one source
+                if match["match_id"] not in loader.match_ids:
+                    loader.insert(match)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    loader.flush_dimensions()
+    refresh_player_over_stats(conn)
+    conn.commit()
+    if rebuild:
+        # Give back the pages freed by dropping the previous build
+        conn.execute("VACUUM")
+    conn.close()
+    print(f"✅ Done! {loader.loaded} new matches loaded into", db_path)
+    return loader.loaded
+
 
-                # Wickets
-                if "wickets" in delivery:
-                    for wicket in delivery["wickets"]:
-                        cursor.execute(
-                            """
-                            INSERT INTO wickets VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """,
-                            (
-                                match_id,
-                                inning_index,
-                                over_num,
-                                ball_index + 1,
-                                wicket["player_out"],
-                                bowler,
-                                wicket["kind"],
-                            ),
-                        )
-
-# === DONE ===
-conn.commit()
-conn.close()
-print("✅ Done! Data loaded into", DB_NAME)
+if __name__ == "__main__":
+    main()
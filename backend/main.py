@@ -4,36 +4,50 @@
 #   "uvicorn",
 #   "httpx",
 #   "duckdb",
-#   "faiss-cpu",
 #   "pandas",
 #   "python-multipart",
 #   "google-genai",
 #   "python-dotenv",
 #   "openai",
-#   "sqlparse",
 # ]
 # ///
 
+import time
 
-from fastapi import FastAPI, Form, Request, HTTPException, Depends
+# Taken before the framework imports so the startup report includes them
+_import_start = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.gzip import GZipMiddleware
 import os
 import json
+import threading
 from pydantic import BaseModel
-from openai import OpenAI
-from google import genai
-from google.genai import types
 from dotenv import load_dotenv
 
 # Import our modularized components
 from utils.logger import logger
 from models.db_models import DatabaseManager, LogManager, LogLevel, FeedbackManager
+from services.admission import AdmissionController
+from services.example_retriever import ExampleRetriever
 from services.ip_tracker import IPTracker
+from services.prewarm import Prewarmer
 from services.sql_generator import SQLGenerator
+from services.single_flight import SingleFlight
 from services.sql_validator import SQLValidator
-from routes import log_routes, debug_routes
-from middleware.error_handler import ErrorLoggingMiddleware
+from services.template_matcher import TemplateMatcher
+from routes import log_routes, debug_routes, metrics_routes, player_routes
+from middleware.admission import AdmissionMiddleware
+from middleware.conditional import ConditionalGetMiddleware
+from middleware.request_context import RequestContextMiddleware
+from utils.client_ip import get_client_ip
+from utils.metrics import QUERY_OUTCOMES, REJECTIONS, stage
+from utils.normalize import normalize_question, normalize_sql
+
+_imports_done = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
@@ -41,11 +55,134 @@ load_dotenv()
 # Fetch the API key from the .env file
 API_KEY = os.getenv("API_KEY")
 
+# Initialize SQL generator (LLM providers are created on first use)
+sql_generator = SQLGenerator(API_KEY)
+
+# Loaded during startup
+system_prompt = None
+example_retriever = None
+template_matcher = None
+
+# Identical questions (and identical SQL) in flight at the same time share one
+# LLM call (and one execution); each caller is still counted against its quota
+llm_flight = SingleFlight("llm")
+execution_flight = SingleFlight("execution")
+
+# Bounds concurrent LLM-bound requests and turns away IPs known to be over quota
+admission = AdmissionController.from_env()
+
+
+def load_system_prompt() -> str:
+    """Read the system prompt, falling back to a minimal one"""
+    try:
+        with open("system_prompt.txt", "r", encoding="utf-8") as f:
+            prompt = f.read()
+        logger.info("System prompt loaded successfully")
+        return prompt
+    except Exception as e:
+        logger.error(f"Failed to load system prompt: {str(e)}")
+        return "You are an assistant that translates natural language to SQL queries for an IPL database."
+
+
+def _preload_query_modules():
+    """Import the query stack in the background so the first request doesn't pay for it"""
+    try:
+        import duckdb  # noqa: F401
+        import openai  # noqa: F401
+        import pandas  # noqa: F401
+    except Exception as e:
+        logger.warning(f"Background preload of query modules failed: {str(e)}")
+
+
+def generate_sql(user_query: str, client_ip: str) -> tuple:
+    """Build the prompt for user_query and ask the LLM for SQL (blocking)
+
+    Returns (sql_result, answers) with the LLM answers paid for, so callers
+    sharing this call through llm_flight can be charged for them too.
+    """
+    prompt = (
+        example_retriever.prompt_for(user_query) if example_retriever else system_prompt
+    )
+    answers = []
+    sql_result = sql_generator.get_sql_for_query(user_query, prompt, client_ip, answers)
+    return sql_result, answers
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize databases and the prompt once per worker and record how long it took"""
+    global system_prompt, example_retriever, template_matcher
+
+    report = {"imports_ms": round((_imports_done - _import_start) * 1000, 1)}
+
+    step_start = time.perf_counter()
+    DatabaseManager.init_databases()
+    report["database_init_ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+
+    step_start = time.perf_counter()
+    system_prompt = load_system_prompt()
+    report["system_prompt_ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+
+    # Few-shot examples are picked per question; FEW_SHOT_K=0 keeps the static set
+    few_shot_k = int(os.getenv("FEW_SHOT_K", "4"))
+    if few_shot_k > 0:
+        step_start = time.perf_counter()
+        example_retriever = ExampleRetriever(
+            system_prompt, k=few_shot_k, engine=sql_generator.engine
+        )
+        report["example_index_ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+
+    # Common question shapes are answered from SQL templates; TEMPLATE_FAST_PATH=0
+    # sends everything to the LLM
+    template_matcher = TemplateMatcher.from_env(sql_generator.engine)
+
+    preload = threading.Thread(
+        target=_preload_query_modules, name="preload-query-modules", daemon=True
+    )
+    preload.start()
+
+    # Log application startup
+    logger.info("Application starting up")
+    LogManager.log_app_activity(LogLevel.INFO, "Application started")
+
+    report["ready_ms"] = round((time.perf_counter() - _import_start) * 1000, 1)
+    app.state.startup_report = report
+    app.state.sql_generator = sql_generator
+    app.state.example_retriever = example_retriever
+    app.state.admission = admission
+    logger.info(f"Startup completed in {report['ready_ms']} ms: {report}")
+
+    # Warm caches with the most frequent past queries; /debug/health reports
+    # "warming" until this finishes
+    prewarmer = Prewarmer.from_env(sql_generator, template_matcher)
+    app.state.prewarmer = prewarmer
+    prewarmer.start()
+    yield
+
+    prewarmer.stop()
+    sql_generator.engine.close()
+
+    # Tearing the interpreter down mid-import of a native extension aborts it
+    preload.join()
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Natural Language to SQL API")
+app = FastAPI(title="Natural Language to SQL API", lifespan=lifespan)
+
+# Add admission control (inside the timing middleware, so queue time is reported)
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+# Add ETags and 304s for GET responses, then compress what is still sent
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_BYTES", "1024")),
+    compresslevel=6,
+)
 
-# Add our error logging middleware
-app.add_middleware(ErrorLoggingMiddleware)
+# Add request IDs, per-stage timing (Server-Timing header and request
+# histograms) and unhandled error logging around everything else
+app.add_middleware(RequestContextMiddleware)
 
 # Add CORS middleware
 app.add_middleware(
@@ -59,25 +196,8 @@ app.add_middleware(
 # Include the log routes
 app.include_router(log_routes.router)
 app.include_router(debug_routes.router)
-
-# Initialize databases
-DatabaseManager.init_databases()
-
-# Initialize SQL generator
-sql_generator = SQLGenerator(API_KEY)
-
-# Load system prompt
-try:
-    with open("system_prompt.txt", "r", encoding="utf-8") as f:
-        system_prompt = f.read()
-    logger.info("System prompt loaded successfully")
-except Exception as e:
-    logger.error(f"Failed to load system prompt: {str(e)}")
-    system_prompt = "You are an assistant that translates natural language to SQL queries for an IPL database."
-
-# Log application startup
-logger.info("Application starting up")
-LogManager.log_app_activity(LogLevel.INFO, "Application started")
+app.include_router(metrics_routes.router)
+app.include_router(player_routes.router)
 
 
 # Define base request model
@@ -121,11 +241,7 @@ async def process_query(
         logger.info(f"Received query: {user_query}")
 
         # Step 2: Get the real client IP address
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            client_ip = forwarded_for.split(",")[0].strip()
-        else:
-            client_ip = request.client.host
+        client_ip = get_client_ip(request.headers, request.client)
 
         logger.info(f"Request from IP: {client_ip}")
 
@@ -133,6 +249,8 @@ async def process_query(
         global_remaining = IPTracker.get_global_remaining_requests()
         if global_remaining <= 0:
             logger.warning("Global daily limit reached")
+            REJECTIONS.inc(reason="global_limit")
+            admission.mark_exhausted()
             LogManager.log_to_db(
                 LogLevel.WARNING, "Global daily limit reached", ip_address=client_ip
             )
@@ -140,10 +258,32 @@ async def process_query(
                 "error": f"The service has reached its daily request limit. Please try again tomorrow."
             }
 
+        # Step 3b: Check daily token budgets
+        exhausted_budget = IPTracker.check_token_budget(client_ip)
+        if exhausted_budget:
+            REJECTIONS.inc(reason=f"{exhausted_budget}_token_budget")
+            admission.mark_exhausted(
+                None if exhausted_budget == "global" else client_ip
+            )
+            LogManager.log_to_db(
+                LogLevel.WARNING,
+                f"Daily {exhausted_budget} token budget exhausted",
+                ip_address=client_ip,
+            )
+            if exhausted_budget == "global":
+                return {
+                    "error": "The service has reached its daily usage limit. Please try again tomorrow."
+                }
+            return {
+                "error": "You have reached your daily usage limit. Please try again tomorrow."
+            }
+
         # Step 4: Check individual IP request limit
         if not IPTracker.check_ip_limit(client_ip):
             ip_remaining = IPTracker.get_ip_remaining_requests(client_ip)
             logger.warning(f"IP {client_ip} exceeded request limit")
+            REJECTIONS.inc(reason="ip_limit")
+            admission.mark_exhausted(client_ip)
             LogManager.log_to_db(
                 LogLevel.WARNING,
                 f"IP exceeded request limit: {client_ip}",
@@ -153,16 +293,35 @@ async def process_query(
                 "error": f"You have exceeded your daily limit. You have {ip_remaining} requests remaining for today."
             }
 
-        # Step 5: Generate SQL query
+        # Step 5: Fill a SQL template for a known question shape, else generate SQL
+        # Matching can wait for the dataset to open and a query slot, so it
+        # runs off the event loop
+        template = (
+            await run_in_threadpool(template_matcher.match, user_query)
+            if template_matcher
+            else None
+        )
         try:
-            response = json.loads(
-                sql_generator.get_sql_for_query(user_query, system_prompt)
-            )
-            sql_query = response["sql_query"]
+            if template is not None:
+                sql_query = template.display_sql
+                logger.info(f"Answering from template {template.name}")
+            else:
+                (sql_result, answers), shared = await llm_flight.run(
+                    normalize_question(user_query), generate_sql, user_query, client_ip
+                )
+                # The leader's IP paid for the call; waiters are charged the same tokens
+                if shared:
+                    sql_generator.record_shared_usage(client_ip, user_query, answers)
+                response = json.loads(sql_result)
+                sql_query = response["sql_query"]
             logger.info(f"SQL query generated: {sql_query[:50]}...")
         except Exception as e:
             error_msg = f"Failed to generate SQL: {str(e)}"
             logger.error(error_msg)
+            QUERY_OUTCOMES.inc(outcome="generation_failed")
+            IPTracker.record_query_history(
+                client_ip, user_query, None, False, "generation_failed"
+            )
             LogManager.log_to_db(
                 LogLevel.ERROR, error_msg, source="SQL generation", ip_address=client_ip
             )
@@ -177,10 +336,13 @@ async def process_query(
         # Step 6: Check if the SQL query is actually an error message
         if sql_query.startswith("ERROR:"):
             # Record the failed query in history
-            IPTracker.record_query_history(client_ip, user_query, sql_query, False)
+            IPTracker.record_query_history(
+                client_ip, user_query, sql_query, False, "llm_declined"
+            )
 
             error_msg = sql_query.replace("ERROR:", "").strip()
             logger.warning(f"SQL generation returned error: {error_msg}")
+            QUERY_OUTCOMES.inc(outcome="llm_declined")
             LogManager.log_to_db(
                 LogLevel.WARNING,
                 f"SQL generation error: {error_msg}",
@@ -196,7 +358,7 @@ async def process_query(
                     "user_remaining": IPTracker.get_ip_remaining_requests(client_ip),
                     "global_remaining": IPTracker.get_global_remaining_requests(),
                 },
-            }  
+            }
         # Step 6.5: Add a second layer of SQL validation for enhanced security
         try:
             is_valid, error_message = SQLValidator.validate(sql_query)
@@ -204,13 +366,17 @@ async def process_query(
                 logger.warning(
                     f"SQL validation failed in process_query step: {error_message}"
                 )
+                REJECTIONS.inc(reason="validation")
+                QUERY_OUTCOMES.inc(outcome="rejected")
                 LogManager.log_to_db(
                     LogLevel.WARNING,
                     f"SQL validation failed: {error_message}",
                     source="SQL validation",
                     ip_address=client_ip,
                 )
-                IPTracker.record_query_history(client_ip, user_query, sql_query, False)
+                IPTracker.record_query_history(
+                    client_ip, user_query, sql_query, False, "rejected"
+                )
                 return {
                     "sql_query": sql_query,
                     "error": f"I don't answer unsafe query: {error_message}",
@@ -232,17 +398,30 @@ async def process_query(
             )
         # Step 7: Execute and get results
         try:
-            df = sql_generator.fetch_data(sql_query)
+            # Template SQL runs with its values bound as parameters
+            df, _ = await execution_flight.run(
+                normalize_sql(sql_query),
+                sql_generator.fetch_data,
+                template.sql if template else sql_query,
+                user_query,
+                template.params if template else None,
+            )
 
             # Convert DataFrame to JSON with proper float handling
             # This ensures numeric values maintain their 2 decimal place formatting
-            json_result = json.loads(df.to_json(orient="records", double_precision=2))
+            with stage("serialization"):
+                json_result = json.loads(
+                    df.to_json(orient="records", double_precision=2)
+                )
+            QUERY_OUTCOMES.inc(outcome="success")
 
             # Record the successful query in history
-            IPTracker.record_query_history(client_ip, user_query, sql_query, True)
+            IPTracker.record_query_history(
+                client_ip, user_query, sql_query, True, "success"
+            )
 
             logger.info(
-                f"Query executed successfully with {len(json_result)} results (numeric values rounded to 2 decimal places)"
+                f"Query executed successfully with {len(df)} results (numeric values rounded to 2 decimal places)"
             )
             LogManager.log_app_activity(
                 LogLevel.INFO,
@@ -257,14 +436,20 @@ async def process_query(
                     "global_remaining": IPTracker.get_global_remaining_requests(),
                 },
             }
+            # Only the first MAX_RESULT_ROWS rows are in result
+            if df.attrs.get("truncated"):
+                response["truncated"] = True
             return response
         except Exception as e:
             # Record the failed query in history
-            IPTracker.record_query_history(client_ip, user_query, sql_query, False)
+            IPTracker.record_query_history(
+                client_ip, user_query, sql_query, False, "execution_failed"
+            )
 
             # Log the error
             error_msg = f"Error executing query: {str(e)}"
             logger.error(error_msg)
+            QUERY_OUTCOMES.inc(outcome="execution_failed")
             LogManager.log_to_db(
                 LogLevel.ERROR, error_msg, source="SQL execution", ip_address=client_ip
             )
@@ -297,6 +482,7 @@ async def root():
     logger.info("Home route accessed")
     return {"message": "Welcome to the Natural Language to SQL API"}
 
+
 # Add a feedback endpoint
 @app.post("/feedback/")
 async def record_feedback(
@@ -307,31 +493,36 @@ async def record_feedback(
 ):
     try:
         # Get the client's IP address
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            client_ip = forwarded_for.split(",")[0].strip()
-        else:
-            client_ip = request.client.host
-            
+        client_ip = get_client_ip(request.headers, request.client)
+
         logger.info(f"Feedback received from IP: {client_ip}, Type: {feedback_type}")
-        
+
         # Record the feedback in the database
         success = FeedbackManager.record_feedback(
             client_ip, user_query, sql_query, feedback_type
         )
-        
+
         if success:
             return {"status": "success", "message": "Feedback recorded successfully"}
         else:
             return {"status": "error", "message": "Failed to record feedback"}
-            
+
     except Exception as e:
         logger.error(f"Error processing feedback: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+
 # Run the server using uvicorn
 if __name__ == "__main__":
-    logger.info("Starting server on port 8000")
-    LogManager.log_app_activity(LogLevel.INFO, "Server starting")
-
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    import uvicorn
+
+    # WORKERS processes share the port and the tracking database; 0 uses one
+    # per CPU core
+    workers = int(os.getenv("WORKERS", "1")) or os.cpu_count()
+    logger.info(f"Starting server on port 8000 with {workers} worker(s)")
+
+    if workers > 1:
+        # Worker processes import the app themselves
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,80 @@
+import json
+import math
+
+from starlette.requests import HTTPConnection
+
+from services.admission import AdmissionController, Overloaded, seconds_until_tomorrow
+from utils.client_ip import get_client_ip
+from utils.metrics import REJECTIONS
+
+QUOTA_MESSAGES = {
+    "ip": "You have reached your daily limit. Please try again tomorrow.",
+    "global": "The service has reached its daily limit. Please try again tomorrow.",
+}
+
+
+class AdmissionMiddleware:
+    """
+    Runs POST requests to the given paths through an AdmissionController
+    before the body is read. IPs already known to be over quota get a 429 and
+    requests that cannot be admitted before their deadline a 503, both with
+    Retry-After and the {"error": ...} body the frontend shows.
+
+    Written against ASGI directly rather than BaseHTTPMiddleware so a
+    rejection costs a header lookup and never touches the request body.
+    """
+
+    def __init__(
+        self, app, controller: AdmissionController, paths=("/process_query/",)
+    ):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        client_ip = get_client_ip(connection.headers, connection.client)
+        exhausted = self.controller.exhausted(client_ip)
+        if exhausted:
+            REJECTIONS.inc(reason=f"{exhausted}_quota_cached")
+            await _reject(
+                send, 429, QUOTA_MESSAGES[exhausted], seconds_until_tomorrow()
+            )
+            return
+
+        try:
+            async with self.controller.slot(client_ip):
+                await self.app(scope, receive, send)
+        except Overloaded as e:
+            REJECTIONS.inc(reason=f"overloaded_{e.reason}")
+            retry_after = max(1, math.ceil(e.retry_after_s))
+            await _reject(
+                send,
+                503,
+                f"The server is busy. Please try again in {retry_after} seconds.",
+                retry_after,
+            )
+
+
+async def _reject(send, status: int, message: str, retry_after: int):
+    body = json.dumps({"error": message}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
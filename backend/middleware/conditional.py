@@ -0,0 +1,96 @@
+from starlette.datastructures import Headers, MutableHeaders
+
+from utils.http_cache import etag_matches, weak_etag
+
+# Responses larger than this are streamed through without an ETag
+MAX_BUFFERED_BYTES = 8 * 1024 * 1024
+
+# Health, admission and metrics change on every request, so a 304 never helps
+VOLATILE_PATH_PREFIXES = ("/debug/", "/metrics")
+
+
+class ConditionalGetMiddleware:
+    """
+    Gives successful GET responses a weak ETag computed from the body and
+    answers a matching If-None-Match with an empty 304. Handlers that know
+    their ETag up front (like the player stats) set it themselves and skip
+    the work on a match; their responses are passed through untouched.
+
+    Responses without a Cache-Control get "no-cache": clients may keep them
+    but must revalidate, which a 304 makes cheap. Compression happens outside
+    this middleware, so the ETag describes the uncompressed body and is weak:
+    the gzip and identity responses carry the same one. Paths starting with
+    one of exclude_prefixes are passed through untouched.
+    """
+
+    def __init__(self, app, exclude_prefixes=VOLATILE_PATH_PREFIXES):
+        self.app = app
+        self.exclude_prefixes = tuple(exclude_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or scope["path"].startswith(self.exclude_prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+        chunks = []
+        size = 0
+        passthrough = False
+
+        async def send_with_etag(message):
+            nonlocal start, size, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if message["status"] != 200 or "etag" in headers:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            chunks.append(message.get("body", b""))
+            size += len(chunks[-1])
+            if message.get("more_body", False):
+                if size > MAX_BUFFERED_BYTES:
+                    passthrough = True
+                    await send(start)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": b"".join(chunks),
+                            "more_body": True,
+                        }
+                    )
+                return
+
+            body = b"".join(chunks)
+            etag = weak_etag(body)
+            headers = MutableHeaders(scope=start)
+            cache_control = headers.get("cache-control", "no-cache")
+            if etag_matches(if_none_match, etag):
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 304,
+                        "headers": [
+                            (b"etag", etag.encode()),
+                            (b"cache-control", cache_control.encode()),
+                        ],
+                    }
+                )
+                await send({"type": "http.response.body", "body": b""})
+                return
+            headers["ETag"] = etag
+            headers["Cache-Control"] = cache_control
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_with_etag)
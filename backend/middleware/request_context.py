@@ -0,0 +1,110 @@
+import json
+import os
+import time
+import traceback
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+
+from models.db_models import LogLevel, LogManager
+from utils.client_ip import get_client_ip
+from utils.logger import logger
+from utils.metrics import REQUEST_DURATION, server_timing_header, start_request_trace
+from utils.request_context import REQUEST_ID_HEADER, new_request_id, set_request_id
+
+
+class RequestContextMiddleware:
+    """
+    Outermost application middleware, written against ASGI directly.
+
+    Each request gets an ID (the client's X-Request-ID if well formed), which
+    the logger, LogManager rows, query_history and llm_usage pick up from a
+    context variable and which is returned in the X-Request-ID header along
+    with the stage timings in Server-Timing. The total is recorded in the
+    request duration histogram, and requests slower than
+    SLOW_REQUEST_THRESHOLD_MS have their stage spans logged.
+
+    Unhandled exceptions are logged, written to error_logs from the
+    threadpool rather than the event loop, and answered with a JSON 500
+    carrying the request ID.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        # Negative disables slow request tracing
+        self.slow_request_ms = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        request_id = new_request_id(connection.headers.get(REQUEST_ID_HEADER))
+        set_request_id(request_id)
+        trace = start_request_trace()
+        status = 500
+        response_started = False
+
+        async def send_with_context(message):
+            nonlocal status, response_started
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_started = True
+                trace.timings["total"] = time.perf_counter() - trace.start
+                response_headers = MutableHeaders(scope=message)
+                response_headers[REQUEST_ID_HEADER] = request_id
+                response_headers["Server-Timing"] = server_timing_header(trace.timings)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_context)
+        except Exception as e:
+            await self._log_exception(connection, request_id, e)
+            if response_started:
+                raise
+            body = json.dumps(
+                {
+                    "error": "Internal server error",
+                    "message": str(e),
+                    "request_id": request_id,
+                }
+            ).encode()
+            await send_with_context(
+                {
+                    "type": "http.response.start",
+                    "status": 500,
+                    "headers": [
+                        (b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode()),
+                    ],
+                }
+            )
+            await send_with_context({"type": "http.response.body", "body": body})
+        finally:
+            elapsed = time.perf_counter() - trace.start
+            # Label by route template rather than raw path to keep cardinality bounded
+            path = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_DURATION.observe(elapsed, path=path)
+            if 0 <= self.slow_request_ms <= elapsed * 1000:
+                logger.warning(
+                    f"Slow request {scope['method']} {scope['path']} -> {status} "
+                    f"in {elapsed * 1000:.1f} ms: {trace.format_spans() or 'no stages'}"
+                )
+
+    @staticmethod
+    async def _log_exception(connection, request_id, error):
+        logger.error(f"Unhandled exception: {str(error)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        try:
+            await run_in_threadpool(
+                LogManager.log_to_db,
+                LogLevel.ERROR,
+                f"Unhandled exception: {str(error)}",
+                source=f"{connection.scope['method']} {connection.url.path}",
+                ip_address=get_client_ip(connection.headers, connection.client),
+                request_id=request_id,
+            )
+        except Exception as db_err:
+            logger.error(f"Failed to log to database: {str(db_err)}")
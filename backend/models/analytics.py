@@ -0,0 +1,343 @@
+"""
+Incremental rollups over query_history and user_feedback.
+
+Each query and each feedback row updates hourly and daily rollup tables in
+the same transaction that writes it:
+
+- analytics_outcomes: queries per outcome (success, llm_declined, rejected,
+  generation_failed, execution_failed)
+- analytics_latency: a latency histogram per outcome with logarithmic
+  buckets, each 5% wider than the last, so percentiles read from it are
+  within 2.5% of the exact value however many queries it holds
+- analytics_top_questions: a Space-Saving summary of the most asked
+  normalized questions, at most ANALYTICS_TOP_CAPACITY per period
+- analytics_feedback: positive and negative feedback per SQL fingerprint
+
+Reads only touch the rows of the periods asked for, so their cost does not
+grow with the history.
+"""
+
+import math
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+from utils.normalize import normalize_question, sql_fingerprint
+
+GRANULARITIES = ("hour", "day")
+
+ROLLUP_TABLES = (
+    "analytics_outcomes",
+    "analytics_latency",
+    "analytics_top_questions",
+    "analytics_feedback",
+)
+
+# Ratio between the bounds of consecutive latency buckets
+LATENCY_GAMMA = 1.05
+_LOG_GAMMA = math.log(LATENCY_GAMMA)
+
+# Long questions are truncated so a pasted essay cannot bloat the summary
+MAX_QUESTION_LENGTH = 300
+
+# Hour whose older hourly rows this process has already dropped
+_pruned_before = None
+
+
+def _top_capacity() -> int:
+    # Read on every use so .env values loaded after import still apply
+    return int(os.getenv("ANALYTICS_TOP_CAPACITY", "200"))
+
+
+def _hourly_retention() -> timedelta:
+    return timedelta(days=int(os.getenv("ANALYTICS_HOURLY_RETENTION_DAYS", "14")))
+
+
+def utc_timestamp(moment: datetime = None) -> str:
+    """A UTC time formatted like SQLite's CURRENT_TIMESTAMP"""
+    return (moment or datetime.now(timezone.utc)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def period_keys(timestamp: str) -> dict:
+    """The hour and day periods a 'YYYY-MM-DD HH:MM:SS' timestamp falls in"""
+    return {"hour": timestamp[:13] + ":00", "day": timestamp[:10]}
+
+
+def first_period(granularity: str, periods: int) -> str:
+    """Key of the oldest of the last `periods` periods, the current one included"""
+    now = datetime.now(timezone.utc)
+    if granularity == "hour":
+        return (now - timedelta(hours=periods - 1)).strftime("%Y-%m-%d %H:00")
+    return (now - timedelta(days=periods - 1)).strftime("%Y-%m-%d")
+
+
+def latency_bucket(latency_ms: float) -> int:
+    """Index of the bucket (gamma^(i-1), gamma^i] that holds latency_ms"""
+    return math.ceil(math.log(max(latency_ms, 0.01)) / _LOG_GAMMA)
+
+
+def latency_percentiles(buckets, quantiles=(0.5, 0.95, 0.99)) -> dict:
+    """Percentiles in ms from (bucket, count) pairs, None when there are none
+
+    Each is reported as the point of its bucket with the smallest worst-case
+    relative error, (gamma - 1) / (gamma + 1).
+    """
+    buckets = sorted(buckets)
+    total = sum(count for _, count in buckets)
+    result = {}
+    for quantile in quantiles:
+        name = f"p{round(quantile * 100)}"
+        result[name] = None
+        rank = quantile * (total - 1)
+        seen = 0
+        for bucket, count in buckets:
+            seen += count
+            if seen > rank:
+                upper = LATENCY_GAMMA**bucket
+                result[name] = round(2 * upper / (1 + LATENCY_GAMMA), 1)
+                break
+    return result
+
+
+def create_rollup_tables(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_outcomes (
+            granularity TEXT,
+            period TEXT,
+            outcome TEXT,
+            count INTEGER,
+            PRIMARY KEY (granularity, period, outcome)
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_latency (
+            granularity TEXT,
+            period TEXT,
+            outcome TEXT,
+            bucket INTEGER,
+            count INTEGER,
+            PRIMARY KEY (granularity, period, outcome, bucket)
+        )
+    """
+    )
+    # count overestimates a question's frequency by at most error
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_top_questions (
+            granularity TEXT,
+            period TEXT,
+            question TEXT,
+            count INTEGER,
+            error INTEGER,
+            PRIMARY KEY (granularity, period, question)
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_analytics_top_questions_count
+        ON analytics_top_questions (granularity, period, count)
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS analytics_feedback (
+            granularity TEXT,
+            period TEXT,
+            fingerprint TEXT,
+            positive INTEGER,
+            negative INTEGER,
+            sample_question TEXT,
+            PRIMARY KEY (granularity, period, fingerprint)
+        )
+    """
+    )
+
+
+def record_query(
+    conn, user_query: str, outcome: str, latency_ms: float = None, timestamp=None
+):
+    """Add one query to the rollups
+
+    Runs inside the caller's transaction, after the query_history insert has
+    taken the write lock, so concurrent workers cannot interleave the
+    read-then-write of the Space-Saving update.
+    """
+    periods = period_keys(timestamp or utc_timestamp())
+    question = normalize_question(user_query or "")[:MAX_QUESTION_LENGTH]
+    for granularity, period in periods.items():
+        conn.execute(
+            """
+            INSERT INTO analytics_outcomes (granularity, period, outcome, count)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT (granularity, period, outcome) DO UPDATE SET count = count + 1
+            """,
+            (granularity, period, outcome),
+        )
+        if latency_ms is not None:
+            conn.execute(
+                """
+                INSERT INTO analytics_latency (granularity, period, outcome, bucket, count)
+                VALUES (?, ?, ?, ?, 1)
+                ON CONFLICT (granularity, period, outcome, bucket)
+                DO UPDATE SET count = count + 1
+                """,
+                (granularity, period, outcome, latency_bucket(latency_ms)),
+            )
+        if question:
+            _count_question(conn, granularity, period, question)
+    _prune_hourly(conn, periods["hour"])
+
+
+def _count_question(conn, granularity: str, period: str, question: str):
+    """Space-Saving update: count a tracked question, track a new one while
+    there is room, otherwise let it take over the least counted entry and
+    inherit that count as its possible overestimate"""
+    key = (granularity, period)
+    updated = conn.execute(
+        """
+        UPDATE analytics_top_questions SET count = count + 1
+        WHERE granularity = ? AND period = ? AND question = ?
+        """,
+        (*key, question),
+    ).rowcount
+    if updated:
+        return
+
+    (tracked,) = conn.execute(
+        "SELECT COUNT(*) FROM analytics_top_questions WHERE granularity = ? AND period = ?",
+        key,
+    ).fetchone()
+    if tracked < _top_capacity():
+        conn.execute(
+            """
+            INSERT INTO analytics_top_questions (granularity, period, question, count, error)
+            VALUES (?, ?, ?, 1, 0)
+            """,
+            (*key, question),
+        )
+        return
+
+    conn.execute(
+        """
+        UPDATE analytics_top_questions
+        SET question = ?, error = count, count = count + 1
+        WHERE rowid = (
+            SELECT rowid FROM analytics_top_questions
+            WHERE granularity = ? AND period = ?
+            ORDER BY count LIMIT 1
+        )
+        """,
+        (question, *key),
+    )
+
+
+def _prune_hourly(conn, current_hour: str):
+    """Drop hourly rows past their retention, once per hour per process"""
+    global _pruned_before
+    if _pruned_before == current_hour:
+        return
+    cutoff = utc_timestamp(datetime.now(timezone.utc) - _hourly_retention())
+    for table in ROLLUP_TABLES:
+        conn.execute(
+            f"DELETE FROM {table} WHERE granularity = 'hour' AND period < ?",
+            (period_keys(cutoff)["hour"],),
+        )
+    _pruned_before = current_hour
+
+
+def record_feedback(
+    conn, user_query: str, sql_query: str, feedback_type: str, timestamp=None
+):
+    """Add one piece of feedback to the per-fingerprint rollups"""
+    if feedback_type not in ("positive", "negative"):
+        return
+    positive = int(feedback_type == "positive")
+    fingerprint = sql_fingerprint(sql_query or "")
+    for granularity, period in period_keys(timestamp or utc_timestamp()).items():
+        conn.execute(
+            """
+            INSERT INTO analytics_feedback
+            (granularity, period, fingerprint, positive, negative, sample_question)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, period, fingerprint) DO UPDATE SET
+                positive = positive + excluded.positive,
+                negative = negative + excluded.negative
+            """,
+            (granularity, period, fingerprint, positive, 1 - positive, user_query),
+        )
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from query_history and user_feedback
+
+    Run when the rollup tables are first created. Queries from before the
+    outcome and latency columns existed count as "success" or "failed" and
+    have no latency; question counts come out exact rather than estimated.
+    """
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+
+    oldest_hour = period_keys(
+        utc_timestamp(datetime.now(timezone.utc) - _hourly_retention())
+    )["hour"]
+
+    def keys(timestamp):
+        return [
+            (granularity, period)
+            for granularity, period in period_keys(timestamp).items()
+            if granularity == "day" or period >= oldest_hour
+        ]
+
+    outcomes = Counter()
+    latencies = Counter()
+    questions = defaultdict(Counter)
+    for timestamp, user_query, success, outcome, latency_ms in conn.execute(
+        "SELECT timestamp, user_query, success, outcome, latency_ms FROM query_history"
+    ):
+        if not timestamp:
+            continue
+        outcome = outcome or ("success" if success else "failed")
+        question = normalize_question(user_query or "")[:MAX_QUESTION_LENGTH]
+        for key in keys(timestamp):
+            outcomes[(*key, outcome)] += 1
+            if latency_ms is not None:
+                latencies[(*key, outcome, latency_bucket(latency_ms))] += 1
+            if question:
+                questions[key][question] += 1
+
+    feedback = {}
+    for timestamp, user_query, sql_query, feedback_type in conn.execute(
+        "SELECT timestamp, user_query, sql_query, feedback_type FROM user_feedback"
+    ):
+        if not timestamp or feedback_type not in ("positive", "negative"):
+            continue
+        for key in keys(timestamp):
+            entry = feedback.setdefault(
+                (*key, sql_fingerprint(sql_query or "")), [0, 0, user_query]
+            )
+            entry[0 if feedback_type == "positive" else 1] += 1
+
+    conn.executemany(
+        "INSERT INTO analytics_outcomes VALUES (?, ?, ?, ?)",
+        [(*key, count) for key, count in outcomes.items()],
+    )
+    conn.executemany(
+        "INSERT INTO analytics_latency VALUES (?, ?, ?, ?, ?)",
+        [(*key, count) for key, count in latencies.items()],
+    )
+    conn.executemany(
+        "INSERT INTO analytics_top_questions VALUES (?, ?, ?, ?, 0)",
+        [
+            (*key, question, count)
+            for key, counts in questions.items()
+            for question, count in counts.most_common(_top_capacity())
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO analytics_feedback VALUES (?, ?, ?, ?, ?, ?)",
+        [(*key, *entry) for key, entry in feedback.items()],
+    )
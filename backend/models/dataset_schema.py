@@ -0,0 +1,136 @@
+"""
+Serving views over the key-encoded IPL dataset.
+
+json_to_database.py stores players, teams, venues and seasons once in
+dimension tables and the fact tables reference them by integer key, which
+keeps the largest tables small and makes joins compare integers. The LLM
+never sees the keys: these views resolve them back to names and expose the
+same tables and columns the system prompt describes.
+
+Each SELECT names its base tables as {src}table so the same definitions can
+be created inside the SQLite file (src="") and in a DuckDB connection that
+attaches it (src="ipl.").
+
+The query engine stores the wide delivery_facts as a table when it copies
+the base tables, so the ball-by-ball questions the prompt steers to it are
+single-table scans instead of nine joins on every query.
+
+export_parquet.py writes the same base tables as Parquet, with the fact
+tables split into one hive-style directory per season_key.
+"""
+
+# Phase of play by 0-based over number: overs 1-6, 7-15 and 16-20
+POWERPLAY_OVERS = 6
+DEATH_OVERS_START = 15
+
+# Base tables written by json_to_database.py
+BASE_TABLES = [
+    "dim_player",
+    "dim_team",
+    "dim_venue",
+    "dim_season",
+    "match_info",
+    "match_teams",
+    "match_players",
+    "officials",
+    "fact_deliveries",
+    "fact_wickets",
+    "player_over_stats",
+]
+# Recomputed from the fact tables at the end of every load
+DERIVED_TABLES = ["player_over_stats"]
+
+# Exported as <table>/season_key=<key>/data.parquet
+PARTITIONED_TABLES = ["fact_deliveries", "fact_wickets"]
+PARTITION_COLUMN = "season_key"
+# Written last by an export, so its mtime identifies the exported dataset
+PARQUET_MANIFEST = "manifest.json"
+
+PHASE_SQL = f"""CASE
+        WHEN f.super_over = 1 THEN 'super_over'
+        WHEN f.over < {POWERPLAY_OVERS} THEN 'powerplay'
+        WHEN f.over < {DEATH_OVERS_START} THEN 'middle'
+        ELSE 'death'
+    END"""
+
+EXTRAS_SQL = "f.wides, f.noballs, f.byes, f.legbyes, f.penalty, f.is_legal_delivery"
+
+SERVING_VIEWS = {
+    "matches": """
+SELECT m.match_id, m.date, v.city, v.venue, m.match_number, m.teams_name,
+    m.overs, m.balls_per_over, m.event_name, m.team_type, m.gender,
+    m.match_type, s.season, tw.team_name AS toss_winner, m.toss_decision,
+    mw.team_name AS match_winner, m.player_of_match, m.win_by_runs
+FROM {src}match_info m
+JOIN {src}dim_venue v ON v.venue_key = m.venue_key
+JOIN {src}dim_season s ON s.season_key = m.season_key
+LEFT JOIN {src}dim_team tw ON tw.team_key = m.toss_winner_key
+LEFT JOIN {src}dim_team mw ON mw.team_key = m.match_winner_key
+""",
+    "teams": """
+SELECT mt.match_id, t.team_name
+FROM {src}match_teams mt
+JOIN {src}dim_team t ON t.team_key = mt.team_key
+""",
+    "players": """
+SELECT mp.match_id, t.team_name, p.player_id, p.player_name
+FROM {src}match_players mp
+JOIN {src}dim_team t ON t.team_key = mp.team_key
+JOIN {src}dim_player p ON p.player_key = mp.player_key
+""",
+    "deliveries": f"""
+SELECT f.match_id, f.inning, f.over, f.ball, b.player_name AS batter,
+    bw.player_name AS bowler, ns.player_name AS non_striker, f.runs_batter,
+    f.runs_total, {EXTRAS_SQL}
+FROM {{src}}fact_deliveries f
+JOIN {{src}}dim_player b ON b.player_key = f.batter_key
+JOIN {{src}}dim_player bw ON bw.player_key = f.bowler_key
+JOIN {{src}}dim_player ns ON ns.player_key = f.non_striker_key
+""",
+    "wickets": """
+SELECT w.match_id, w.inning, w.over, w.ball, po.player_name AS player_out,
+    bw.player_name AS bowler, w.kind
+FROM {src}fact_wickets w
+JOIN {src}dim_player po ON po.player_key = w.player_out_key
+JOIN {src}dim_player bw ON bw.player_key = w.bowler_key
+""",
+    "delivery_facts": f"""
+SELECT f.match_id, s.season, m.date, v.venue, v.city, f.inning, f.over, f.ball,
+    {PHASE_SQL} AS phase,
+    bt.team_name AS batting_team, ft.team_name AS bowling_team,
+    b.player_name AS batter, bw.player_name AS bowler,
+    ns.player_name AS non_striker, f.runs_batter, f.runs_total, {EXTRAS_SQL},
+    po.player_name AS player_out, f.wicket_kind
+FROM {{src}}fact_deliveries f
+JOIN {{src}}match_info m ON m.match_id = f.match_id
+JOIN {{src}}dim_season s ON s.season_key = f.season_key
+JOIN {{src}}dim_venue v ON v.venue_key = m.venue_key
+JOIN {{src}}dim_team bt ON bt.team_key = f.batting_team_key
+LEFT JOIN {{src}}dim_team ft ON ft.team_key = f.bowling_team_key
+JOIN {{src}}dim_player b ON b.player_key = f.batter_key
+JOIN {{src}}dim_player bw ON bw.player_key = f.bowler_key
+JOIN {{src}}dim_player ns ON ns.player_key = f.non_striker_key
+LEFT JOIN {{src}}dim_player po ON po.player_key = f.player_out_key
+""",
+}
+
+
+# Serving views the query engine materializes instead of creating as views
+MATERIALIZED_VIEWS = ["delivery_facts"]
+
+
+def create_serving_views(con, src: str = "", materialize=()):
+    """Create the name-resolving views on con over base tables prefixed by src
+
+    Names in materialize are created as tables holding the view's rows.
+    """
+    for name, select in SERVING_VIEWS.items():
+        kind = "TABLE" if name in materialize else "VIEW"
+        con.execute(f"CREATE {kind} {name} AS {select.format(src=src)}")
+
+
+def parquet_source(parquet_dir, table: str) -> str:
+    """read_parquet() expression for a base table exported by export_parquet.py"""
+    if table in PARTITIONED_TABLES:
+        return f"read_parquet('{parquet_dir}/{table}/*/*.parquet', hive_partitioning = true)"
+    return f"read_parquet('{parquet_dir}/{table}.parquet')"
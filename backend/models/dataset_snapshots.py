@@ -0,0 +1,144 @@
+"""
+Versioned, immutable snapshots of the IPL dataset.
+
+json_to_database.py never writes to the database the server is reading.
+Each load builds a new SQLite file under a hidden staging directory, marks it
+read-only, renames the directory to datasets/<version>/ and then atomically
+replaces datasets/CURRENT, a one-line file naming the version to serve:
+
+    datasets/
+        CURRENT                      # "20261019T120000-3fa2c1"
+        20261018T090000-8b01de/ipl_data.db
+        20261019T120000-3fa2c1/ipl_data.db
+
+Versions sort by creation time. A reader resolves CURRENT once and keeps
+using that snapshot's file, so a load finishing mid-query changes nothing
+for queries already running.
+"""
+
+import os
+import secrets
+import shutil
+import time
+from pathlib import Path
+
+DATASETS_DIR = "datasets"
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_DB_NAME = "ipl_data.db"
+# Snapshots being built start with this prefix and are never served
+STAGING_PREFIX = ".building-"
+
+
+def datasets_dir() -> Path:
+    return Path(os.getenv("DATASETS_DIR", DATASETS_DIR))
+
+
+def new_version() -> str:
+    """A version name that sorts after every earlier one"""
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{secrets.token_hex(3)}"
+
+
+def current_version(root) -> str:
+    """Version CURRENT points at, or None when no snapshot was published"""
+    try:
+        version = (Path(root) / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def snapshot_path(root, version: str) -> Path:
+    return Path(root) / version / SNAPSHOT_DB_NAME
+
+
+def current_snapshot(root):
+    """(version, path) of the published snapshot, or None"""
+    version = current_version(root)
+    if version is None:
+        return None
+    return version, snapshot_path(root, version)
+
+
+def resolve_dataset(default_path) -> Path:
+    """Path of the published snapshot, else default_path (a pre-snapshot build)"""
+    current = current_snapshot(datasets_dir())
+    return current[1] if current else Path(default_path)
+
+
+def list_snapshots(root) -> list:
+    """Published snapshot versions, oldest first"""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(
+        entry.name
+        for entry in root.iterdir()
+        if entry.is_dir()
+        and not entry.name.startswith(STAGING_PREFIX)
+        and (entry / SNAPSHOT_DB_NAME).exists()
+    )
+
+
+def stage_snapshot(root, base: Path = None):
+    """Create a staging directory for a new snapshot and return (version, db path)
+
+    With base, the new database starts as a copy of it so an incremental
+    load only has to add what is new.
+    """
+    version = new_version()
+    staging = Path(root) / f"{STAGING_PREFIX}{version}"
+    staging.mkdir(parents=True)
+    db_path = staging / SNAPSHOT_DB_NAME
+    if base is not None:
+        shutil.copyfile(base, db_path)
+    return version, db_path
+
+
+def publish_snapshot(root, version: str):
+    """Make a staged snapshot immutable and point CURRENT at it"""
+    root = Path(root)
+    staging = root / f"{STAGING_PREFIX}{version}"
+    db_path = staging / SNAPSHOT_DB_NAME
+    _fsync(db_path)
+    os.chmod(db_path, 0o444)
+    os.replace(staging, root / version)
+
+    # Readers see either the old pointer or the new one, never a partial write
+    tmp = root / f"{CURRENT_FILE}.tmp"
+    tmp.write_text(version + "\n")
+    _fsync(tmp)
+    os.replace(tmp, root / CURRENT_FILE)
+    _fsync(root)
+
+
+def discard_staging(root, version: str):
+    shutil.rmtree(Path(root) / f"{STAGING_PREFIX}{version}", ignore_errors=True)
+
+
+def collect_garbage(root, keep: int = 2) -> list:
+    """Delete all but the `keep` newest snapshots and return their versions
+
+    CURRENT is always kept. Keeping at least the previous snapshot as well
+    covers server workers that resolved CURRENT just before it moved and are
+    still loading the file.
+    """
+    keep = max(keep, 2)
+    current = current_version(root)
+    snapshots = list_snapshots(root)
+    removed = []
+    for version in snapshots[:-keep]:
+        if version == current:
+            continue
+        path = Path(root) / version
+        # Snapshot files are read-only; the directory itself is not
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
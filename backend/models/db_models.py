@@ -1,11 +1,23 @@
+import json
+import os
 import sqlite3
 from datetime import datetime, date
 from enum import Enum
+from models import analytics
+from utils.metrics import timed
+from utils.request_context import get_request_id
 
 # Database paths
 DB_PATH = "ipl_data.db"
 IP_TRACKING_DB_PATH = "ip_tracking.db"
 
+# Version of the tracking database schema, stored in PRAGMA user_version.
+# Bump it whenever init_databases gains new DDL.
+SCHEMA_VERSION = 6
+
+# Seconds a connection waits for another worker's write lock before failing
+SQLITE_BUSY_TIMEOUT_S = 10
+
 
 class LogLevel(Enum):
     INFO = "INFO"
@@ -15,13 +27,53 @@ class LogLevel(Enum):
     DEBUG = "DEBUG"
 
 
+def _add_column_if_missing(conn, table, column, definition):
+    """ALTER TABLE ... ADD COLUMN for databases created by an older schema"""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def connect_tracking_db():
+    """Open the tracking database, shared by every worker process"""
+    return sqlite3.connect(IP_TRACKING_DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_S)
+
+
 class DatabaseManager:
+    @staticmethod
+    def dataset_version(db_path=DB_PATH):
+        """Identify the current contents of the dataset file by mtime and size"""
+        stat = os.stat(db_path)
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
     @staticmethod
     def init_databases():
-        """Initialize all database tables"""
+        """Initialize all database tables
+
+        Cheap to call on every startup: a database already at SCHEMA_VERSION
+        is detected with a single PRAGMA read and no DDL is executed. Safe to
+        run from several worker processes starting at once.
+        """
         try:
             # Initialize IP tracking DB
-            conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+            conn = connect_tracking_db()
+
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+                conn.close()
+                return True
+
+            # WAL (schema version 3) lets workers read while another writes;
+            # the journal mode is stored in the database file
+            conn.execute("PRAGMA journal_mode = WAL")
+
+            # Take the write lock and check again so that only the first of
+            # several starting workers runs the DDL
+            conn.execute("BEGIN IMMEDIATE")
+            previous_version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if previous_version >= SCHEMA_VERSION:
+                conn.rollback()
+                conn.close()
+                return True
 
             # IP tracking table
             conn.execute(
@@ -29,7 +81,8 @@ class DatabaseManager:
                 CREATE TABLE IF NOT EXISTS ip_tracking (
                     ip_address TEXT PRIMARY KEY,
                     request_count INTEGER,
-                    last_request_date DATE
+                    last_request_date DATE,
+                    token_count INTEGER DEFAULT 0
                 )
             """
             )
@@ -40,11 +93,20 @@ class DatabaseManager:
                 CREATE TABLE IF NOT EXISTS global_counter (
                     counter_id TEXT PRIMARY KEY,
                     total_count INTEGER,
-                    last_date DATE
+                    last_date DATE,
+                    token_count INTEGER DEFAULT 0
                 )
             """
             )
 
+            # Daily token totals were added in schema version 2
+            _add_column_if_missing(
+                conn, "ip_tracking", "token_count", "INTEGER DEFAULT 0"
+            )
+            _add_column_if_missing(
+                conn, "global_counter", "token_count", "INTEGER DEFAULT 0"
+            )
+
             # Query history table
             conn.execute(
                 """
@@ -54,7 +116,10 @@ class DatabaseManager:
                     user_query TEXT,
                     sql_query TEXT,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    success BOOLEAN
+                    success BOOLEAN,
+                    request_id TEXT,
+                    outcome TEXT,
+                    latency_ms REAL
                 )
             """
             )
@@ -82,7 +147,8 @@ class DatabaseManager:
                     message TEXT,
                     source TEXT,
                     ip_address TEXT,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    request_id TEXT
                 )
             """
             )
@@ -94,23 +160,74 @@ class DatabaseManager:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     level TEXT,
                     message TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    request_id TEXT
+                )
+            """
+            )
+
+            # Slow query log table
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS slow_queries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fingerprint TEXT,
+                    normalized_sql TEXT,
+                    user_query TEXT,
+                    duration_ms REAL,
+                    rows_returned INTEGER,
+                    profile TEXT,
                     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             """
             )
 
+            # LLM token usage and latency, one row per LLM answer
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_usage (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ip_address TEXT,
+                    user_query TEXT,
+                    provider TEXT,
+                    prompt_tokens INTEGER,
+                    completion_tokens INTEGER,
+                    total_tokens INTEGER,
+                    latency_ms REAL,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    request_id TEXT,
+                    shared INTEGER DEFAULT 0
+                )
+            """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_usage_timestamp ON llm_usage (timestamp)"
+            )
+
+            # Rows written while serving a request carry its ID (schema version 4)
+            for table in ("query_history", "error_logs", "app_logs", "llm_usage"):
+                _add_column_if_missing(conn, table, "request_id", "TEXT")
+
+            # Outcome and latency of each query, and the hourly and daily
+            # rollups kept from them (schema version 5); rollups start from
+            # whatever history already exists
+            _add_column_if_missing(conn, "query_history", "outcome", "TEXT")
+            _add_column_if_missing(conn, "query_history", "latency_ms", "REAL")
+            analytics.create_rollup_tables(conn)
+            if previous_version < 5:
+                analytics.rebuild_rollups(conn)
+
+            # Answers a request got from another request's coalesced LLM call
+            # are charged to its IP but were not spent again (schema version 6)
+            _add_column_if_missing(conn, "llm_usage", "shared", "INTEGER DEFAULT 0")
+
             # Initialize global counter if it doesn't exist
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT * FROM global_counter WHERE counter_id = 'daily_total'"
+            conn.execute(
+                "INSERT OR IGNORE INTO global_counter (counter_id, total_count, last_date) VALUES (?, ?, ?)",
+                ("daily_total", 0, date.today().isoformat()),
             )
-            if not cursor.fetchone():
-                today = date.today()
-                cursor.execute(
-                    "INSERT INTO global_counter (counter_id, total_count, last_date) VALUES (?, ?, ?)",
-                    ("daily_total", 0, today),
-                )
 
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             conn.commit()
             conn.close()
             print("Database initialization successful")  # Fallback logging
@@ -123,21 +240,23 @@ class DatabaseManager:
 
 class LogManager:
     @staticmethod
-    def log_to_db(level, message, source=None, ip_address=None):
-        """Log an entry to the error_logs table"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+    @timed("logging")
+    def log_to_db(level, message, source=None, ip_address=None, request_id=None):
+        """Log an entry to the error_logs table, tagged with the current request ID"""
+        conn = connect_tracking_db()
         cursor = conn.cursor()
 
         cursor.execute(
             """
-            INSERT INTO error_logs (level, message, source, ip_address)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO error_logs (level, message, source, ip_address, request_id)
+            VALUES (?, ?, ?, ?, ?)
             """,
             (
                 level.value if isinstance(level, LogLevel) else level,
                 message,
                 source,
                 ip_address,
+                request_id or get_request_id(),
             ),
         )
 
@@ -145,35 +264,46 @@ class LogManager:
         conn.close()
 
     @staticmethod
+    @timed("logging")
     def log_app_activity(level, message):
         """Log general application activity"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+        conn = connect_tracking_db()
         cursor = conn.cursor()
 
         cursor.execute(
             """
-            INSERT INTO app_logs (level, message)
-            VALUES (?, ?)
+            INSERT INTO app_logs (level, message, request_id)
+            VALUES (?, ?, ?)
             """,
-            (level.value if isinstance(level, LogLevel) else level, message),
+            (
+                level.value if isinstance(level, LogLevel) else level,
+                message,
+                get_request_id(),
+            ),
         )
 
         conn.commit()
         conn.close()
 
     @staticmethod
-    def get_logs(log_type="error", limit=100, offset=0, level=None):
+    def get_logs(log_type="error", limit=100, offset=0, level=None, request_id=None):
         """Retrieve logs from the database"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+        conn = connect_tracking_db()
         cursor = conn.cursor()
 
         table = "error_logs" if log_type == "error" else "app_logs"
         query = f"SELECT * FROM {table}"
+        conditions = []
         params = []
 
         if level:
-            query += " WHERE level = ?"
+            conditions.append("level = ?")
             params.append(level.value if isinstance(level, LogLevel) else level)
+        if request_id:
+            conditions.append("request_id = ?")
+            params.append(request_id)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
 
         query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
         params.extend([limit, offset])
@@ -200,7 +330,7 @@ class FeedbackManager:
     @staticmethod
     def record_feedback(ip_address, user_query, sql_query, feedback_type):
         """Store user feedback in the database
-        
+
         Args:
             ip_address (str): The user's IP address
             user_query (str): The original natural language query
@@ -208,21 +338,320 @@ class FeedbackManager:
             feedback_type (str): 'positive' or 'negative'
         """
         try:
-            conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+            conn = connect_tracking_db()
             cursor = conn.cursor()
-            
+
             cursor.execute(
                 """
                 INSERT INTO user_feedback 
                 (ip_address, user_query, sql_query, feedback_type)
                 VALUES (?, ?, ?, ?)
                 """,
-                (ip_address, user_query, sql_query, feedback_type)
+                (ip_address, user_query, sql_query, feedback_type),
             )
-            
+            analytics.record_feedback(conn, user_query, sql_query, feedback_type)
+
             conn.commit()
             conn.close()
             return True
         except Exception as e:
             print(f"Error recording feedback: {str(e)}")
             return False
+
+
+class SlowQueryManager:
+    @staticmethod
+    @timed("logging")
+    def record_slow_query(
+        fingerprint, normalized_sql, user_query, duration_ms, rows_returned, profile
+    ):
+        """Store a query that exceeded the slow query threshold
+
+        Args:
+            fingerprint (str): Query shape with literals replaced by placeholders
+            normalized_sql (str): The executed SQL with whitespace normalized
+            user_query (str): The natural language question that produced it
+            duration_ms (float): Execution time in milliseconds
+            rows_returned (int): Number of rows in the result
+            profile (dict): DuckDB operator profile, or None if unavailable
+        """
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            INSERT INTO slow_queries
+            (fingerprint, normalized_sql, user_query, duration_ms, rows_returned, profile)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                fingerprint,
+                normalized_sql,
+                user_query,
+                duration_ms,
+                rows_returned,
+                json.dumps(profile) if profile is not None else None,
+            ),
+        )
+
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def get_slow_queries(limit=100, offset=0, min_duration_ms=None, fingerprint=None):
+        """Retrieve slow queries, slowest first"""
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        query = "SELECT * FROM slow_queries"
+        conditions = []
+        params = []
+
+        if min_duration_ms is not None:
+            conditions.append("duration_ms >= ?")
+            params.append(min_duration_ms)
+        if fingerprint:
+            conditions.append("fingerprint = ?")
+            params.append(fingerprint)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+
+        query += " ORDER BY duration_ms DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+
+        cursor.execute(query, params)
+        column_names = [description[0] for description in cursor.description]
+        entries = []
+        for row in cursor.fetchall():
+            entry = dict(zip(column_names, row))
+            if entry["profile"]:
+                entry["profile"] = json.loads(entry["profile"])
+            entries.append(entry)
+
+        conn.close()
+        return entries
+
+    @staticmethod
+    def get_slow_query_shapes(limit=50):
+        """Aggregate slow queries by fingerprint to show which shapes recur"""
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT fingerprint,
+                   COUNT(*) AS occurrences,
+                   AVG(duration_ms) AS avg_duration_ms,
+                   MAX(duration_ms) AS max_duration_ms,
+                   MAX(timestamp) AS last_seen,
+                   MAX(user_query) AS sample_question
+            FROM slow_queries
+            GROUP BY fingerprint
+            ORDER BY occurrences * avg_duration_ms DESC
+            LIMIT ?
+            """,
+            (limit,),
+        )
+        column_names = [description[0] for description in cursor.description]
+        shapes = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return shapes
+
+
+class UsageManager:
+    @staticmethod
+    def get_usage_by_hour(hours=24):
+        """Token and latency totals per hour for the last `hours` hours
+
+        Shared answers are left out, so the totals are what was actually spent.
+        """
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT strftime('%Y-%m-%d %H:00', timestamp) AS hour,
+                   COUNT(*) AS requests,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(total_tokens) AS total_tokens,
+                   AVG(latency_ms) AS avg_latency_ms,
+                   MAX(latency_ms) AS max_latency_ms
+            FROM llm_usage
+            WHERE timestamp >= datetime('now', ?) AND shared = 0
+            GROUP BY hour
+            ORDER BY hour DESC
+            """,
+            (f"-{int(hours)} hours",),
+        )
+        column_names = [description[0] for description in cursor.description]
+        rows = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return rows
+
+    @staticmethod
+    def get_usage_by_ip(hours=24, limit=50):
+        """Token and latency totals per IP for the last `hours` hours, heaviest first
+
+        Totals include shared answers, so they are what each IP was charged.
+        """
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT ip_address,
+                   COUNT(*) AS requests,
+                   SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens,
+                   SUM(total_tokens) AS total_tokens,
+                   AVG(latency_ms) AS avg_latency_ms,
+                   MAX(latency_ms) AS max_latency_ms,
+                   SUM(shared) AS shared_requests
+            FROM llm_usage
+            WHERE timestamp >= datetime('now', ?)
+            GROUP BY ip_address
+            ORDER BY total_tokens DESC
+            LIMIT ?
+            """,
+            (f"-{int(hours)} hours", limit),
+        )
+        column_names = [description[0] for description in cursor.description]
+        rows = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return rows
+
+
+class AnalyticsManager:
+    """Reads of the rollups maintained by models.analytics"""
+
+    @staticmethod
+    def get_summary(granularity="hour", periods=24):
+        """Requests, success rate, outcomes and latency percentiles per period
+
+        Covers the last `periods` hours or days, newest first, plus totals
+        over the whole window with latency broken down by outcome.
+        """
+        since = analytics.first_period(granularity, periods)
+        conn = connect_tracking_db()
+
+        outcome_rows = conn.execute(
+            """
+            SELECT period, outcome, count FROM analytics_outcomes
+            WHERE granularity = ? AND period >= ?
+            """,
+            (granularity, since),
+        ).fetchall()
+        latency_rows = conn.execute(
+            """
+            SELECT period, outcome, bucket, count FROM analytics_latency
+            WHERE granularity = ? AND period >= ?
+            """,
+            (granularity, since),
+        ).fetchall()
+        conn.close()
+
+        by_period = {}
+        total_outcomes = {}
+        for period, outcome, count in outcome_rows:
+            outcomes = by_period.setdefault(period, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+            total_outcomes[outcome] = total_outcomes.get(outcome, 0) + count
+
+        period_latency = {}
+        outcome_latency = {}
+        for period, outcome, bucket, count in latency_rows:
+            period_latency.setdefault(period, []).append((bucket, count))
+            outcome_latency.setdefault(outcome, []).append((bucket, count))
+
+        def rollup(outcomes, buckets):
+            requests = sum(outcomes.values())
+            return {
+                "requests": requests,
+                "success_rate": (
+                    round(outcomes.get("success", 0) / requests, 4)
+                    if requests
+                    else None
+                ),
+                "outcomes": outcomes,
+                "latency_ms": analytics.latency_percentiles(buckets),
+            }
+
+        return {
+            "granularity": granularity,
+            "since": since,
+            "periods": [
+                {"period": period, **rollup(outcomes, period_latency.get(period, []))}
+                for period, outcomes in sorted(by_period.items(), reverse=True)
+            ],
+            "totals": {
+                **rollup(
+                    total_outcomes,
+                    [pair for pairs in outcome_latency.values() for pair in pairs],
+                ),
+                "latency_ms_by_outcome": {
+                    outcome: analytics.latency_percentiles(buckets)
+                    for outcome, buckets in outcome_latency.items()
+                },
+            },
+        }
+
+    @staticmethod
+    def get_top_questions(granularity="day", periods=7, limit=20):
+        """Most asked normalized questions over the window
+
+        count may overestimate by up to error when a question was not
+        tracked for the whole of a period.
+        """
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT question, SUM(count) AS count, SUM(error) AS error
+            FROM analytics_top_questions
+            WHERE granularity = ? AND period >= ?
+            GROUP BY question
+            ORDER BY count DESC
+            LIMIT ?
+            """,
+            (granularity, analytics.first_period(granularity, periods), limit),
+        )
+        column_names = [description[0] for description in cursor.description]
+        rows = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
+        conn.close()
+        return rows
+
+    @staticmethod
+    def get_feedback_by_shape(granularity="day", periods=30, limit=20):
+        """Positive and negative feedback per SQL fingerprint, most rated first"""
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            SELECT fingerprint,
+                   SUM(positive) AS positive,
+                   SUM(negative) AS negative,
+                   MAX(sample_question) AS sample_question
+            FROM analytics_feedback
+            WHERE granularity = ? AND period >= ?
+            GROUP BY fingerprint
+            ORDER BY SUM(positive) + SUM(negative) DESC
+            LIMIT ?
+            """,
+            (granularity, analytics.first_period(granularity, periods), limit),
+        )
+        column_names = [description[0] for description in cursor.description]
+        rows = [dict(zip(column_names, row)) for row in cursor.fetchall()]
+        for row in rows:
+            row["positive_ratio"] = round(
+                row["positive"] / (row["positive"] + row["negative"]), 4
+            )
+
+        conn.close()
+        return rows
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Form
+from fastapi import APIRouter, Request, Form, Query
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from utils.logger import logger
@@ -39,6 +39,58 @@ async def echo(request: Request, message: str = Form(None), body: EchoRequest =
 
 
 @router.get("/health")
-async def health_check():
-    """Simple health check endpoint"""
-    return {"status": "healthy"}
+async def health_check(request: Request):
+    """Health check; 503 while startup cache prewarming is still running"""
+    prewarmer = getattr(request.app.state, "prewarmer", None)
+    if prewarmer is not None and not prewarmer.done.is_set():
+        return JSONResponse(
+            status_code=503, content={"status": "warming", "prewarm": prewarmer.report}
+        )
+    return {
+        "status": "healthy",
+        "prewarm": prewarmer.report if prewarmer is not None else None,
+    }
+
+
+@router.get("/admission")
+async def admission_status(request: Request):
+    """Slots in use, queue length and service time estimate of admission control"""
+    admission = getattr(request.app.state, "admission", None)
+    return admission.status() if admission is not None else {}
+
+
+@router.get("/startup")
+async def startup_report(request: Request):
+    """Report how long this worker took to import and initialize"""
+    return getattr(request.app.state, "startup_report", {})
+
+
+@router.get("/llm")
+async def llm_status(request: Request):
+    """Latency percentiles, hedge delay and circuit state of each LLM provider"""
+    return {"providers": request.app.state.sql_generator.llm.status()}
+
+
+@router.get("/examples")
+async def few_shot_examples(request: Request, q: str = Query(...)):
+    """Show which few-shot examples would be sent to the LLM for a question"""
+    retriever = request.app.state.example_retriever
+    if retriever is None:
+        return {"enabled": False, "examples": []}
+    return {
+        "enabled": True,
+        "indexed": len(retriever),
+        "examples": retriever.retrieve(q),
+    }
+
+
+@router.get("/dataset")
+async def dataset_status(request: Request):
+    """Published and active dataset versions, open generations and snapshots"""
+    return request.app.state.sql_generator.engine.status()
+
+
+@router.get("/resources")
+def resource_status(request: Request):
+    """DuckDB resource policy, query slots in use, memory and spill usage"""
+    return request.app.state.sql_generator.engine.resource_status()
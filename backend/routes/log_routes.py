@@ -1,7 +1,13 @@
 from fastapi import APIRouter, Query, HTTPException
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel
-from models.db_models import LogManager, LogLevel
+from models.db_models import (
+    AnalyticsManager,
+    LogManager,
+    LogLevel,
+    SlowQueryManager,
+    UsageManager,
+)
 from utils.logger import logger
 
 router = APIRouter(prefix="/logs", tags=["logs"])
@@ -14,6 +20,7 @@ class LogEntry(BaseModel):
     timestamp: str
     source: Optional[str] = None
     ip_address: Optional[str] = None
+    request_id: Optional[str] = None
 
 
 class LogResponse(BaseModel):
@@ -23,13 +30,120 @@ class LogResponse(BaseModel):
     per_page: int
 
 
+class SlowQueryEntry(BaseModel):
+    id: int
+    fingerprint: str
+    normalized_sql: str
+    user_query: Optional[str] = None
+    duration_ms: float
+    rows_returned: int
+    profile: Optional[Dict[str, Any]] = None
+    timestamp: str
+
+
+class SlowQueryResponse(BaseModel):
+    queries: List[SlowQueryEntry]
+    total: int
+    page: int
+    per_page: int
+
+
+class SlowQueryShape(BaseModel):
+    fingerprint: str
+    occurrences: int
+    avg_duration_ms: float
+    max_duration_ms: float
+    last_seen: str
+    sample_question: Optional[str] = None
+
+
+class SlowQueryShapesResponse(BaseModel):
+    shapes: List[SlowQueryShape]
+
+
+class UsageRollup(BaseModel):
+    requests: int
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    avg_latency_ms: float
+    max_latency_ms: float
+
+
+class HourlyUsage(UsageRollup):
+    hour: str
+
+
+class IPUsage(UsageRollup):
+    ip_address: Optional[str] = None
+    # Answers taken from another request's identical, in-flight LLM call
+    shared_requests: int = 0
+
+
+class UsageResponse(BaseModel):
+    hours: int
+    by_hour: List[HourlyUsage]
+    by_ip: List[IPUsage]
+
+
+class LatencyPercentiles(BaseModel):
+    p50: Optional[float] = None
+    p95: Optional[float] = None
+    p99: Optional[float] = None
+
+
+class AnalyticsRollup(BaseModel):
+    requests: int
+    success_rate: Optional[float] = None
+    outcomes: Dict[str, int]
+    latency_ms: LatencyPercentiles
+
+
+class PeriodAnalytics(AnalyticsRollup):
+    period: str
+
+
+class AnalyticsTotals(AnalyticsRollup):
+    latency_ms_by_outcome: Dict[str, LatencyPercentiles]
+
+
+class AnalyticsResponse(BaseModel):
+    granularity: str
+    since: str
+    periods: List[PeriodAnalytics]
+    totals: AnalyticsTotals
+
+
+class TopQuestion(BaseModel):
+    question: str
+    count: int
+    error: int
+
+
+class TopQuestionsResponse(BaseModel):
+    questions: List[TopQuestion]
+
+
+class FeedbackShape(BaseModel):
+    fingerprint: str
+    positive: int
+    negative: int
+    positive_ratio: float
+    sample_question: Optional[str] = None
+
+
+class FeedbackShapesResponse(BaseModel):
+    shapes: List[FeedbackShape]
+
+
 @router.get("/error", response_model=LogResponse)
 async def get_error_logs(
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=100),
     level: Optional[str] = None,
+    request_id: Optional[str] = None,
 ):
-    """Get error logs from the database"""
+    """Get error logs from the database, optionally those of one request"""
     try:
         # Convert level string to enum if provided
         level_enum = None
@@ -46,7 +160,11 @@ async def get_error_logs(
 
         # Get logs
         logs = LogManager.get_logs(
-            log_type="error", limit=per_page, offset=offset, level=level_enum
+            log_type="error",
+            limit=per_page,
+            offset=offset,
+            level=level_enum,
+            request_id=request_id,
         )
 
         # Log the request
@@ -68,8 +186,9 @@ async def get_app_logs(
     page: int = Query(1, ge=1),
     per_page: int = Query(50, ge=1, le=100),
     level: Optional[str] = None,
+    request_id: Optional[str] = None,
 ):
-    """Get application logs from the database"""
+    """Get application logs from the database, optionally those of one request"""
     try:
         # Convert level string to enum if provided
         level_enum = None
@@ -86,7 +205,11 @@ async def get_app_logs(
 
         # Get logs
         logs = LogManager.get_logs(
-            log_type="app", limit=per_page, offset=offset, level=level_enum
+            log_type="app",
+            limit=per_page,
+            offset=offset,
+            level=level_enum,
+            request_id=request_id,
         )
 
         # Log the request
@@ -101,3 +224,117 @@ async def get_app_logs(
     except Exception as e:
         logger.error(f"Error retrieving logs: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/slow", response_model=SlowQueryResponse)
+async def get_slow_queries(
+    page: int = Query(1, ge=1),
+    per_page: int = Query(50, ge=1, le=100),
+    min_duration_ms: Optional[float] = Query(None, ge=0),
+    fingerprint: Optional[str] = None,
+    include_profile: bool = True,
+):
+    """Get slow query log entries with their DuckDB profiles, slowest first"""
+    try:
+        offset = (page - 1) * per_page
+
+        queries = SlowQueryManager.get_slow_queries(
+            limit=per_page,
+            offset=offset,
+            min_duration_ms=min_duration_ms,
+            fingerprint=fingerprint,
+        )
+        if not include_profile:
+            for entry in queries:
+                entry["profile"] = None
+
+        logger.info(f"Retrieved {len(queries)} slow queries")
+
+        return SlowQueryResponse(
+            queries=queries,
+            total=len(queries),
+            page=page,
+            per_page=per_page,
+        )
+    except Exception as e:
+        logger.error(f"Error retrieving slow queries: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/slow/shapes", response_model=SlowQueryShapesResponse)
+async def get_slow_query_shapes(limit: int = Query(20, ge=1, le=100)):
+    """Group slow queries by shape, ranked by total time spent"""
+    try:
+        shapes = SlowQueryManager.get_slow_query_shapes(limit=limit)
+        logger.info(f"Retrieved {len(shapes)} slow query shapes")
+        return SlowQueryShapesResponse(shapes=shapes)
+    except Exception as e:
+        logger.error(f"Error retrieving slow query shapes: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/usage", response_model=UsageResponse)
+async def get_llm_usage(
+    hours: int = Query(24, ge=1, le=24 * 31),
+    ip_limit: int = Query(20, ge=1, le=100),
+):
+    """LLM token usage and latency rolled up by hour and by IP"""
+    try:
+        by_hour = UsageManager.get_usage_by_hour(hours=hours)
+        by_ip = UsageManager.get_usage_by_ip(hours=hours, limit=ip_limit)
+        logger.info(f"Retrieved LLM usage for the last {hours} hours")
+        return UsageResponse(hours=hours, by_hour=by_hour, by_ip=by_ip)
+    except Exception as e:
+        logger.error(f"Error retrieving LLM usage: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics", response_model=AnalyticsResponse)
+async def get_analytics(
+    granularity: Literal["hour", "day"] = "hour",
+    periods: int = Query(24, ge=1, le=24 * 31),
+):
+    """Requests, success rate, outcomes and latency percentiles per hour or day"""
+    try:
+        summary = AnalyticsManager.get_summary(granularity=granularity, periods=periods)
+        logger.info(f"Retrieved analytics for the last {periods} {granularity}s")
+        return summary
+    except Exception as e:
+        logger.error(f"Error retrieving analytics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/questions", response_model=TopQuestionsResponse)
+async def get_top_questions(
+    granularity: Literal["hour", "day"] = "day",
+    periods: int = Query(7, ge=1, le=24 * 31),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Most asked questions (normalized), from the heavy-hitter summaries"""
+    try:
+        questions = AnalyticsManager.get_top_questions(
+            granularity=granularity, periods=periods, limit=limit
+        )
+        logger.info(f"Retrieved {len(questions)} top questions")
+        return TopQuestionsResponse(questions=questions)
+    except Exception as e:
+        logger.error(f"Error retrieving top questions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/analytics/feedback", response_model=FeedbackShapesResponse)
+async def get_feedback_by_shape(
+    granularity: Literal["hour", "day"] = "day",
+    periods: int = Query(30, ge=1, le=24 * 31),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """Positive and negative feedback per SQL shape, most rated first"""
+    try:
+        shapes = AnalyticsManager.get_feedback_by_shape(
+            granularity=granularity, periods=periods, limit=limit
+        )
+        logger.info(f"Retrieved feedback for {len(shapes)} query shapes")
+        return FeedbackShapesResponse(shapes=shapes)
+    except Exception as e:
+        logger.error(f"Error retrieving feedback by shape: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
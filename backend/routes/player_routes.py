@@ -0,0 +1,90 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from utils.http_cache import etag_matches, weak_etag
+from utils.logger import logger
+
+router = APIRouter(prefix="/players", tags=["players"])
+
+# Stats only change when a new dataset is loaded, which changes the ETag
+CACHE_CONTROL = "public, max-age=300"
+
+
+def _not_modified(request: Request, response: Response, etag: str):
+    """A 304 if the client's copy is current, else None after setting the headers"""
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+@router.get("/")
+def list_players(request: Request, response: Response):
+    """Every player with per-over stats, for the player picker"""
+    engine = request.app.state.sql_generator.engine
+    not_modified = _not_modified(
+        request, response, weak_etag(engine.dataset_version(), "players")
+    )
+    if not_modified:
+        return not_modified
+
+    with engine.cursor() as (con, _):
+        rows = con.execute(
+            "SELECT DISTINCT player_id, player_name FROM player_over_stats ORDER BY player_name"
+        ).fetchall()
+    return {
+        "players": [
+            {"player_id": player_id, "player_name": player_name}
+            for player_id, player_name in rows
+        ]
+    }
+
+
+@router.get("/{player_id}/over_stats")
+def player_over_stats(player_id: str, request: Request, response: Response):
+    """Runs per over batted (min, max and average) and wickets per over bowled
+
+    Overs are 0-based, as in the dataset.
+    """
+    engine = request.app.state.sql_generator.engine
+    not_modified = _not_modified(
+        request,
+        response,
+        weak_etag(engine.dataset_version(), "over_stats", player_id),
+    )
+    if not_modified:
+        return not_modified
+
+    with engine.cursor() as (con, _):
+        rows = con.execute(
+            """
+            SELECT player_name, over, innings_batted, min_runs, max_runs, avg_runs, wickets
+            FROM player_over_stats
+            WHERE player_id = ?
+            ORDER BY over
+            """,
+            [player_id],
+        ).fetchall()
+    if not rows:
+        logger.warning(f"Over stats requested for unknown player: {player_id}")
+        raise HTTPException(status_code=404, detail="Player not found")
+
+    return {
+        "player_id": player_id,
+        "player_name": rows[0][0],
+        "batting": [
+            {
+                "over": over,
+                "innings": innings,
+                "min_runs": min_runs,
+                "max_runs": max_runs,
+                "avg_runs": round(avg_runs, 2),
+            }
+            for _, over, innings, min_runs, max_runs, avg_runs, _ in rows
+            if innings
+        ],
+        "bowling": [
+            {"over": over, "total_wickets": wickets}
+            for _, over, _, _, _, _, wickets in rows
+            if wickets
+        ],
+    }
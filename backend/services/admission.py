@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from utils.metrics import ADMISSION_DECISIONS, stage
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted before its deadline"""
+
+    def __init__(self, reason: str, retry_after_s: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_s = retry_after_s
+
+
+def seconds_until_tomorrow() -> int:
+    """Seconds until the daily quotas reset (they are keyed by local date)"""
+    tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+    return max(1, math.ceil((tomorrow - datetime.now()).total_seconds()))
+
+
+class AdmissionController:
+    """
+    Admission control for the LLM-bound request path.
+
+    At most max_concurrency requests run at once; the rest wait in a bounded
+    queue ordered by priority, which is the number of requests the same IP
+    already has running or waiting (fewest first, then arrival order), so one
+    busy client cannot starve the others. A request whose estimated queue
+    time plus the EWMA of recent service times already exceeds its deadline is
+    rejected straight away rather than left to time out, and a full queue
+    drops whichever waiter has the worst priority. Admitted requests therefore
+    finish in about deadline_s at worst, however many arrive.
+
+    IPs found over their daily quota (and the whole service, once a global
+    limit is hit) are remembered until the quotas reset, so their requests
+    are turned away before the body is parsed or a database is touched. The
+    memory is per worker; each worker learns from its own first rejection.
+
+    All callers must be on the same event loop, which holds for one worker.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        max_queue: int = 64,
+        deadline_s: float = 20.0,
+        ewma_alpha: float = 0.2,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.deadline_s = deadline_s
+        self.ewma_alpha = ewma_alpha
+        self.service_time_s = None
+        self._active = 0
+        self._queue = []
+        self._waiting = 0
+        self._per_ip = Counter()
+        self._sequence = itertools.count()
+        self._exhausted_ips = {}
+        self._global_exhausted_on = None
+
+    @classmethod
+    def from_env(cls):
+        """Configured by ADMISSION_MAX_CONCURRENCY (0 disables queueing),
+        ADMISSION_MAX_QUEUE and ADMISSION_DEADLINE_S"""
+        return cls(
+            max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32")),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+            deadline_s=float(os.getenv("ADMISSION_DEADLINE_S", "20")),
+        )
+
+    # Quota short-circuit
+
+    def mark_exhausted(self, ip_address: str = None):
+        """Remember that ip_address (or the whole service, if None) is over quota today"""
+        today = date.today()
+        if ip_address is None:
+            self._global_exhausted_on = today
+        else:
+            self._exhausted_ips[ip_address] = today
+
+    def exhausted(self, ip_address: str) -> str:
+        """'global' or 'ip' if requests from ip_address are known to be over quota, else None"""
+        today = date.today()
+        if self._global_exhausted_on == today:
+            return "global"
+        exhausted_on = self._exhausted_ips.get(ip_address)
+        if exhausted_on is None:
+            return None
+        if exhausted_on != today:
+            # Quotas have reset; forget every stale entry at once
+            self._exhausted_ips = {
+                ip: day for ip, day in self._exhausted_ips.items() if day == today
+            }
+            return None
+        return "ip"
+
+    # Concurrency and queueing
+
+    def estimated_wait_s(self, ahead: int) -> float:
+        """Expected queue time behind ahead waiters with every slot busy"""
+        if self.service_time_s is None:
+            return 0.0
+        return (ahead + 1) * self.service_time_s / self.max_concurrency
+
+    @asynccontextmanager
+    async def slot(self, ip_address: str):
+        """Hold one of the max_concurrency slots for the duration of the block
+
+        Raises Overloaded if no slot can be had before the deadline.
+        """
+        if self.max_concurrency <= 0:
+            yield
+            return
+
+        with stage("admission_wait"):
+            await self._acquire(ip_address)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(ip_address, time.perf_counter() - start)
+
+    async def _acquire(self, ip_address: str):
+        if self._active < self.max_concurrency and not self._waiting:
+            self._active += 1
+            self._per_ip[ip_address] += 1
+            ADMISSION_DECISIONS.inc(decision="admitted")
+            return
+
+        # The deadline covers queueing and serving, so leave room for the latter
+        queue_budget_s = self.deadline_s - (self.service_time_s or 0.0)
+        priority = self._per_ip[ip_address]
+        ahead = sum(
+            1 for entry in self._queue if entry[0] <= priority and not entry[2].done()
+        )
+        wait_s = self.estimated_wait_s(ahead)
+        if wait_s > queue_budget_s:
+            ADMISSION_DECISIONS.inc(decision="rejected_deadline")
+            raise Overloaded("deadline", wait_s)
+
+        if self._waiting >= self.max_queue:
+            worst = max(
+                (entry for entry in self._queue if not entry[2].done()), default=None
+            )
+            if worst is None or worst[0] <= priority:
+                ADMISSION_DECISIONS.inc(decision="rejected_queue_full")
+                raise Overloaded("queue_full", wait_s)
+            worst[2].set_exception(Overloaded("evicted", wait_s))
+            self._waiting -= 1
+            ADMISSION_DECISIONS.inc(decision="evicted")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), future))
+        self._waiting += 1
+        self._per_ip[ip_address] += 1
+        try:
+            await asyncio.wait_for(future, timeout=queue_budget_s)
+        except BaseException as e:
+            self._forget(ip_address)
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # A slot was handed over just as we gave up; pass it on
+                self._hand_over()
+            elif not isinstance(e, Overloaded):
+                # Evicted waiters were already taken off the count
+                self._waiting -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                ADMISSION_DECISIONS.inc(decision="timed_out")
+                raise Overloaded("deadline", self.estimated_wait_s(self._waiting))
+            raise
+        ADMISSION_DECISIONS.inc(decision="queued")
+
+    def _release(self, ip_address: str, elapsed_s: float):
+        self._forget(ip_address)
+        if self.service_time_s is None:
+            self.service_time_s = elapsed_s
+        else:
+            self.service_time_s += self.ewma_alpha * (elapsed_s - self.service_time_s)
+        self._hand_over()
+
+    def _hand_over(self):
+        """Give a finished request's slot straight to the best live waiter"""
+        while self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if not future.done():
+                future.set_result(True)
+                self._waiting -= 1
+                return
+        self._active -= 1
+
+    def _forget(self, ip_address: str):
+        self._per_ip[ip_address] -= 1
+        if self._per_ip[ip_address] <= 0:
+            del self._per_ip[ip_address]
+
+    def status(self) -> dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "deadline_s": self.deadline_s,
+            "service_time_ms": (
+                round(self.service_time_s * 1000, 1)
+                if self.service_time_s is not None
+                else None
+            ),
+            "exhausted_ips": sum(
+                1 for day in self._exhausted_ips.values() if day == date.today()
+            ),
+            "global_exhausted": self._global_exhausted_on == date.today(),
+        }
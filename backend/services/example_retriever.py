@@ -0,0 +1,294 @@
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from models.db_models import connect_tracking_db
+from utils.logger import logger
+from utils.metrics import stage
+from utils.normalize import normalize_sql
+
+EXAMPLES_HEADING = "## Example Queries"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STATIC_EXAMPLE = re.compile(
+    r'\*Request\*:\s*"(?P<question>[^"]+)"\s*\n\*Response\*?:\s*(?P<response>\{.*\})'
+)
+_STOPWORDS = set(
+    "a an and are by did do does for has have how in is it me of on show the "
+    "to was what which who with".split()
+)
+
+# Where an example came from, in the order one replaces another for the same question
+_SOURCE_RANK = {"prompt": 0, "history": 1, "feedback": 2}
+
+
+def _tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def _question_key(question: str) -> str:
+    return " ".join(question.lower().split()).rstrip("?. ")
+
+
+def split_examples_section(system_prompt: str):
+    """
+    Split the prompt around its example section.
+
+    Returns (before, examples_text, after); examples_text is empty when the
+    prompt has no "## Example Queries" heading.
+    """
+    start = system_prompt.find(EXAMPLES_HEADING)
+    if start == -1:
+        return system_prompt, "", ""
+    end = system_prompt.find("\n## ", start + len(EXAMPLES_HEADING))
+    if end == -1:
+        end = len(system_prompt)
+    return system_prompt[:start], system_prompt[start:end], system_prompt[end:]
+
+
+def parse_static_examples(examples_text: str) -> list:
+    """Extract (question, sql) pairs from the prompt's example section"""
+    pairs = []
+    for match in _STATIC_EXAMPLE.finditer(examples_text):
+        try:
+            sql_query = json.loads(match.group("response"))["sql_query"]
+        except (ValueError, KeyError):
+            continue
+        pairs.append((match.group("question"), sql_query))
+    return pairs
+
+
+class BM25Index:
+    """
+    Okapi BM25 over short documents, updated in place. Adding or removing a
+    document only touches that document's postings, so the index grows with
+    the query history without ever being rebuilt.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> {doc_id: term frequency}
+        self._doc_terms = {}  # doc_id -> distinct terms, for removal
+        self._lengths = {}  # doc_id -> number of tokens
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, doc_id, text: str):
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        tokens = _tokenize(text)
+        frequencies = Counter(tokens)
+        for term, freq in frequencies.items():
+            self._postings.setdefault(term, {})[doc_id] = freq
+        self._doc_terms[doc_id] = set(frequencies)
+        self._lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+
+    def remove(self, doc_id):
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, text: str, k: int) -> list:
+        """Return up to k (doc_id, score) pairs, best first"""
+        if not self._lengths:
+            return []
+        doc_count = len(self._lengths)
+        avg_length = self._total_length / doc_count or 1
+        scores = {}
+        for term in set(_tokenize(text)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for doc_id, freq in postings.items():
+                norm = self.k1 * (
+                    1 - self.b + self.b * self._lengths[doc_id] / avg_length
+                )
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (
+                    self.k1 + 1
+                ) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class ExampleRetriever:
+    """
+    Picks the few-shot examples for each question instead of sending the
+    prompt's fixed set.
+
+    Candidates are the prompt's own examples plus verified pairs from the
+    tracking database: successful queries from query_history and pairs with
+    positive user_feedback. A pair that received negative feedback is never
+    used. New rows are picked up incrementally by id, at most once every
+    refresh_interval_s seconds, starting with the first retrieval.
+
+    With an engine, a pair from the tracking database is only indexed if
+    DuckDB can plan its SQL against the dataset being served: history written
+    before a schema change would otherwise teach the model tables and columns
+    that no longer exist.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        k: int = 4,
+        refresh_interval_s: float = 5,
+        engine=None,
+    ):
+        self.k = k
+        self.refresh_interval_s = refresh_interval_s
+        self.engine = engine
+        self._before, examples_text, self._after = split_examples_section(system_prompt)
+        self._index = BM25Index()
+        self._examples = {}  # question key -> {"question", "sql_query", "source"}
+        self._rejected = set()  # (question key, normalized sql) with negative feedback
+        self._last_history_id = 0
+        self._last_feedback_id = 0
+        self._last_refresh = 0.0
+        self._lock = threading.Lock()
+
+        for question, sql_query in parse_static_examples(examples_text):
+            self._add(question, sql_query, "prompt")
+
+    def __len__(self):
+        return len(self._examples)
+
+    def _add(self, question, sql_query, source):
+        if not question or not sql_query or sql_query.startswith("ERROR:"):
+            return
+        key = _question_key(question)
+        if (key, normalize_sql(sql_query)) in self._rejected:
+            return
+        existing = self._examples.get(key)
+        if existing and _SOURCE_RANK[existing["source"]] > _SOURCE_RANK[source]:
+            return
+        self._examples[key] = {
+            "question": question.strip(),
+            "sql_query": sql_query,
+            "source": source,
+        }
+        if not existing:
+            self._index.add(key, question)
+
+    def _reject(self, question, sql_query):
+        key = _question_key(question)
+        self._rejected.add((key, normalize_sql(sql_query)))
+        existing = self._examples.get(key)
+        if existing and normalize_sql(existing["sql_query"]) == normalize_sql(
+            sql_query
+        ):
+            del self._examples[key]
+            self._index.remove(key)
+
+    def _runnable(self, sql_queries: list) -> set:
+        """The queries DuckDB can still plan against the served dataset
+
+        Failing to reach the engine raises, so the rows are retried on the
+        next refresh instead of being skipped for good.
+        """
+        sql_queries = {
+            sql for sql in sql_queries if sql and not sql.startswith("ERROR:")
+        }
+        if self.engine is None or not sql_queries:
+            return sql_queries
+        runnable = set()
+        with self.engine.cursor() as (con, _):
+            for sql_query in sql_queries:
+                try:
+                    con.execute(f"EXPLAIN {sql_query}")
+                except Exception:
+                    continue
+                runnable.add(sql_query)
+        skipped = len(sql_queries) - len(runnable)
+        if skipped:
+            logger.info(f"Skipped {skipped} few-shot examples that no longer plan")
+        return runnable
+
+    def refresh(self, force: bool = False):
+        """Index history and feedback rows added since the last refresh"""
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval_s:
+            return
+        with self._lock:
+            if not force and now - self._last_refresh < self.refresh_interval_s:
+                return
+            self._last_refresh = now
+            try:
+                conn = connect_tracking_db()
+                history = conn.execute(
+                    """
+                    SELECT id, user_query, sql_query FROM query_history
+                    WHERE id > ? AND success = 1 ORDER BY id
+                    """,
+                    (self._last_history_id,),
+                ).fetchall()
+                feedback = conn.execute(
+                    """
+                    SELECT id, user_query, sql_query, feedback_type FROM user_feedback
+                    WHERE id > ? ORDER BY id
+                    """,
+                    (self._last_feedback_id,),
+                ).fetchall()
+                conn.close()
+                candidates = [sql for _, _, sql in history] + [
+                    sql for _, _, sql, kind in feedback if kind == "positive"
+                ]
+                runnable = self._runnable(candidates)
+            except Exception as e:
+                logger.error(f"Error refreshing few-shot examples: {str(e)}")
+                return
+
+            for row_id, question, sql_query in history:
+                if sql_query in runnable:
+                    self._add(question, sql_query, "history")
+                self._last_history_id = row_id
+            for row_id, question, sql_query, feedback_type in feedback:
+                if feedback_type == "negative":
+                    self._reject(question, sql_query)
+                elif feedback_type == "positive" and sql_query in runnable:
+                    self._add(question, sql_query, "feedback")
+                self._last_feedback_id = row_id
+
+            if history or feedback:
+                logger.info(
+                    f"Few-shot index refreshed: {len(history)} history and "
+                    f"{len(feedback)} feedback rows, {len(self._examples)} examples"
+                )
+
+    def retrieve(self, user_query: str, k: int = None) -> list:
+        """Return the k indexed examples most similar to user_query"""
+        self.refresh()
+        k = self.k if k is None else k
+        with self._lock:
+            return [
+                dict(self._examples[key], score=round(score, 3))
+                for key, score in self._index.search(user_query, k)
+            ]
+
+    def prompt_for(self, user_query: str) -> str:
+        """System prompt with the example section replaced by retrieved examples"""
+        with stage("retrieval"):
+            examples = self.retrieve(user_query)
+        if not examples:
+            return self._before + self._after
+        section = [EXAMPLES_HEADING, ""]
+        for example in examples:
+            section.append(f'*Request*: "{example["question"]}"')
+            section.append(
+                "*Response*: " + json.dumps({"sql_query": example["sql_query"]})
+            )
+            section.append("")
+        return self._before + "\n".join(section) + self._after
@@ -1,105 +1,92 @@
-import sqlite3
+import os
 from datetime import datetime, date
-from models.db_models import IP_TRACKING_DB_PATH
+from models import analytics
+from models.db_models import connect_tracking_db
 from utils.logger import logger
+from utils.metrics import LLM_TOKENS, request_elapsed_s, timed
+from utils.request_context import get_request_id
 
 # Request limits
 MAX_DAILY_REQUESTS_PER_IP = 5
 MAX_TOTAL_DAILY_REQUESTS = 5000
 
 
+def _token_budget(name: str) -> int:
+    # Read on every check so .env values loaded after import still apply; 0 = no limit
+    return int(os.getenv(name, "0"))
+
+
 class IPTracker:
     @staticmethod
+    @timed("quota")
     def check_ip_limit(ip_address: str) -> bool:
         """
         Check if an IP address has exceeded the daily request limit
         Returns True if the IP is allowed to make a request, False otherwise
-        """
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
-        cursor = conn.cursor()
-
-        # Check if IP exists in tracking table
-        cursor.execute(
-            "SELECT request_count, last_request_date FROM ip_tracking WHERE ip_address = ?",
-            (ip_address,),
-        )
-        result = cursor.fetchone()
 
-        today = date.today()
+        The IP's and the global counters are each checked and incremented by a
+        single UPSERT ... RETURNING statement inside one write transaction, so
+        concurrent requests in several worker processes can neither both take
+        the last request of a quota nor count a request the other rejected.
+        """
+        today = date.today().isoformat()
+        conn = connect_tracking_db()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
 
-        if not result:
-            # New IP - add to tracking table
-            cursor.execute(
-                "INSERT INTO ip_tracking (ip_address, request_count, last_request_date) VALUES (?, 1, ?)",
-                (ip_address, today),
-            )
-            conn.commit()
-            logger.info(f"New IP tracked: {ip_address}")
-        else:
-            count, last_date = result
-
-            # Convert string date to date object if needed
-            if isinstance(last_date, str):
-                last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
-
-            # If it's a new day, reset the counter
-            if last_date < today:
-                cursor.execute(
-                    "UPDATE ip_tracking SET request_count = 1, last_request_date = ? WHERE ip_address = ?",
-                    (today, ip_address),
-                )
-                conn.commit()
-                logger.info(f"Reset counter for IP: {ip_address}")
-            elif count >= MAX_DAILY_REQUESTS_PER_IP:
+            # A new day resets the counters; otherwise only count the request
+            # while the IP is under its limit (no row returned means over it)
+            ip_row = conn.execute(
+                """
+                INSERT INTO ip_tracking (ip_address, request_count, last_request_date, token_count)
+                VALUES (?, 1, ?, 0)
+                ON CONFLICT (ip_address) DO UPDATE SET
+                    request_count = CASE WHEN last_request_date < excluded.last_request_date
+                        THEN 1 ELSE request_count + 1 END,
+                    token_count = CASE WHEN last_request_date < excluded.last_request_date
+                        THEN 0 ELSE token_count END,
+                    last_request_date = excluded.last_request_date
+                WHERE last_request_date < excluded.last_request_date OR request_count < ?
+                RETURNING request_count
+                """,
+                (ip_address, today, MAX_DAILY_REQUESTS_PER_IP),
+            ).fetchone()
+            if ip_row is None:
+                conn.rollback()
                 logger.warning(f"IP {ip_address} exceeded daily limit")
-                conn.close()
                 return False
-            else:
-                # Increment count
-                cursor.execute(
-                    "UPDATE ip_tracking SET request_count = request_count + 1 WHERE ip_address = ?",
-                    (ip_address,),
-                )
-                conn.commit()
-
-        # Check global daily limit
-        cursor.execute(
-            "SELECT total_count, last_date FROM global_counter WHERE counter_id = 'daily_total'"
-        )
-        global_result = cursor.fetchone()
-
-        if global_result:
-            global_count, global_last_date = global_result
-
-            if isinstance(global_last_date, str):
-                global_last_date = datetime.strptime(
-                    global_last_date, "%Y-%m-%d"
-                ).date()
-
-            if global_last_date < today:
-                cursor.execute(
-                    "UPDATE global_counter SET total_count = 1, last_date = ? WHERE counter_id = 'daily_total'",
-                    (today,),
-                )
-                conn.commit()
-                logger.info("Reset global counter for new day")
-            elif global_count >= MAX_TOTAL_DAILY_REQUESTS:
+
+            global_row = conn.execute(
+                """
+                INSERT INTO global_counter (counter_id, total_count, last_date, token_count)
+                VALUES ('daily_total', 1, ?, 0)
+                ON CONFLICT (counter_id) DO UPDATE SET
+                    total_count = CASE WHEN last_date < excluded.last_date
+                        THEN 1 ELSE total_count + 1 END,
+                    token_count = CASE WHEN last_date < excluded.last_date
+                        THEN 0 ELSE token_count END,
+                    last_date = excluded.last_date
+                WHERE last_date < excluded.last_date OR total_count < ?
+                RETURNING total_count
+                """,
+                (today, MAX_TOTAL_DAILY_REQUESTS),
+            ).fetchone()
+            if global_row is None:
+                # Don't charge the IP for a request that is not served
+                conn.rollback()
                 logger.warning("Global daily limit reached")
-                conn.close()
                 return False
-            else:
-                cursor.execute(
-                    "UPDATE global_counter SET total_count = total_count + 1 WHERE counter_id = 'daily_total'"
-                )
-                conn.commit()
 
-        conn.close()
-        return True
+            conn.commit()
+            return True
+        finally:
+            conn.close()
 
     @staticmethod
+    @timed("quota")
     def get_ip_remaining_requests(ip_address: str) -> int:
         """Get the number of remaining requests for an IP address"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+        conn = connect_tracking_db()
         cursor = conn.cursor()
         cursor.execute(
             "SELECT request_count, last_request_date FROM ip_tracking WHERE ip_address = ?",
@@ -127,9 +114,10 @@ class IPTracker:
         return remaining
 
     @staticmethod
+    @timed("quota")
     def get_global_remaining_requests() -> int:
         """Get the number of remaining global requests for the day"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+        conn = connect_tracking_db()
         cursor = conn.cursor()
 
         cursor.execute(
@@ -138,13 +126,8 @@ class IPTracker:
         result = cursor.fetchone()
 
         if not result:
-            # Initialize if not exists
-            today = date.today()
-            cursor.execute(
-                "INSERT INTO global_counter (counter_id, total_count, last_date) VALUES (?, ?, ?)",
-                ("daily_total", 0, today),
-            )
-            conn.commit()
+            # Nothing counted yet; the row is seeded by init_databases and
+            # upserted by check_ip_limit, so a read never has to create it
             conn.close()
             return MAX_TOTAL_DAILY_REQUESTS
 
@@ -164,20 +147,159 @@ class IPTracker:
         return remaining
 
     @staticmethod
+    @timed("quota")
+    def check_token_budget(ip_address: str) -> str:
+        """
+        Check today's token usage against MAX_DAILY_TOKENS_PER_IP and
+        MAX_TOTAL_DAILY_TOKENS (unset or 0 means unlimited). Usage is counted
+        once a request has been answered, so a budget can be overshot by the
+        request that crosses it.
+
+        Returns None if the request may proceed, otherwise "ip" or "global"
+        for the budget that is exhausted.
+        """
+        ip_budget = _token_budget("MAX_DAILY_TOKENS_PER_IP")
+        global_budget = _token_budget("MAX_TOTAL_DAILY_TOKENS")
+        if not ip_budget and not global_budget:
+            return None
+
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+        today = date.today().isoformat()
+
+        if ip_budget:
+            cursor.execute(
+                "SELECT token_count FROM ip_tracking WHERE ip_address = ? AND last_request_date = ?",
+                (ip_address, today),
+            )
+            result = cursor.fetchone()
+            if result and (result[0] or 0) >= ip_budget:
+                conn.close()
+                logger.warning(f"IP {ip_address} exceeded daily token budget")
+                return "ip"
+
+        if global_budget:
+            cursor.execute(
+                "SELECT token_count FROM global_counter WHERE counter_id = 'daily_total' AND last_date = ?",
+                (today,),
+            )
+            result = cursor.fetchone()
+            if result and (result[0] or 0) >= global_budget:
+                conn.close()
+                logger.warning("Global daily token budget reached")
+                return "global"
+
+        conn.close()
+        return None
+
+    @staticmethod
+    @timed("logging")
+    def record_llm_usage(
+        ip_address: str, user_query: str, response, shared: bool = False
+    ):
+        """
+        Store the token usage and latency of one LLM answer and add its tokens
+        to the IP's and the global daily totals
+
+        A shared answer was generated for another request with the same
+        question: its tokens count against this IP's budget too, but were
+        already added to the global total and the token metric.
+
+        Args:
+            ip_address (str): The requesting IP address
+            user_query (str): The natural language question
+            response (LLMResponse): The answer returned by the LLM router
+            shared (bool): Whether the answer came from a coalesced call
+        """
+        total_tokens = response.prompt_tokens + response.completion_tokens
+        today = date.today().isoformat()
+        conn = connect_tracking_db()
+        cursor = conn.cursor()
+
+        cursor.execute(
+            """
+            INSERT INTO llm_usage
+            (ip_address, user_query, provider, prompt_tokens, completion_tokens, total_tokens, latency_ms, request_id, shared)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                ip_address,
+                user_query,
+                response.provider,
+                response.prompt_tokens,
+                response.completion_tokens,
+                total_tokens,
+                round(response.latency_ms, 3),
+                get_request_id(),
+                int(shared),
+            ),
+        )
+        cursor.execute(
+            "UPDATE ip_tracking SET token_count = COALESCE(token_count, 0) + ? WHERE ip_address = ? AND last_request_date = ?",
+            (total_tokens, ip_address, today),
+        )
+        if shared:
+            conn.commit()
+            conn.close()
+            return
+        cursor.execute(
+            "UPDATE global_counter SET token_count = COALESCE(token_count, 0) + ? WHERE counter_id = 'daily_total' AND last_date = ?",
+            (total_tokens, today),
+        )
+
+        conn.commit()
+        conn.close()
+
+        LLM_TOKENS.inc(
+            response.prompt_tokens, provider=response.provider, kind="prompt"
+        )
+        LLM_TOKENS.inc(
+            response.completion_tokens, provider=response.provider, kind="completion"
+        )
+
+    @staticmethod
+    @timed("logging")
     def record_query_history(
-        ip_address: str, user_query: str, sql_query: str, success: bool
+        ip_address: str,
+        user_query: str,
+        sql_query: str,
+        success: bool,
+        outcome: str = None,
     ):
-        """Record a query in the history table"""
-        conn = sqlite3.connect(IP_TRACKING_DB_PATH)
+        """
+        Record a query in the history table and add it to the analytics
+        rollups in the same transaction
+
+        Args:
+            outcome (str): How the query ended (success, llm_declined,
+                rejected, generation_failed or execution_failed); defaults to
+                "success" or "failed"
+        """
+        outcome = outcome or ("success" if success else "failed")
+        elapsed_s = request_elapsed_s()
+        latency_ms = round(elapsed_s * 1000, 3) if elapsed_s is not None else None
+        timestamp = analytics.utc_timestamp()
+        conn = connect_tracking_db()
         cursor = conn.cursor()
 
         cursor.execute(
             """
-            INSERT INTO query_history (ip_address, user_query, sql_query, success)
-            VALUES (?, ?, ?, ?)
+            INSERT INTO query_history
+            (ip_address, user_query, sql_query, success, request_id, outcome, latency_ms, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
-            (ip_address, user_query, sql_query, success),
+            (
+                ip_address,
+                user_query,
+                sql_query,
+                success,
+                get_request_id(),
+                outcome,
+                latency_ms,
+                timestamp,
+            ),
         )
+        analytics.record_query(conn, user_query, outcome, latency_ms, timestamp)
 
         conn.commit()
         conn.close()
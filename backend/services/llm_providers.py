@@ -0,0 +1,419 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from utils.logger import logger
+from utils.metrics import (
+    LLM_CALL_DURATION,
+    LLM_CIRCUIT_OPENED,
+    LLM_ERRORS,
+    LLM_HEDGES,
+    LLM_WINS,
+)
+
+# Provider list used when LLM_PROVIDERS is not set
+DEFAULT_PROVIDERS = "openai:gpt-4.1"
+
+
+@dataclass
+class LLMResponse:
+    """Text returned by a provider plus what it cost"""
+
+    text: str
+    provider: str
+    latency_ms: float
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+class LLMProvider:
+    """
+    One model behind one API. Subclasses implement _complete(); complete()
+    times the call, so every provider is measured the same way.
+    """
+
+    def __init__(self, name: str, model: str):
+        self.name = name
+        self.model = model
+
+    def complete(self, messages: list, temperature: float) -> LLMResponse:
+        start = time.perf_counter()
+        text, prompt_tokens, completion_tokens = self._complete(messages, temperature)
+        return LLMResponse(
+            text=text.strip(),
+            provider=self.name,
+            latency_ms=(time.perf_counter() - start) * 1000,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+        )
+
+    def _complete(self, messages: list, temperature: float):
+        """Return (text, prompt_tokens, completion_tokens)"""
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI chat completions; also accepts any client with the same call shape"""
+
+    def __init__(self, name: str, model: str, api_key: str = None, client=None):
+        super().__init__(name, model)
+        self.api_key = api_key
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    def _complete(self, messages, temperature):
+        response = self.client.chat.completions.create(
+            model=self.model, messages=messages, temperature=temperature
+        )
+        usage = getattr(response, "usage", None)
+        return (
+            response.choices[0].message.content,
+            getattr(usage, "prompt_tokens", 0) or 0,
+            getattr(usage, "completion_tokens", 0) or 0,
+        )
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini through the google-genai SDK"""
+
+    def __init__(self, name: str, model: str, api_key: str = None):
+        super().__init__(name, model)
+        self.api_key = api_key
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google import genai
+
+            self._client = genai.Client(api_key=self.api_key)
+        return self._client
+
+    def _complete(self, messages, temperature):
+        from google.genai import types
+
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            types.Content(
+                role="model" if m["role"] == "assistant" else "user",
+                parts=[types.Part(text=m["content"])],
+            )
+            for m in messages
+            if m["role"] != "system"
+        ]
+        response = self.client.models.generate_content(
+            model=self.model,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                system_instruction=system or None, temperature=temperature
+            ),
+        )
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            response.text or "",
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies for one provider"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float):
+        with self._lock:
+            self._samples.append(latency_ms)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> float:
+        """Nearest-rank percentile (0-100) of the window, or None when empty"""
+        with self._lock:
+            values = sorted(self._samples)
+        if not values:
+            return None
+        rank = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+        return values[rank]
+
+
+class CircuitBreaker:
+    """
+    Stops sending traffic to a provider after consecutive failures. Once the
+    cooldown has passed a single trial call is let through; success closes the
+    circuit again and failure re-opens it for another cooldown.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown_s: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (
+                self.state == self.OPEN
+                and time.monotonic() - self.opened_at >= self.cooldown_s
+            ):
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if (
+                self.state == self.HALF_OPEN
+                or self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state != self.OPEN:
+                    LLM_CIRCUIT_OPENED.inc(provider=self.name)
+                    logger.warning(
+                        f"Circuit opened for LLM provider {self.name} after "
+                        f"{self.consecutive_failures} consecutive failures"
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+def is_sql_json(text: str) -> bool:
+    """True if text is the JSON object with a sql_query key the prompt asks for"""
+    try:
+        parsed = json.loads(text)
+    except (TypeError, ValueError):
+        return False
+    return isinstance(parsed, dict) and isinstance(parsed.get("sql_query"), str)
+
+
+class LLMRouter:
+    """
+    Sends a request to the first healthy provider and hedges it: if no valid
+    answer has arrived by the time that provider's p90 latency has passed, the
+    next healthy provider is asked as well and the first valid answer wins. A
+    failed or invalid answer moves on to the next provider straight away.
+    Calls that lose the race are not cancelled, but still feed the latency
+    window and circuit breaker of their provider, and the caller's
+    on_response callback so their tokens are paid for.
+    """
+
+    def __init__(
+        self,
+        providers: list,
+        hedge_percentile: float = 90,
+        hedge_min_samples: int = 20,
+        hedge_default_ms: float = 8000,
+        failure_threshold: int = 5,
+        cooldown_s: float = 30,
+        max_workers: int = 32,
+    ):
+        if not providers:
+            raise ValueError("At least one LLM provider is required")
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_ms = hedge_default_ms
+        self.latency = {p.name: LatencyTracker() for p in providers}
+        self.breakers = {
+            p.name: CircuitBreaker(p.name, failure_threshold, cooldown_s)
+            for p in providers
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="llm"
+        )
+
+    def hedge_delay_s(self, provider: LLMProvider) -> float:
+        """How long to wait on provider before asking the next one"""
+        tracker = self.latency[provider.name]
+        if len(tracker) < self.hedge_min_samples:
+            return self.hedge_default_ms / 1000
+        return tracker.percentile(self.hedge_percentile) / 1000
+
+    def _call(self, provider: LLMProvider, messages, temperature) -> LLMResponse:
+        start = time.perf_counter()
+        try:
+            response = provider.complete(messages, temperature)
+        except Exception as e:
+            LLM_ERRORS.inc(provider=provider.name)
+            self.breakers[provider.name].record_failure()
+            logger.error(f"LLM provider {provider.name} failed: {str(e)}")
+            raise
+        finally:
+            LLM_CALL_DURATION.observe(
+                time.perf_counter() - start, provider=provider.name
+            )
+        self.latency[provider.name].record(response.latency_ms)
+        self.breakers[provider.name].record_success()
+        return response
+
+    def complete(
+        self,
+        messages: list,
+        temperature: float = 0.5,
+        validate=is_sql_json,
+        on_response=None,
+    ) -> LLMResponse:
+        """
+        Return the first answer that passes validate(). If none does, the first
+        invalid answer is returned so the caller can report it; if every
+        provider failed, the last error is raised.
+
+        on_response is called with every answer any provider returns for this
+        request, including hedged calls that finish after complete() has
+        returned. It runs in the caller's context on the thread that made the
+        call, before the answer can be returned.
+        """
+        candidates = list(self.providers)
+        pending = {}
+        invalid_response = None
+        last_error = None
+
+        def call(provider):
+            response = self._call(provider, messages, temperature)
+            if on_response is not None:
+                try:
+                    on_response(response)
+                except Exception as e:
+                    logger.error(f"LLM response callback failed: {str(e)}")
+            return response
+
+        def launch():
+            """Call the next provider whose circuit lets it through, or return None
+
+            allow() is only asked right before a call: a half-open circuit
+            grants a single trial, which must not be spent on a provider the
+            race never reaches.
+            """
+            while candidates:
+                provider = candidates.pop(0)
+                if not self.breakers[provider.name].allow():
+                    continue
+                # A late answer must still be metered as the request that
+                # made it, so each call runs in a copy of the caller's context
+                context = contextvars.copy_context()
+                future = self._executor.submit(context.run, call, provider)
+                pending[future] = provider
+                return provider
+            return None
+
+        current = launch()
+        if current is None:
+            raise RuntimeError("No LLM provider available: all circuits are open")
+        deadline = time.monotonic() + self.hedge_delay_s(current)
+
+        while pending:
+            timeout = max(0.0, deadline - time.monotonic()) if candidates else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # The newest call is past its hedge delay: ask the next provider
+                hedge = launch()
+                if hedge is None:
+                    continue
+                LLM_HEDGES.inc(provider=current.name)
+                logger.info(
+                    f"LLM provider {current.name} slower than its hedge delay, "
+                    f"hedging with {hedge.name}"
+                )
+                current = hedge
+                deadline = time.monotonic() + self.hedge_delay_s(current)
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if validate(response.text):
+                    LLM_WINS.inc(provider=provider.name)
+                    return response
+                logger.warning(
+                    f"LLM provider {provider.name} returned an invalid answer: "
+                    f"{response.text[:100]}"
+                )
+                if invalid_response is None:
+                    invalid_response = response
+
+            # Everything in flight came back unusable; don't wait for a hedge delay
+            if not pending and candidates:
+                launched = launch()
+                if launched is not None:
+                    current = launched
+                    deadline = time.monotonic() + self.hedge_delay_s(current)
+
+        if invalid_response is not None:
+            return invalid_response
+        raise last_error
+
+    def status(self) -> list:
+        """Latency percentiles and circuit state per provider"""
+        return [
+            {
+                "provider": p.name,
+                "model": p.model,
+                "samples": len(self.latency[p.name]),
+                "p50_ms": self.latency[p.name].percentile(50),
+                "p90_ms": self.latency[p.name].percentile(90),
+                "hedge_delay_ms": round(self.hedge_delay_s(p) * 1000, 1),
+                "circuit": self.breakers[p.name].state,
+                "consecutive_failures": self.breakers[p.name].consecutive_failures,
+            }
+            for p in self.providers
+        ]
+
+
+def build_provider(spec: str, openai_api_key: str = None) -> LLMProvider:
+    """Create a provider from a 'kind:model' spec such as 'gemini:gemini-2.0-flash'"""
+    kind, _, model = spec.strip().partition(":")
+    if not model:
+        raise ValueError(f"Invalid LLM provider spec '{spec}', expected kind:model")
+    name = f"{kind}:{model}"
+    if kind == "openai":
+        return OpenAIProvider(name, model, api_key=openai_api_key)
+    if kind == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        return GeminiProvider(name, model, api_key=api_key)
+    raise ValueError(f"Unknown LLM provider '{kind}' in '{spec}'")
+
+
+def build_router_from_env(openai_api_key: str = None) -> LLMRouter:
+    """Build the router from LLM_PROVIDERS and the LLM_* tuning variables"""
+    specs = os.getenv("LLM_PROVIDERS", DEFAULT_PROVIDERS).split(",")
+    providers = [build_provider(spec, openai_api_key) for spec in specs if spec.strip()]
+    return LLMRouter(
+        providers,
+        hedge_percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "90")),
+        hedge_default_ms=float(os.getenv("LLM_HEDGE_DEFAULT_MS", "8000")),
+        failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURES", "5")),
+        cooldown_s=float(os.getenv("LLM_CIRCUIT_COOLDOWN_S", "30")),
+    )
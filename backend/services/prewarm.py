@@ -0,0 +1,149 @@
+import os
+import resource
+import threading
+import time
+from models.db_models import connect_tracking_db
+from utils.logger import logger
+from utils.normalize import normalize_sql
+
+
+def _process_cpu_s() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Prewarmer:
+    """
+    Loads the dataset into the query engine and re-runs the most frequent
+    successful SQL from query_history after startup so DuckDB and the result
+    cache are warm before real traffic arrives. History of a template answer
+    holds its SQL with the values inlined, while live requests run the
+    template's parameterized SQL; with a template_matcher, the stored question
+    is matched again so prewarm fills the cache entry those requests read.
+
+    Queries run one at a time in a background thread and stop once either the
+    wall-clock budget or the CPU budget (process CPU time, so requests served
+    meanwhile count too) is used up; a query already running when a budget
+    runs out is allowed to finish. Until then `done` is unset and the health
+    check reports the worker as warming.
+    """
+
+    def __init__(
+        self,
+        sql_generator,
+        top_n: int = 20,
+        budget_s: float = 30,
+        cpu_budget_s=None,
+        template_matcher=None,
+    ):
+        self.sql_generator = sql_generator
+        self.template_matcher = template_matcher
+        self.top_n = top_n
+        self.budget_s = budget_s
+        self.cpu_budget_s = budget_s if cpu_budget_s is None else cpu_budget_s
+        self.done = threading.Event()
+        self._stopping = threading.Event()
+        self.report = {"status": "pending"}
+
+    @classmethod
+    def from_env(cls, sql_generator, template_matcher=None):
+        """Configured by PREWARM_TOP_N (0 disables), PREWARM_BUDGET_S and PREWARM_CPU_BUDGET_S"""
+        cpu_budget = os.getenv("PREWARM_CPU_BUDGET_S")
+        return cls(
+            sql_generator,
+            top_n=int(os.getenv("PREWARM_TOP_N", "20")),
+            budget_s=float(os.getenv("PREWARM_BUDGET_S", "30")),
+            cpu_budget_s=float(cpu_budget) if cpu_budget else None,
+            template_matcher=template_matcher,
+        )
+
+    def top_queries(self) -> list:
+        """
+        Most frequent distinct successful SQL, most frequent first, as
+        (sql_query, user_query) with the latest question that produced it
+        """
+        conn = connect_tracking_db()
+        # With MAX(id), SQLite takes user_query from the latest row of each group
+        rows = conn.execute(
+            """
+            SELECT sql_query, user_query, COUNT(*) AS uses, MAX(id) FROM query_history
+            WHERE success = 1 AND sql_query IS NOT NULL
+            GROUP BY sql_query
+            ORDER BY uses DESC, MAX(id) DESC
+            LIMIT ?
+            """,
+            (self.top_n * 4,),
+        ).fetchall()
+        conn.close()
+
+        # Collapse queries that differ only in whitespace
+        queries = {}
+        for sql_query, user_query, uses, _ in rows:
+            key = normalize_sql(sql_query)
+            if key in queries:
+                queries[key][2] += uses
+            else:
+                queries[key] = [sql_query, user_query, uses]
+        ranked = sorted(queries.values(), key=lambda item: item[2], reverse=True)
+        return [
+            (sql_query, user_query) for sql_query, user_query, _ in ranked[: self.top_n]
+        ]
+
+    def _execute(self, sql_query: str, user_query: str):
+        """Run sql_query the way a live request for user_query would"""
+        template = (
+            self.template_matcher.match(user_query)
+            if self.template_matcher and user_query
+            else None
+        )
+        if template is not None and normalize_sql(template.display_sql) == (
+            normalize_sql(sql_query)
+        ):
+            self.sql_generator.fetch_data(template.sql, user_query, template.params)
+        else:
+            self.sql_generator.fetch_data(sql_query)
+
+    def run(self):
+        start = time.perf_counter()
+        cpu_start = _process_cpu_s()
+        self.report = {"status": "running", "executed": 0, "failed": 0, "skipped": 0}
+        try:
+            queries = []
+            if self.top_n > 0:
+                # Opening the engine loads the dataset, which the first
+                # request would otherwise wait for even with no history
+                self.sql_generator.engine.dataset_version()
+                queries = self.top_queries()
+            for index, (sql_query, user_query) in enumerate(queries):
+                elapsed = time.perf_counter() - start
+                cpu_used = _process_cpu_s() - cpu_start
+                if (
+                    elapsed >= self.budget_s
+                    or cpu_used >= self.cpu_budget_s
+                    or self._stopping.is_set()
+                ):
+                    self.report["skipped"] = len(queries) - index
+                    break
+                try:
+                    self._execute(sql_query, user_query)
+                    self.report["executed"] += 1
+                except Exception as e:
+                    self.report["failed"] += 1
+                    logger.warning(f"Prewarm query failed: {str(e)}")
+            self.report["status"] = "done"
+        except Exception as e:
+            self.report["status"] = "failed"
+            logger.error(f"Prewarm failed: {str(e)}")
+        finally:
+            self.report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            self.report["cpu_ms"] = round((_process_cpu_s() - cpu_start) * 1000, 1)
+            logger.info(f"Prewarm finished: {self.report}")
+            self.done.set()
+
+    def start(self):
+        threading.Thread(target=self.run, name="prewarm", daemon=True).start()
+
+    def stop(self):
+        """Skip the remaining queries and wait for the current one to finish"""
+        self._stopping.set()
+        self.done.wait()
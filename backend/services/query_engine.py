@@ -0,0 +1,422 @@
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from models import dataset_snapshots
+from models.dataset_schema import (
+    BASE_TABLES,
+    MATERIALIZED_VIEWS,
+    PARQUET_MANIFEST,
+    create_serving_views,
+    parquet_source,
+)
+from models.db_models import DatabaseManager
+from utils.logger import logger
+from utils.metrics import DATASET_RELOADS, stage
+
+# Each dataset version is served from a DuckDB file of this name in its directory
+SERVING_DB_NAME = "serving.duckdb"
+
+
+class ResourcePolicy:
+    """
+    Limits on what DuckDB may use for queries.
+
+    memory_limit and threads are settings of a DuckDB database, so they bound
+    all queries on a dataset connection together: the threads are a pool the
+    running queries share, and each query is kept within the memory limit
+    less what the dataset and the other queries hold. At most
+    max_concurrent_queries run at once (the rest wait their turn), which
+    caps how many ways the memory and the threads are split. Operators that
+    outgrow memory spill to temp_directory up to max_temp_size before the
+    query fails with an out-of-memory error.
+    """
+
+    def __init__(
+        self,
+        memory_limit: str = None,
+        threads: int = None,
+        temp_directory: str = None,
+        max_temp_size: str = None,
+        max_concurrent_queries: int = None,
+    ):
+        self.memory_limit = memory_limit
+        self.threads = threads or os.cpu_count() or 1
+        self.temp_directory = os.path.abspath(temp_directory or "duckdb_tmp")
+        self.max_temp_size = max_temp_size
+        self.max_concurrent_queries = (
+            self.threads if max_concurrent_queries is None else max_concurrent_queries
+        )
+
+    @classmethod
+    def from_env(cls):
+        """Configured by DUCKDB_MEMORY_LIMIT, DUCKDB_THREADS, DUCKDB_TEMP_DIRECTORY,
+        DUCKDB_MAX_TEMP_SIZE and DUCKDB_MAX_CONCURRENT_QUERIES"""
+        concurrent = os.getenv("DUCKDB_MAX_CONCURRENT_QUERIES")
+        return cls(
+            memory_limit=os.getenv("DUCKDB_MEMORY_LIMIT", "1GB"),
+            threads=int(os.getenv("DUCKDB_THREADS", "0")),
+            temp_directory=os.getenv("DUCKDB_TEMP_DIRECTORY", "duckdb_tmp"),
+            max_temp_size=os.getenv("DUCKDB_MAX_TEMP_SIZE", "2GB"),
+            max_concurrent_queries=int(concurrent) if concurrent else None,
+        )
+
+    def config(self, temp_directory: str, threads: int = None) -> dict:
+        """DuckDB connect() config; settings left empty keep DuckDB's defaults"""
+        config = {
+            "threads": threads or self.threads,
+            "temp_directory": temp_directory,
+            "memory_limit": self.memory_limit,
+            "max_temp_directory_size": self.max_temp_size,
+        }
+        return {name: value for name, value in config.items() if value}
+
+
+class _Generation:
+    """One opened version of the dataset and the cursors still using it"""
+
+    def __init__(self, version: str, source: str, con, directory: str):
+        self.version = version
+        self.source = source
+        self.con = con
+        self.directory = directory
+        self.refs = 0
+        self.retired = False
+        self.opened_at = time.time()
+
+    def close(self):
+        self.con.close()
+        # The serving database and spill files of a generation go with it
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class QueryEngine:
+    """
+    Long-lived read-only DuckDB connection to the IPL dataset.
+
+    Opening a connection per query throws away DuckDB's buffer pool and
+    catalog each time; instead every query runs on a cursor of one shared
+    connection.
+
+    The connection is to a DuckDB database file holding the name-resolving
+    serving views, built for each dataset version in its own directory under
+    the temp directory and then opened read-only: whatever SQL gets past the
+    validator cannot change what later queries see. With the sqlite layout the key-encoded base tables are
+    copied out of the SQLite file when it opens, so queries scan columnar
+    data and the key-to-name joins compare integers instead of going through
+    SQLite's scanner on every query; delivery_facts is materialized from
+    them at the same time, so the wide ball-by-ball table is scanned without
+    any join. With the parquet layout the base tables, and every serving
+    view, are views over the season-partitioned export from export_parquet.py,
+    read on each query so season filters skip whole partitions. External
+    access is then switched off (apart from the export directory), which
+    keeps queries to the dataset.
+
+    The sqlite layout serves the snapshot datasets/CURRENT points at, or
+    db_path when no snapshot has been published. When the dataset changes,
+    the first query to notice starts opening the new version in a background
+    thread and keeps running on the old one, as do the queries after it, until
+    the new connection is ready and swapped in. A replaced connection is
+    closed once the last cursor on it is released, so no query ever has its
+    connection closed under it and no request waits for a reload.
+
+    Every connection is opened under the engine's ResourcePolicy, and
+    cursor() waits for one of its max_concurrent_queries slots.
+    """
+
+    LAYOUTS = ("sqlite", "parquet")
+
+    def __init__(
+        self,
+        db_path: str,
+        layout: str = "sqlite",
+        parquet_dir=None,
+        datasets_dir=None,
+        resources: ResourcePolicy = None,
+    ):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown data layout: {layout}")
+        self.db_path = db_path
+        self.layout = layout
+        self.parquet_dir = os.path.abspath(parquet_dir or "ipl_parquet")
+        self.datasets_dir = datasets_dir or dataset_snapshots.DATASETS_DIR
+        self.resources = resources or ResourcePolicy()
+        self._slots = (
+            threading.BoundedSemaphore(self.resources.max_concurrent_queries)
+            if self.resources.max_concurrent_queries > 0
+            else None
+        )
+        self._running = 0
+        self._waiting = 0
+        self._active = None
+        self._retired = []
+        self._reloading = None
+        self._failed_version = None
+        self._lock = threading.Lock()
+        # Serializes the foreground open on first use
+        self._open_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, db_path: str):
+        """Configured by DATA_LAYOUT (sqlite or parquet), PARQUET_DIR,
+        DATASETS_DIR and the DUCKDB_* resource settings"""
+        return cls(
+            db_path,
+            layout=os.getenv("DATA_LAYOUT", "sqlite"),
+            parquet_dir=os.getenv("PARQUET_DIR", "ipl_parquet"),
+            datasets_dir=str(dataset_snapshots.datasets_dir()),
+            resources=ResourcePolicy.from_env(),
+        )
+
+    def _source(self):
+        """(version, path) of the dataset as currently published on disk"""
+        if self.layout == "parquet":
+            return (
+                DatabaseManager.dataset_version(
+                    os.path.join(self.parquet_dir, PARQUET_MANIFEST)
+                ),
+                self.parquet_dir,
+            )
+        snapshot = dataset_snapshots.current_snapshot(self.datasets_dir)
+        if snapshot is not None:
+            return snapshot[0], str(snapshot[1])
+        return DatabaseManager.dataset_version(self.db_path), self.db_path
+
+    def dataset_version(self) -> str:
+        """Version of the dataset queries are served from right now
+
+        This is the version cursors are handed out for, which lags the one on
+        disk while a new version is being opened, so results cached or
+        tagged with it always match the data they came from.
+        """
+        generation = self._acquire()
+        self._release(generation)
+        return generation.version
+
+    @contextmanager
+    def cursor(self):
+        """Yield (cursor, dataset_version) once a query slot is free
+
+        The cursor is closed and the slot given back on exit.
+        """
+        with self._query_slot():
+            generation = self._acquire()
+            try:
+                cursor = generation.con.cursor()
+                try:
+                    yield cursor, generation.version
+                finally:
+                    cursor.close()
+            finally:
+                self._release(generation)
+
+    @contextmanager
+    def _query_slot(self):
+        if self._slots is None:
+            yield
+            return
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._waiting += 1
+            try:
+                with stage("query_queue"):
+                    self._slots.acquire()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        with self._lock:
+            self._running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+
+    def _acquire(self) -> _Generation:
+        version, path = self._source()
+        with self._lock:
+            active = self._active
+            if active is not None:
+                if (
+                    version != active.version
+                    and self._reloading is None
+                    and version != self._failed_version
+                ):
+                    self._reloading = version
+                    threading.Thread(
+                        target=self._reload,
+                        args=(version, path),
+                        name="dataset-reload",
+                        daemon=True,
+                    ).start()
+                active.refs += 1
+                return active
+
+        # Nothing to serve from yet: open in the foreground, once
+        with self._open_lock:
+            if self._active is None:
+                self._install(self._open(version, path))
+        return self._acquire()
+
+    def _release(self, generation: _Generation):
+        with self._lock:
+            generation.refs -= 1
+            close = generation.retired and generation.refs == 0
+            if close:
+                self._retired.remove(generation)
+        if close:
+            generation.close()
+            logger.info(f"Closed dataset version {generation.version}")
+
+    def _reload(self, version: str, path: str):
+        try:
+            start = time.perf_counter()
+            generation = self._open(version, path, background=True)
+            self._install(generation)
+            DATASET_RELOADS.inc(result="swapped")
+            logger.info(
+                f"Swapped to dataset version {version} "
+                f"after {time.perf_counter() - start:.2f}s"
+            )
+        except Exception as e:
+            # Keep serving the old version rather than retrying on every query
+            self._failed_version = version
+            DATASET_RELOADS.inc(result="failed")
+            logger.error(f"Failed to open dataset version {version}: {str(e)}")
+        finally:
+            with self._lock:
+                self._reloading = None
+
+    def _open(self, version: str, path: str, background=False) -> _Generation:
+        import duckdb
+
+        logger.info(f"Opening dataset version {version} from {path}")
+        directory = os.path.join(
+            self.resources.temp_directory, f"{os.getpid()}-{version}"
+        )
+        os.makedirs(directory, exist_ok=True)
+        try:
+            con = self._connect(duckdb, path, directory, background)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return _Generation(version, path, con, directory)
+
+    def _install(self, generation: _Generation):
+        with self._lock:
+            previous = self._active
+            self._active = generation
+            self._failed_version = None
+            close = previous is not None and not previous.refs
+            if previous is not None:
+                previous.retired = True
+                if not close:
+                    self._retired.append(previous)
+        if close:
+            previous.close()
+
+    def _connect(self, duckdb, path: str, directory: str, background=False):
+        """Build the serving database in directory and open it read-only"""
+        database = os.path.join(directory, SERVING_DB_NAME)
+        spill_directory = os.path.join(directory, "spill")
+
+        # A reload runs next to live queries, so it loads on a single thread
+        # rather than competing with them for the thread budget
+        build = duckdb.connect(
+            database,
+            config=self.resources.config(spill_directory, 1 if background else None),
+        )
+        try:
+            if self.layout == "parquet":
+                for table in BASE_TABLES:
+                    source = parquet_source(path, table)
+                    build.execute(f"CREATE VIEW {table} AS SELECT * FROM {source}")
+                create_serving_views(build)
+            else:
+                build.execute(f"ATTACH '{path}' AS ipl (TYPE sqlite, READ_ONLY)")
+                for table in BASE_TABLES:
+                    build.execute(f"CREATE TABLE {table} AS SELECT * FROM ipl.{table}")
+                build.execute("DETACH ipl")
+                create_serving_views(build, materialize=MATERIALIZED_VIEWS)
+        finally:
+            build.close()
+
+        con = duckdb.connect(
+            database, read_only=True, config=self.resources.config(spill_directory)
+        )
+        if self.layout == "parquet":
+            con.execute(f"SET allowed_directories = ['{path}/']")
+        con.execute("SET enable_external_access = false")
+        return con
+
+    def status(self) -> dict:
+        """Versions open, cursors on each, and the snapshots on disk"""
+        with self._lock:
+            generations = [
+                {
+                    "version": generation.version,
+                    "source": generation.source,
+                    "active": generation is self._active,
+                    "cursors": generation.refs,
+                    "opened_at": generation.opened_at,
+                }
+                for generation in [self._active, *self._retired]
+                if generation is not None
+            ]
+            reloading = self._reloading
+            failed = self._failed_version
+        try:
+            published = self._source()[0]
+        except OSError:
+            published = None
+        return {
+            "layout": self.layout,
+            "published_version": published,
+            "active_version": generations[0]["version"] if generations else None,
+            "reloading": reloading,
+            "failed_version": failed,
+            "generations": generations,
+            "snapshots": dataset_snapshots.list_snapshots(self.datasets_dir),
+        }
+
+    def resource_status(self) -> dict:
+        """The resource policy, query slots in use and DuckDB's memory and spill use"""
+        resources = self.resources
+        with self._lock:
+            queries = {"running": self._running, "waiting": self._waiting}
+        generation = self._acquire()
+        try:
+            con = generation.con.cursor()
+            try:
+                memory_bytes, temp_bytes = con.execute(
+                    "SELECT SUM(memory_usage_bytes), SUM(temporary_storage_bytes) "
+                    "FROM duckdb_memory()"
+                ).fetchone()
+            finally:
+                con.close()
+        finally:
+            self._release(generation)
+        return {
+            "policy": {
+                "memory_limit": resources.memory_limit,
+                "threads": resources.threads,
+                "temp_directory": resources.temp_directory,
+                "max_temp_size": resources.max_temp_size,
+                "max_concurrent_queries": resources.max_concurrent_queries,
+            },
+            "queries": queries,
+            "dataset_version": generation.version,
+            "memory_usage_bytes": int(memory_bytes or 0),
+            "temporary_storage_bytes": int(temp_bytes or 0),
+        }
+
+    def close(self):
+        with self._lock:
+            generations = [self._active, *self._retired]
+            self._active = None
+            self._retired = []
+        for generation in generations:
+            if generation is not None:
+                generation.close()
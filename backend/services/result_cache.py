@@ -0,0 +1,59 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from utils.metrics import RESULT_CACHE_REQUESTS
+
+
+class ResultCache:
+    """
+    LRU cache of query results with a time-to-live. Keys include the dataset
+    version, so results computed against an older dataset are never served
+    after it is replaced; they simply age out of the LRU.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configured by RESULT_CACHE_SIZE (0 disables) and RESULT_CACHE_TTL_S"""
+        return cls(
+            max_entries=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+            ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "3600")),
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                RESULT_CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+        RESULT_CACHE_REQUESTS.inc(result="hit")
+        return entry[1]
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
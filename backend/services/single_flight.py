@@ -0,0 +1,56 @@
+import asyncio
+from starlette.concurrency import run_in_threadpool
+from utils.metrics import COALESCED_REQUESTS, stage
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the
+    blocking function in the threadpool and every caller that arrives while it
+    is in flight awaits the same result (or exception) instead of repeating
+    the work. Nothing is cached once the call completes.
+
+    All callers must be on the same event loop, which holds for one worker.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight = {}
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    async def run(self, key, fn, *args):
+        """Return (result, shared) where shared is True if another caller did the work"""
+        while True:
+            future = self._in_flight.get(key)
+            if future is None:
+                break
+            try:
+                with stage(f"{self.name}_wait"):
+                    result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # The caller doing the work went away; take over unless we were cancelled
+                if future.cancelled():
+                    continue
+                raise
+            COALESCED_REQUESTS.inc(flight=self.name)
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the exception as retrieved so an unshared failure isn't reported as lost
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        try:
+            result = await run_in_threadpool(fn, *args)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._in_flight[key]
@@ -1,36 +1,127 @@
-import pandas as pd
-import duckdb
-from openai import OpenAI
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
 from utils.logger import logger
-from models.db_models import DB_PATH
+from utils.metrics import (
+    QUERY_CPU_SECONDS,
+    QUERY_LIMIT_HITS,
+    QUERY_MEMORY_BYTES,
+    QUERY_SPILLED_BYTES,
+    stage,
+)
+from utils.normalize import normalize_sql, sql_fingerprint
+from models.db_models import DB_PATH, SlowQueryManager
 from services.sql_validator import SQLValidator
+from services.llm_providers import build_router_from_env
+from services.ip_tracker import IPTracker
+from services.query_engine import QueryEngine
+from services.result_cache import ResultCache
+
+# pandas, duckdb and the LLM SDKs account for most of the import time, so they are
+# only imported when first used rather than when the app starts
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class SQLGenerator:
     def __init__(self, api_key):
-        self.client = OpenAI(api_key=api_key)
+        self.api_key = api_key
+        self._llm = None
         self.db_path = DB_PATH
+        self.engine = QueryEngine.from_env(DB_PATH)
+        self.result_cache = ResultCache.from_env()
+        # Executions at least this slow go to the slow query log; -1 disables it
+        self.slow_query_threshold_ms = float(
+            os.getenv("SLOW_QUERY_THRESHOLD_MS", "1000")
+        )
+        # Rows returned per query at most; 0 means no limit
+        self.max_result_rows = int(os.getenv("MAX_RESULT_ROWS", "5000"))
+
+    @property
+    def llm(self):
+        """Provider router configured from LLM_PROVIDERS, created on first use"""
+        if self._llm is None:
+            self._llm = build_router_from_env(self.api_key)
+        return self._llm
+
+    @llm.setter
+    def llm(self, router):
+        self._llm = router
+
+    def generate_sql_via_llm(
+        self,
+        user_query: str,
+        system_prompt: str,
+        ip_address: str = None,
+        answers: list = None,
+    ) -> str:
+        """Generate SQL using the configured LLM providers
+
+        The token usage and latency of every answer, including hedged calls
+        that lose the race, are recorded against ip_address. When given,
+        answers collects the same LLMResponses so requests sharing this call
+        can be charged for them with record_shared_usage().
+        """
+        # Answers that arrive while complete() runs are recorded once it
+        # returns, so the usage writes are not timed as LLM latency; a hedged
+        # call finishing later is recorded as it arrives
+        early_answers = []
+        lock = threading.Lock()
+        returned = False
+
+        def record(answer):
+            self._record_usage(ip_address, user_query, answer)
+            if answers is not None:
+                answers.append(answer)
+
+        def on_response(answer):
+            with lock:
+                if not returned:
+                    early_answers.append(answer)
+                    return
+            record(answer)
 
-    def generate_sql_via_llm(self, user_query: str, system_prompt: str) -> str:
-        """Generate SQL using OpenAI GPT model"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_query},
-                ],
-                temperature=0.5,
-            )
-            sql_result = response.choices[0].message.content.strip()
-            logger.info(f"SQL generated successfully for query: {user_query[:50]}...")
-            return sql_result
+            with stage("llm"):
+                response = self.llm.complete(
+                    [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_query},
+                    ],
+                    temperature=0.5,
+                    on_response=on_response,
+                )
         except Exception as e:
             logger.error(f"Error generating SQL: {str(e)}")
             raise
+        finally:
+            with lock:
+                returned = True
+            for answer in early_answers:
+                record(answer)
+        logger.info(
+            f"SQL generated by {response.provider} in {response.latency_ms:.0f} ms "
+            f"for query: {user_query[:50]}..."
+        )
+        return response.text
 
-    def fetch_data(self, sql_query: str) -> pd.DataFrame:
-        """Execute SQL query and return results as DataFrame"""
+    def fetch_data(
+        self, sql_query: str, user_query: str = None, params: list = None
+    ) -> "pd.DataFrame":
+        """Execute SQL query and return results as DataFrame
+
+        params are bound to the query's ? placeholders. Results are served
+        from the result cache when the same SQL with the same params already
+        ran against the current dataset. Executions slower than the slow query
+        threshold are recorded in the slow query log along with user_query and
+        DuckDB's operator profile.
+
+        Results are cut to MAX_RESULT_ROWS rows, with df.attrs["truncated"]
+        set when rows were dropped, and the CPU time, memory and spill of
+        every execution are recorded in the query resource metrics.
+        """
         # Validate SQL query before execution
         is_valid, error_message = SQLValidator.validate(sql_query)
         if not is_valid:
@@ -40,22 +131,158 @@ class SQLGenerator:
         # Clean up SQL query to handle potential issues
         sql_query = self._sanitize_sql_query(sql_query)
 
+        params = list(params or [])
+        cache_key = (
+            self.engine.dataset_version(),
+            normalize_sql(sql_query),
+            tuple(params),
+        )
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Result cache hit: {sql_query[:50]}...")
+            return cached
+
         try:
-            # Use read_only connection for added security
-            con = duckdb.connect(database=self.db_path, read_only=True)
-            df = con.execute(sql_query).fetchdf()
-            con.close()
-            logger.info(f"Query executed successfully: {sql_query[:50]}...")
+            # Cursor of the shared read_only connection for added security
+            with stage("execution"):
+                with self.engine.cursor() as (con, version):
+                    # The profile also carries the query's resource usage
+                    con.execute("SET enable_profiling = 'no_output'")
+                    start = time.perf_counter()
+                    df = con.execute(
+                        self._limit_rows(sql_query), params or None
+                    ).fetchdf()
+                    duration_ms = (time.perf_counter() - start) * 1000
+                    raw_profile = self._read_profile(con)
+            usage = self._record_resource_usage(raw_profile)
+            logger.info(
+                f"Query executed successfully in {duration_ms:.0f} ms "
+                f"({usage}): {sql_query[:50]}..."
+            )
+
+            truncated = 0 < self.max_result_rows < len(df)
+            if truncated:
+                df = df.head(self.max_result_rows)
+                QUERY_LIMIT_HITS.inc(limit="rows")
+                logger.warning(
+                    f"Result cut to {self.max_result_rows} rows: {sql_query[:100]}..."
+                )
+
+            if 0 <= self.slow_query_threshold_ms <= duration_ms:
+                self._record_slow_query(
+                    sql_query,
+                    user_query,
+                    duration_ms,
+                    len(df),
+                    self._condense_profile(raw_profile),
+                )
 
             # Format numeric columns to 2 decimal places
-            df = self._format_numeric_columns(df)
+            with stage("serialization"):
+                df = self._format_numeric_columns(df)
+            df.attrs["truncated"] = truncated
 
+            self.result_cache.put((version, *cache_key[1:]), df)
             return df
         except Exception as e:
+            # DuckDB raises this when the memory limit and the spill cap are both hit
+            if type(e).__name__ == "OutOfMemoryException":
+                QUERY_LIMIT_HITS.inc(limit="memory")
             logger.error(f"Error executing query: {str(e)}")
             raise
 
-    def _format_numeric_columns(self, df: pd.DataFrame) -> pd.DataFrame:
+    def _limit_rows(self, sql_query: str) -> str:
+        """Wrap a query so DuckDB stops one row past the result limit
+
+        The extra row tells a cut result from one that fits exactly. The
+        newlines keep a trailing comment from swallowing the parenthesis.
+        """
+        if self.max_result_rows <= 0:
+            return sql_query
+        sql_query = sql_query.strip().rstrip(";")
+        return f"SELECT * FROM (\n{sql_query}\n) LIMIT {self.max_result_rows + 1}"
+
+    def _record_resource_usage(self, raw_profile) -> str:
+        """Observe a profiled query's CPU, memory and spill; return a summary"""
+        if not raw_profile:
+            return "no profile"
+        cpu_s = raw_profile.get("cpu_time", 0.0)
+        memory_bytes = raw_profile.get("total_memory_allocated", 0)
+        spilled_bytes = raw_profile.get("system_peak_temp_dir_size", 0)
+        QUERY_CPU_SECONDS.observe(cpu_s)
+        QUERY_MEMORY_BYTES.observe(memory_bytes)
+        if spilled_bytes:
+            QUERY_SPILLED_BYTES.inc(spilled_bytes)
+        return (
+            f"cpu {cpu_s * 1000:.0f} ms, memory {memory_bytes / 2**20:.1f} MiB, "
+            f"spilled {spilled_bytes / 2**20:.1f} MiB"
+        )
+
+    def _read_profile(self, con) -> dict:
+        """DuckDB's JSON profile of the last query on con, or None"""
+        try:
+            return json.loads(con.get_profiling_information(format="json"))
+        except Exception as e:
+            logger.warning(f"Could not capture query profile: {str(e)}")
+            return None
+
+    def _condense_profile(self, raw: dict) -> dict:
+        """Keep the totals and the operator tree of a profile"""
+        if raw is None:
+            return None
+
+        def condense(node):
+            return {
+                "operator": node.get("operator_name") or node.get("operator_type"),
+                "timing_ms": round(node.get("operator_timing", 0.0) * 1000, 3),
+                "cardinality": node.get("operator_cardinality"),
+                "rows_scanned": node.get("operator_rows_scanned"),
+                "extra_info": node.get("extra_info") or None,
+                "children": [condense(child) for child in node.get("children", [])],
+            }
+
+        return {
+            "latency_ms": round(raw.get("latency", 0.0) * 1000, 3),
+            "cpu_time_ms": round(raw.get("cpu_time", 0.0) * 1000, 3),
+            "peak_buffer_memory_bytes": raw.get("system_peak_buffer_memory"),
+            "memory_allocated_bytes": raw.get("total_memory_allocated"),
+            "spilled_bytes": raw.get("system_peak_temp_dir_size"),
+            "rows_scanned": raw.get("cumulative_rows_scanned"),
+            "plan": [condense(child) for child in raw.get("children", [])],
+        }
+
+    def record_shared_usage(self, ip_address, user_query, answers):
+        """Charge ip_address for answers generated for another, coalesced request"""
+        for answer in list(answers):
+            self._record_usage(ip_address, user_query, answer, shared=True)
+
+    def _record_usage(self, ip_address, user_query, response, shared=False):
+        """Meter an LLM answer without failing the request"""
+        try:
+            IPTracker.record_llm_usage(ip_address, user_query, response, shared)
+        except Exception as e:
+            logger.error(f"Failed to record LLM usage: {str(e)}")
+
+    def _record_slow_query(
+        self, sql_query, user_query, duration_ms, rows_returned, profile
+    ):
+        """Write a slow execution to the slow query log without failing the request"""
+        logger.warning(
+            f"Slow query ({duration_ms:.0f} ms, {rows_returned} rows): {sql_query[:100]}..."
+        )
+        try:
+            SlowQueryManager.record_slow_query(
+                sql_fingerprint(sql_query),
+                normalize_sql(sql_query),
+                user_query,
+                round(duration_ms, 3),
+                rows_returned,
+                profile,
+            )
+        except Exception as e:
+            logger.error(f"Failed to record slow query: {str(e)}")
+
+    def _format_numeric_columns(self, df: "pd.DataFrame") -> "pd.DataFrame":
         """Format numeric columns in DataFrame to 2 decimal places"""
         # Create a copy of the DataFrame to avoid modifying the original
         formatted_df = df.copy()
@@ -134,9 +361,17 @@ class SQLGenerator:
 
         return sql_query
 
-    def get_sql_for_query(self, user_query: str, system_prompt: str) -> str:
+    def get_sql_for_query(
+        self,
+        user_query: str,
+        system_prompt: str,
+        ip_address: str = None,
+        answers: list = None,
+    ) -> str:
         """Main method to get SQL for a user query"""
-        sql_result = self.generate_sql_via_llm(user_query, system_prompt)
+        sql_result = self.generate_sql_via_llm(
+            user_query, system_prompt, ip_address, answers
+        )
 
         # Extract just the SQL query from the JSON response
         # This assumes the LLM returns a JSON object with a sql_query key
@@ -180,19 +415,15 @@ class SQLGenerator:
             return json.dumps(error_response)
 
     def get_gpt_response(self, prompt: str) -> str:
-        """Get a general response from GPT"""
+        """Get a general response from the configured LLM providers"""
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4.1",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    },
-                ],
-                temperature=0.5,
-            )
-            return response.choices[0].message.content.strip()
+            with stage("llm"):
+                response = self.llm.complete(
+                    [{"role": "user", "content": prompt}],
+                    temperature=0.5,
+                    validate=bool,
+                )
+            return response.text
         except Exception as e:
             logger.error(f"Error getting GPT response: {str(e)}")
             raise
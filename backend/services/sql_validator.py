@@ -1,6 +1,6 @@
 import re
-import sqlparse
 from utils.logger import logger
+from utils.metrics import timed
 
 
 class SQLValidator:
@@ -10,6 +10,7 @@ class SQLValidator:
     """
 
     @staticmethod
+    @timed("validation")
     def validate(sql_query: str, max_subquery_depth=None) -> tuple[bool, str]:
         """
         Validates a SQL query for potential injection patterns and complexity.
@@ -65,7 +66,10 @@ class SQLValidator:
             logger.warning(
                 f"Too many UNION clauses detected ({union_count}) which may indicate SQL injection"
             )
-            return False, "I don't answer to this question, please try again with a different question"
+            return (
+                False,
+                "I don't answer to this question, please try again with a different question",
+            )
 
         # Check for suspicious UNION usage patterns that indicate injection
         suspicious_union_patterns = [
@@ -77,26 +81,25 @@ class SQLValidator:
         for pattern in suspicious_union_patterns:
             if re.search(pattern, normalized_query, re.IGNORECASE):
                 logger.warning(f"Suspicious UNION usage detected: {pattern}")
-                return False, "I don't answer to this question, please try again with a different question"
+                return (
+                    False,
+                    "I don't answer to this question, please try again with a different question",
+                )
 
-        # Parse the SQL query
+        # Parse the SQL query with DuckDB, which runs it, so a statement is
+        # judged by its real type: "WITH a AS (...) DELETE ..." is a DELETE
         try:
-            parsed = sqlparse.parse(sql_query)
-            for statement in parsed:
-                # Special handling for queries that begin with WITH
-                if statement.get_type().upper() != "SELECT":
-                    # Check if this is a WITH query (CTE) which sqlparse sometimes misidentifies
-                    if sql_query.upper().strip().startswith("WITH "):
-                        # Verify it eventually contains a SELECT statement
-                        if re.search(r"\bSELECT\b", sql_query, re.IGNORECASE):
-                            # This is a WITH query that contains SELECT, allow it
-                            logger.info("WITH query with SELECT detected, allowing")
-                            continue
+            import duckdb
 
+            for statement in duckdb.extract_statements(sql_query):
+                if statement.type != duckdb.StatementType.SELECT:
                     logger.warning(
-                        f"Non-SELECT statement detected: {statement.get_type()}"
+                        f"Non-SELECT statement detected: {statement.type.name}"
+                    )
+                    return (
+                        False,
+                        "I don't answer to this question, please try again with a different question",
                     )
-                    return False, "I don't answer to this question, please try again with a different question"
         except Exception as e:
             # log sql query also
             logger.warning(f"Error parsing SQL query: {sql_query}, Error: {str(e)}")
@@ -0,0 +1,636 @@
+import os
+import re
+import threading
+from collections import namedtuple
+from utils.logger import logger
+from utils.metrics import TEMPLATE_MATCHES, stage
+from services.sql_validator import SQLValidator
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:['/-][a-z0-9]+)*")
+
+# A run of question tokens recognised as a dataset value; values holds every
+# spelling in the dataset it stands for (one player's names, one franchise's
+# team names, the venue names sharing a ground's name)
+Entity = namedtuple("Entity", ["kind", "values", "role"])
+
+# Filled template: sql has ? placeholders bound to params, display_sql has
+# them inlined and is what is shown, stored in the history and validated
+TemplateMatch = namedtuple("TemplateMatch", ["name", "sql", "params", "display_sql"])
+
+NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "fifteen": 15,
+    "twenty": 20,
+}
+MAX_LIMIT = 100
+
+# Abbreviations fans use, covering every name the franchise has played under;
+# names missing from the dataset are dropped
+TEAM_ABBREVIATIONS = {
+    "csk": ["Chennai Super Kings"],
+    "mi": ["Mumbai Indians"],
+    "rcb": ["Royal Challengers Bangalore", "Royal Challengers Bengaluru"],
+    "kkr": ["Kolkata Knight Riders"],
+    "srh": ["Sunrisers Hyderabad"],
+    "dc": ["Delhi Daredevils", "Delhi Capitals"],
+    "pbks": ["Kings XI Punjab", "Punjab Kings"],
+    "kxip": ["Kings XI Punjab", "Punjab Kings"],
+    "rr": ["Rajasthan Royals"],
+    "gt": ["Gujarat Titans"],
+    "lsg": ["Lucknow Super Giants"],
+}
+
+# Surnames that are also everyday words are never taken on their own as a player
+COMMON_WORDS = set(
+    "bond brook david green head hope hunt lee little price root salt short "
+    "white wood young".split()
+)
+
+# Words in venue names that do not identify a ground on their own
+GENERIC_VENUE_WORDS = set(
+    "academy association complex cricket ground international oval park "
+    "pradesh ratna sports stadium".split()
+)
+
+# Words any template accepts around its keywords and entities
+FILLER = set(
+    "a all an are at by did do does during ever far for from has have history "
+    "how in ipl is list many me much of on overall please season seasons show "
+    "so tell the till time total what which who with year".split()
+)
+
+# Dismissals credited to the bowler
+BOWLER_WICKET_SQL = (
+    "f.wicket_kind IS NOT NULL AND f.wicket_kind NOT IN "
+    "('run out', 'retired hurt', 'retired out', 'obstructing the field')"
+)
+
+RANKING_WORDS = {"top", "most", "highest", "leading", "best", "maximum"}
+PLURAL_WORDS = {
+    "scorers",
+    "getters",
+    "batters",
+    "batsmen",
+    "takers",
+    "wicket-takers",
+    "bowlers",
+    "teams",
+    "players",
+}
+
+
+def _placeholders(values, params: list) -> str:
+    params.extend(values)
+    return ", ".join("?" for _ in values)
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def inline_params(sql: str, params: list) -> str:
+    """sql with each ? replaced by its parameter as a SQL literal
+
+    Template SQL has no ? other than placeholders, so a plain split is safe.
+    """
+    parts = sql.split("?")
+    if len(parts) != len(params) + 1:
+        raise ValueError("Placeholder count does not match the parameters")
+    return parts[0] + "".join(
+        _sql_literal(value) + part for value, part in zip(params, parts[1:])
+    )
+
+
+class Template:
+    """
+    One question shape. A question matches when it has a word from each of
+    the keyword groups, none of the forbidden words, only words from the
+    template's vocabulary or FILLER besides its entities, and between the
+    minimum and maximum number of entities of each kind. Requiring every word
+    to be understood keeps a question that merely contains the keywords
+    ("most runs in a single over") on its way to the LLM.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        keywords: list,
+        vocabulary: str,
+        slots: dict,
+        build,
+        forbidden=(),
+        ranked=False,
+    ):
+        self.name = name
+        self.keywords = [set(group.split()) for group in keywords]
+        self.vocabulary = set(vocabulary.split()).union(*self.keywords)
+        self.slots = slots
+        self.build = build
+        self.forbidden = set(forbidden)
+        self.ranked = ranked
+
+    def limit(self, words: list):
+        """LIMIT for a ranking: the number asked for, else 10 for a plural and 1 otherwise
+
+        None if the question has several numbers or one out of range, such
+        as a year the dataset has no season for.
+        """
+        numbers = [
+            int(word) if word.isdigit() else NUMBER_WORDS[word]
+            for word in words
+            if word.isdigit() or word in NUMBER_WORDS
+        ]
+        if len(numbers) > 1 or (numbers and not 1 <= numbers[0] <= MAX_LIMIT):
+            return None
+        if numbers:
+            return numbers[0]
+        return 10 if PLURAL_WORDS.intersection(words) else 1
+
+    def match(self, words: list, entities: dict):
+        """(sql, params) if the question fits this template, else None"""
+        if self.forbidden.intersection(words):
+            return None
+        if not all(group.intersection(words) for group in self.keywords):
+            return None
+        limit = None
+        if self.ranked:
+            limit = self.limit(words)
+            if limit is None:
+                return None
+            words = [w for w in words if not (w.isdigit() or w in NUMBER_WORDS)]
+        if any(word not in self.vocabulary and word not in FILLER for word in words):
+            return None
+        for kind in ("player", "team", "venue", "season"):
+            found = len(entities.get(kind, ()))
+            low, high = self.slots.get(kind, (0, 0))
+            if not low <= found <= high:
+                return None
+        return self.build(entities, limit)
+
+
+def _filters(entities: dict, params: list, alias="f", team_columns=None):
+    """WHERE conditions for the optional season, venue and team entities
+
+    alias is the table with season and venue columns; team_columns maps a
+    team's role ("for" or "against") to the column it filters, and teams are
+    left to the caller without it.
+    """
+    conditions = []
+    for season in entities.get("season", ()):
+        conditions.append(f"{alias}.season = ?")
+        params.append(season.values[0])
+    for venue in entities.get("venue", ()):
+        conditions.append(f"{alias}.venue IN ({_placeholders(venue.values, params)})")
+    for team in entities.get("team", ()) if team_columns else ():
+        column = team_columns[team.role]
+        conditions.append(f"{column} IN ({_placeholders(team.values, params)})")
+    return conditions
+
+
+def _where(conditions: list) -> str:
+    return " WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def _top_run_scorers(entities, limit):
+    params = []
+    conditions = _filters(
+        entities,
+        params,
+        team_columns={"for": "f.batting_team", "against": "f.bowling_team"},
+    )
+    params.append(limit)
+    return (
+        "SELECT f.batter, SUM(f.runs_batter) AS total_runs FROM delivery_facts f"
+        f"{_where(conditions)} GROUP BY f.batter ORDER BY total_runs DESC LIMIT ?",
+        params,
+    )
+
+
+def _top_wicket_takers(entities, limit):
+    params = []
+    conditions = [BOWLER_WICKET_SQL] + _filters(
+        entities,
+        params,
+        team_columns={"for": "f.bowling_team", "against": "f.batting_team"},
+    )
+    params.append(limit)
+    return (
+        "SELECT f.bowler, COUNT(*) AS wickets FROM delivery_facts f"
+        f"{_where(conditions)} GROUP BY f.bowler ORDER BY wickets DESC LIMIT ?",
+        params,
+    )
+
+
+def _player_runs(entities, limit):
+    params = []
+    player = entities["player"][0]
+    conditions = [f"f.batter IN ({_placeholders(player.values, params)})"]
+    conditions += _filters(
+        entities,
+        params,
+        team_columns={"for": "f.batting_team", "against": "f.bowling_team"},
+    )
+    return (
+        "SELECT MAX(f.batter) AS batter, SUM(f.runs_batter) AS total_runs, "
+        "SUM(CASE WHEN f.wides = 0 THEN 1 ELSE 0 END) AS balls_faced "
+        f"FROM delivery_facts f{_where(conditions)}",
+        params,
+    )
+
+
+def _player_wickets(entities, limit):
+    params = []
+    player = entities["player"][0]
+    conditions = [
+        f"f.bowler IN ({_placeholders(player.values, params)})",
+        BOWLER_WICKET_SQL,
+    ]
+    conditions += _filters(
+        entities,
+        params,
+        team_columns={"for": "f.bowling_team", "against": "f.batting_team"},
+    )
+    return (
+        "SELECT MAX(f.bowler) AS bowler, COUNT(*) AS wickets "
+        f"FROM delivery_facts f{_where(conditions)}",
+        params,
+    )
+
+
+def _head_to_head(entities, limit):
+    params = []
+    conditions = [
+        "m.match_id IN (SELECT t.match_id FROM teams t WHERE t.team_name IN "
+        f"({_placeholders(team.values, params)}))"
+        for team in entities["team"]
+    ]
+    conditions += _filters(entities, params, alias="m")
+    return (
+        "SELECT COALESCE(m.match_winner, 'No result') AS result, COUNT(*) AS matches "
+        f"FROM matches m{_where(conditions)} GROUP BY result ORDER BY matches DESC",
+        params,
+    )
+
+
+def _most_wins(entities, limit):
+    params = []
+    conditions = ["m.match_winner IS NOT NULL"]
+    conditions += _filters(entities, params, alias="m")
+    params.append(limit)
+    return (
+        "SELECT m.match_winner AS team_name, COUNT(*) AS wins FROM matches m"
+        f"{_where(conditions)} GROUP BY m.match_winner ORDER BY wins DESC LIMIT ?",
+        params,
+    )
+
+
+FILTERS = {"team": (0, 1), "venue": (0, 1), "season": (0, 1)}
+
+TEMPLATES = [
+    Template(
+        "top_run_scorers",
+        keywords=["top most highest leading best maximum", "run runs scorer scorers"],
+        vocabulary="scored scoring getter getters batter batters batsman batsmen against",
+        slots=FILTERS,
+        build=_top_run_scorers,
+        ranked=True,
+    ),
+    Template(
+        "top_wicket_takers",
+        keywords=[
+            "top most highest leading best maximum",
+            "wicket wickets wicket-taker wicket-takers",
+        ],
+        vocabulary="taker takers taking taken took bowler bowlers against",
+        slots=FILTERS,
+        build=_top_wicket_takers,
+        ranked=True,
+    ),
+    Template(
+        "player_runs",
+        keywords=["run runs"],
+        vocabulary="scored score scores make made got against career",
+        slots={**FILTERS, "player": (1, 1)},
+        build=_player_runs,
+        forbidden=RANKING_WORDS,
+    ),
+    Template(
+        "player_wickets",
+        keywords=["wicket wickets"],
+        vocabulary="taken take takes took got against career",
+        slots={**FILTERS, "player": (1, 1)},
+        build=_player_wickets,
+        forbidden=RANKING_WORDS,
+    ),
+    Template(
+        "head_to_head",
+        keywords=["vs v versus against head h2h between"],
+        vocabulary="to and record records result results matches match games "
+        "played won wins win more",
+        slots={"team": (2, 2), "venue": (0, 1), "season": (0, 1)},
+        build=_head_to_head,
+    ),
+    Template(
+        "most_wins",
+        keywords=["top most highest best", "won wins win victories"],
+        vocabulary="team teams matches match games number",
+        slots={"venue": (0, 1), "season": (0, 1)},
+        build=_most_wins,
+        ranked=True,
+    ),
+]
+
+# Every word some template understands; such words are never absorbed into,
+# or taken as, a player's name
+VOCABULARY = set(FILLER).union(*(template.vocabulary for template in TEMPLATES))
+
+
+class Gazetteer:
+    """
+    Phrases naming the players, teams, venues and seasons in the dataset.
+
+    Besides full names, a player is recognised by a surname no other player
+    has ("bumrah" for JJ Bumrah) or by a first name and surname when only
+    one player with that surname has a matching initial ("virat kohli" for
+    V Kohli), and a ground by its name without the city or a word of it no
+    other ground uses ("wankhede");
+    seasons spanning two years answer to either year that is not a season of
+    its own ("2008" for 2007/08). A phrase that could mean two things is
+    dropped, so an ambiguous question goes to the LLM instead.
+    """
+
+    def __init__(self, players: dict, teams: list, venues: list, seasons: list):
+        self._phrases = {}
+        self._ambiguous = set()
+        self._initials = {}
+        self._surnames = {}
+
+        for names in players.values():
+            values = tuple(sorted(set(names)))
+            for name in values:
+                tokens = _TOKEN.findall(name.lower())
+                self._add(tokens, "player", values)
+                given, surname = name.split()[:-1], name.split()[-1]
+                # "V Kohli", "AB de Villiers": initials then a surname
+                if given and given[0].isupper() and len(given[0]) <= 4:
+                    self._initials[values] = set(given[0].lower())
+                    rest = _TOKEN.findall(" ".join(given[1:] + [surname]).lower())
+                    if len(rest) > 1:
+                        self._add(rest, "player", values)
+                elif given:
+                    self._initials[values] = {given[0][0].lower()}
+                last = _TOKEN.findall(surname.lower())
+                if (
+                    len(last) == 1
+                    and len(last[0]) >= 4
+                    and last[0] not in COMMON_WORDS
+                    and last[0] not in VOCABULARY
+                ):
+                    self._surnames.setdefault(last[0], set()).add(values)
+        for surname, candidates in self._surnames.items():
+            if len(candidates) == 1:
+                self._add([surname], "player", next(iter(candidates)))
+
+        for team in teams:
+            self._add(_TOKEN.findall(team.lower()), "team", (team,))
+        for abbreviation, names in TEAM_ABBREVIATIONS.items():
+            present = tuple(name for name in names if name in teams)
+            if present:
+                self._add([abbreviation], "team", present)
+
+        team_words = set(_TOKEN.findall(" ".join(teams).lower()))
+        grounds = {}
+        distinctive = {}
+        for venue in venues:
+            ground = tuple(_TOKEN.findall(venue.split(",")[0].lower()))
+            for phrase in {tuple(_TOKEN.findall(venue.lower())), ground}:
+                grounds.setdefault(phrase, set()).add(venue)
+            # "wankhede" for Wankhede Stadium, unless another ground shares it
+            for word in ground:
+                if (
+                    len(word) >= 5
+                    and word.isalpha()
+                    and word not in GENERIC_VENUE_WORDS
+                    and word not in COMMON_WORDS
+                    and word not in VOCABULARY
+                    and word not in team_words
+                    and word not in self._surnames
+                ):
+                    distinctive.setdefault(word, set()).add(ground)
+        for tokens, names in grounds.items():
+            self._add(tokens, "venue", tuple(sorted(names)))
+        for word, named_grounds in distinctive.items():
+            if len(named_grounds) == 1:
+                self._add([word], "venue", tuple(sorted(grounds[named_grounds.pop()])))
+
+        for season in seasons:
+            self._add([season.lower()], "season", (season,))
+        for season in seasons:
+            if "/" in season:
+                start, end = season.split("/")
+                for year in (start, start[: 4 - len(end)] + end):
+                    if year not in seasons:
+                        self._add([year], "season", (season,))
+
+        for phrase in self._ambiguous:
+            self._phrases.pop(phrase, None)
+        self.max_length = max((len(phrase) for phrase in self._phrases), default=1)
+
+    def _add(self, tokens, kind: str, values: tuple):
+        phrase = tuple(tokens)
+        if not phrase:
+            return
+        existing = self._phrases.get(phrase)
+        if existing is not None and existing != (kind, values):
+            self._ambiguous.add(phrase)
+        self._phrases[phrase] = (kind, values)
+
+    @classmethod
+    def from_engine(cls, engine):
+        """Build from the dimension tables of the engine's current dataset"""
+        with engine.cursor() as (con, version):
+            players = {}
+            for player_id, name in con.execute(
+                "SELECT player_id, player_name FROM dim_player"
+            ).fetchall():
+                players.setdefault(player_id or name, []).append(name)
+            teams = [
+                row[0]
+                for row in con.execute("SELECT team_name FROM dim_team").fetchall()
+            ]
+            venues = [
+                row[0] for row in con.execute("SELECT venue FROM dim_venue").fetchall()
+            ]
+            seasons = [
+                row[0]
+                for row in con.execute("SELECT season FROM dim_season").fetchall()
+            ]
+        return cls(players, teams, venues, seasons), version
+
+    def tag(self, question: str):
+        """Split a question into plain words and entities, longest phrase first
+
+        Returns (words, entities by kind).
+        """
+        tokens = _TOKEN.findall(question.lower())
+        words = []
+        entities = {}
+        last = None
+        i = 0
+        while i < len(tokens):
+            for length in range(min(self.max_length, len(tokens) - i), 0, -1):
+                found = self._phrases.get(tuple(tokens[i : i + length]))
+                if found is not None:
+                    break
+            else:
+                found = self._first_name_and_surname(tokens, i)
+                if found is None:
+                    words.append(tokens[i])
+                    last = tokens[i]
+                    i += 1
+                    continue
+                length = 2
+
+            kind, values = found
+            role = "against" if last in ("against", "vs", "v", "versus") else "for"
+            entities.setdefault(kind, []).append(Entity(kind, values, role))
+            last = None
+            i += length
+        return words, entities
+
+    def _first_name_and_surname(self, tokens: list, i: int):
+        """("player", values) if tokens[i:i + 2] is a first name the dataset
+        abbreviates to an initial followed by that player's surname"""
+        first = tokens[i]
+        if i + 1 >= len(tokens) or not first.isalpha() or first in VOCABULARY:
+            return None
+        candidates = [
+            values
+            for values in self._surnames.get(tokens[i + 1], ())
+            if first[0] in self._initials.get(values, ())
+        ]
+        if len(candidates) != 1:
+            return None
+        return "player", candidates[0]
+
+
+class TemplateMatcher:
+    """
+    Answers the most common question shapes (top run scorers or wicket
+    takers, a player's runs or wickets, head to head records, most wins)
+    from parameterized SQL instead of an LLM call. Entities are recognised
+    with a Gazetteer of the current dataset, rebuilt in the background when
+    the dataset changes; every value is bound as a parameter. Anything that does not fit
+    a template exactly returns None and goes to the LLM as before.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._gazetteer = None
+        self._version = None
+        self._rebuilding = False
+        self._lock = threading.Lock()
+        # Serializes builds, which scan the dataset
+        self._build_lock = threading.Lock()
+        self._check_templates()
+
+    @classmethod
+    def from_env(cls, engine):
+        """None when TEMPLATE_FAST_PATH is 0"""
+        if os.getenv("TEMPLATE_FAST_PATH", "1") == "0":
+            return None
+        return cls(engine)
+
+    @staticmethod
+    def _check_templates():
+        """Validate every template with all of its optional filters filled"""
+        sample = {
+            "player": [Entity("player", ("A Player",), "for")],
+            "team": [
+                Entity("team", ("Team A", "Team B"), "for"),
+                Entity("team", ("Team C",), "against"),
+            ],
+            "venue": [Entity("venue", ("Ground",), "for")],
+            "season": [Entity("season", ("2020/21",), "for")],
+        }
+        for template in TEMPLATES:
+            entities = {
+                kind: found[: template.slots.get(kind, (0, 0))[1]]
+                for kind, found in sample.items()
+            }
+            sql, params = template.build(entities, 10)
+            is_valid, error_message = SQLValidator.validate(inline_params(sql, params))
+            if not is_valid:
+                raise ValueError(
+                    f"Template {template.name} is invalid: {error_message}"
+                )
+
+    def gazetteer(self) -> Gazetteer:
+        """Gazetteer for the dataset being served
+
+        Only the first call waits for a build. When the dataset changes, the
+        new gazetteer is built in a background thread and the previous one
+        keeps being used until it is ready.
+        """
+        version = self.engine.dataset_version()
+        with self._lock:
+            if self._gazetteer is not None:
+                if version != self._version and not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(
+                        target=self._rebuild, name="gazetteer", daemon=True
+                    ).start()
+                return self._gazetteer
+        with self._build_lock:
+            if self._gazetteer is None:
+                self._build()
+            return self._gazetteer
+
+    def _build(self):
+        with stage("gazetteer"):
+            gazetteer, version = Gazetteer.from_engine(self.engine)
+        with self._lock:
+            self._gazetteer, self._version = gazetteer, version
+        logger.info(f"Built template gazetteer for dataset {version}")
+
+    def _rebuild(self):
+        try:
+            with self._build_lock:
+                self._build()
+        except Exception as e:
+            logger.error(f"Error rebuilding template gazetteer: {str(e)}")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def match(self, question: str):
+        """TemplateMatch for a question of a known shape, else None"""
+        try:
+            gazetteer = self.gazetteer()
+        except Exception as e:
+            logger.error(f"Error building template gazetteer: {str(e)}")
+            return None
+
+        with stage("template_match"):
+            words, entities = gazetteer.tag(question)
+            for template in TEMPLATES:
+                built = template.match(words, entities)
+                if built is not None:
+                    sql, params = built
+                    TEMPLATE_MATCHES.inc(template=template.name)
+                    return TemplateMatch(
+                        template.name, sql, params, inline_params(sql, params)
+                    )
+        TEMPLATE_MATCHES.inc(template="none")
+        return None
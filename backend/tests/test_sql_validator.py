@@ -0,0 +1,57 @@
+import pytest
+from services.sql_validator import SQLValidator
+
+
+@pytest.mark.parametrize(
+    "sql_query",
+    [
+        "SELECT COUNT(*) FROM matches",
+        "WITH a AS (SELECT 1 AS x) SELECT x FROM a",
+        "SELECT * FROM delivery_facts WHERE season = ?",
+    ],
+)
+def test_select_statements_pass(sql_query):
+    assert SQLValidator.validate(sql_query)[0]
+
+
+@pytest.mark.parametrize(
+    "sql_query",
+    [
+        "WITH a AS (SELECT 1) DELETE FROM fact_deliveries",
+        "WITH a AS (SELECT 1) INSERT INTO fact_deliveries SELECT * FROM a",
+        "WITH a AS (SELECT 1) UPDATE match_info SET overs = 0",
+        "CREATE TABLE copy AS WITH a AS (SELECT 1) SELECT * FROM a",
+        "DROP VIEW delivery_facts",
+    ],
+)
+def test_cte_prefixed_dml_and_ddl_are_rejected(sql_query):
+    assert not SQLValidator.validate(sql_query)[0]
+
+
+def test_read_only_engine_keeps_cte_dml_from_changing_the_data(tmp_path):
+    """Even past the validator, the served dataset cannot be modified"""
+    import sqlite3
+    import duckdb
+    from json_to_database import create_schema, refresh_player_over_stats
+    from services.query_engine import QueryEngine, ResourcePolicy
+
+    source = tmp_path / "ipl_data.db"
+    conn = sqlite3.connect(source)
+    create_schema(conn)
+    refresh_player_over_stats(conn)
+    conn.execute("INSERT INTO match_info (match_id) VALUES ('1'), ('2')")
+    conn.commit()
+    conn.close()
+
+    engine = QueryEngine(
+        str(source),
+        datasets_dir=str(tmp_path / "datasets"),
+        resources=ResourcePolicy(temp_directory=str(tmp_path / "duckdb_tmp")),
+    )
+    try:
+        with engine.cursor() as (con, _):
+            with pytest.raises(duckdb.Error):
+                con.execute("WITH a AS (SELECT 1) DELETE FROM match_info")
+            assert con.execute("SELECT COUNT(*) FROM match_info").fetchone() == (2,)
+    finally:
+        engine.close()
@@ -0,0 +1,6 @@
+def get_client_ip(headers, client) -> str:
+    """Real client IP: the first X-Forwarded-For hop, else the peer address"""
+    forwarded_for = headers.get("X-Forwarded-For")
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return client.host if client else "unknown"
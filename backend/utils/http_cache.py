@@ -0,0 +1,37 @@
+import hashlib
+
+
+def strong_etag(*parts) -> str:
+    """Quoted strong ETag identifying the representation built from parts
+
+    parts are bytes (a response body) or strings such as a dataset version
+    and the normalized SQL a result was computed from.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def weak_etag(*parts) -> str:
+    """strong_etag() marked weak, for responses that may also be sent compressed
+
+    GZipMiddleware sits outside the handlers and only some clients accept
+    gzip, so the same ETag describes both codings. A strong validator must
+    differ between codings; a weak one only promises equivalent content.
+    """
+    return "W/" + strong_etag(*parts)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match evaluation, which uses the weak comparison (W/ ignored)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
@@ -2,6 +2,7 @@ import logging
 import os
 from datetime import datetime
 from pathlib import Path
+from utils.request_context import RequestIdFilter
 
 
 class Logger:
@@ -17,6 +18,7 @@ class Logger:
         # Create a logger
         self.logger = logging.getLogger(name)
         self.logger.setLevel(log_level)
+        self.logger.addFilter(RequestIdFilter())
 
         # Remove existing handlers if any
         if self.logger.handlers:
@@ -33,7 +35,7 @@ class Logger:
 
         # Create formatter and add to the handlers
         formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+            "%(asctime)s - %(name)s - %(levelname)s - %(request_id)s - %(message)s",
             datefmt="%Y-%m-%d %H:%M:%S",
         )
         file_handler.setFormatter(formatter)
@@ -0,0 +1,297 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond validation up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs)
+        + "}"
+    )
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Observing is a bisect plus three additions under a
+    lock, cheap enough for the request hot path.
+    """
+
+    def __init__(self, name: str, description: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            snapshot = [
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._series.items()
+            ]
+        for key, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, (('le', bound),))} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))} {count}"
+            )
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide collection of metrics rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def histogram(
+        self, name: str, description: str, buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+STAGE_DURATION = metrics.histogram(
+    "nl_to_sql_stage_duration_seconds", "Time spent in each pipeline stage"
+)
+REQUEST_DURATION = metrics.histogram(
+    "nl_to_sql_request_duration_seconds", "End-to-end HTTP request duration"
+)
+QUERY_OUTCOMES = metrics.counter(
+    "nl_to_sql_queries_total", "Processed queries by outcome"
+)
+LLM_ERRORS = metrics.counter(
+    "nl_to_sql_llm_errors_total", "Failed calls to an LLM provider, by provider"
+)
+LLM_CALL_DURATION = metrics.histogram(
+    "nl_to_sql_llm_call_duration_seconds", "Duration of each LLM provider call"
+)
+LLM_HEDGES = metrics.counter(
+    "nl_to_sql_llm_hedges_total",
+    "Hedged LLM requests, by the provider that was too slow",
+)
+LLM_WINS = metrics.counter(
+    "nl_to_sql_llm_answers_total", "Valid LLM answers used, by provider"
+)
+LLM_TOKENS = metrics.counter(
+    "nl_to_sql_llm_tokens_total", "LLM tokens used, by provider and kind"
+)
+LLM_CIRCUIT_OPENED = metrics.counter(
+    "nl_to_sql_llm_circuit_opened_total", "Times an LLM provider's circuit opened"
+)
+REJECTIONS = metrics.counter(
+    "nl_to_sql_rejections_total", "Requests rejected before execution, by reason"
+)
+ADMISSION_DECISIONS = metrics.counter(
+    "nl_to_sql_admission_decisions_total",
+    "Admission control outcomes for /process_query/, by decision",
+)
+
+COALESCED_REQUESTS = metrics.counter(
+    "nl_to_sql_coalesced_requests_total",
+    "Requests that shared an identical in-flight LLM call or query execution",
+)
+TEMPLATE_MATCHES = metrics.counter(
+    "nl_to_sql_template_matches_total",
+    "Questions answered from a SQL template, by template, or 'none' for the LLM",
+)
+DATASET_RELOADS = metrics.counter(
+    "nl_to_sql_dataset_reloads_total",
+    "Background switches to a newly published dataset version, by swapped or failed",
+)
+QUERY_CPU_SECONDS = metrics.histogram(
+    "nl_to_sql_query_cpu_seconds", "DuckDB CPU time per query execution"
+)
+QUERY_MEMORY_BYTES = metrics.histogram(
+    "nl_to_sql_query_memory_bytes",
+    "Memory DuckDB allocated per query execution",
+    buckets=tuple(2**power for power in range(16, 34, 2)),
+)
+QUERY_SPILLED_BYTES = metrics.counter(
+    "nl_to_sql_query_spilled_bytes_total",
+    "Bytes DuckDB spilled to its temp directory, summed over queries",
+)
+QUERY_LIMIT_HITS = metrics.counter(
+    "nl_to_sql_query_limit_hits_total",
+    "Query executions that hit a resource limit, by rows or memory",
+)
+RESULT_CACHE_REQUESTS = metrics.counter(
+    "nl_to_sql_result_cache_requests_total", "Result cache lookups, by hit or miss"
+)
+
+
+class RequestTrace:
+    """
+    Stage timings of the request being served: total seconds per stage for
+    the Server-Timing header, plus every (stage, start offset, duration)
+    span in completion order so a slow request can be followed end to end.
+    """
+
+    __slots__ = ("start", "timings", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = {}
+        self.spans = []
+
+    def format_spans(self) -> str:
+        """Spans as "stage@start+duration" in milliseconds"""
+        return " ".join(
+            f"{name}@{offset * 1000:.1f}+{elapsed * 1000:.1f}ms"
+            for name, offset, elapsed in self.spans
+        )
+
+
+_request_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+def start_request_trace() -> RequestTrace:
+    """Begin collecting stage timings for the current request context"""
+    trace = RequestTrace()
+    _request_trace.set(trace)
+    return trace
+
+
+def request_elapsed_s() -> float:
+    """Seconds since the current request started, or None outside a request"""
+    trace = _request_trace.get()
+    if trace is None:
+        return None
+    return time.perf_counter() - trace.start
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block, record it in the stage histogram and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=name)
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.timings[name] = trace.timings.get(name, 0.0) + elapsed
+            trace.spans.append((name, start - trace.start, elapsed))
+
+
+def timed(name: str):
+    """Decorator form of stage()"""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def server_timing_header(timings: dict) -> str:
+    """Format stage timings as a Server-Timing header value (durations in ms)"""
+    return ", ".join(
+        f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()
+    )
@@ -0,0 +1,27 @@
+import re
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMERIC_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    return " ".join(question.lower().split()).rstrip("?!. ")
+
+
+def normalize_sql(sql_query: str) -> str:
+    """Collapse whitespace and drop trailing semicolons, keeping literals intact"""
+    return " ".join(sql_query.split()).rstrip(";").strip()
+
+
+def sql_fingerprint(sql_query: str) -> str:
+    """
+    Reduce a query to its shape: literals become '?', IN lists collapse to a
+    single placeholder and everything outside literals is lower-cased, so the
+    same query asked about different players or seasons groups together.
+    """
+    shape = _STRING_LITERAL.sub("?", normalize_sql(sql_query))
+    shape = _NUMERIC_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("(?)", shape)
+    return shape.lower()
@@ -0,0 +1,36 @@
+import contextvars
+import logging
+import os
+import re
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# IDs supplied by a client or proxy are kept if they look like one
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,64}$")
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request_id(incoming: str = None) -> str:
+    """The client's X-Request-ID if it is well formed, else a fresh random ID"""
+    if incoming and _VALID_REQUEST_ID.match(incoming):
+        return incoming
+    return os.urandom(8).hex()
+
+
+def set_request_id(request_id: str):
+    """Make request_id current for this context (and threads started from it)"""
+    return _request_id.set(request_id)
+
+
+def get_request_id():
+    """ID of the request being served, or None outside a request"""
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID to log records as %(request_id)s"""
+
+    def filter(self, record):
+        record.request_id = _request_id.get() or "-"
+        return True
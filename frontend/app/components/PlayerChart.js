@@ -5,10 +5,26 @@ import {
   LineChart, Line, XAxis, YAxis, Tooltip, Legend, ResponsiveContainer,
 } from 'recharts';
 
+// One point per over 1-20, with defaults for overs the player has no stats in;
+// empty if the player has no stats in this role at all
+function fillOvers(rows, defaults) {
+  if (!rows || rows.length === 0) return [];
+  const byOver = {};
+  rows.forEach((row) => {
+    byOver[row.over + 1] = { ...row, over: row.over + 1 };
+  });
+  const filled = [];
+  for (let i = 1; i <= 20; i++) {
+    filled.push(byOver[i] || { over: i, ...defaults });
+  }
+  return filled;
+}
+
 export default function PlayerChart() {
   const [batsmanData, setBatsmanData] = useState([]);
   const [bowlerData, setBowlerData] = useState([]);
   const [playerName, setPlayerName] = useState('');
+  const [playerId, setPlayerId] = useState('');
   const [role, setRole] = useState('batter');
   const [allPlayers, setAllPlayers] = useState([]);
   const [searchTerm, setSearchTerm] = useState('');
@@ -16,87 +32,10 @@ export default function PlayerChart() {
   const dropdownRef = useRef(null);
 
   useEffect(() => {
-    fetch('/batsman.csv')
-      .then((res) => res.text())
-      .then((data) => {
-        const rows = data.trim().split('\n').slice(1).map((row) => {
-          const [player_name, over, min_runs, max_runs, avg_runs] = row.split(',');
-          return {
-            player_name,
-            over: +over + 1,
-            min_runs: +min_runs,
-            max_runs: +max_runs,
-            avg_runs: +avg_runs,
-          };
-        });
-        const filledBatsmanData = [];
-        const batsmanMap = {};
-
-        rows.forEach((row) => {
-          if (!batsmanMap[row.player_name]) {
-            batsmanMap[row.player_name] = {};
-          }
-          batsmanMap[row.player_name][row.over] = row;
-        });
-
-        Object.entries(batsmanMap).forEach(([name, overs]) => {
-          for (let i = 1; i <= 20; i++) {
-            if (!overs[i]) {
-              filledBatsmanData.push({
-                player_name: name,
-                over: i,
-                min_runs: 0,
-                max_runs: 0,
-                avg_runs: 0,
-              });
-            } else {
-              filledBatsmanData.push(overs[i]);
-            }
-          }
-        });
-
-        setBatsmanData(filledBatsmanData);
-        setAllPlayers((prev) => [...new Set([...prev, ...rows.map((r) => r.player_name)])]);
-      });
-
-    fetch('/bowlers.csv')
-      .then((res) => res.text())
-      .then((data) => {
-        const rows = data.trim().split('\n').slice(1).map((row) => {
-          const [player_name, over, total_wickets] = row.split(',');
-          return {
-            player_name,
-            over: +over + 1,
-            total_wickets: +total_wickets,
-          };
-        });
-        const filledBowlerData = [];
-        const bowlerMap = {};
-
-        rows.forEach((row) => {
-          if (!bowlerMap[row.player_name]) {
-            bowlerMap[row.player_name] = {};
-          }
-          bowlerMap[row.player_name][row.over] = row;
-        });
-
-        Object.entries(bowlerMap).forEach(([name, overs]) => {
-          for (let i = 1; i <= 20; i++) {
-            if (!overs[i]) {
-              filledBowlerData.push({
-                player_name: name,
-                over: i,
-                total_wickets: 0,
-              });
-            } else {
-              filledBowlerData.push(overs[i]);
-            }
-          }
-        });
-
-        setBowlerData(filledBowlerData);
-        setAllPlayers((prev) => [...new Set([...prev, ...rows.map((r) => r.player_name)])]);
-      });
+    fetch('/api/players/')
+      .then((res) => res.json())
+      .then((data) => setAllPlayers(data.players || []))
+      .catch(() => setAllPlayers([]));
 
     const handleClickOutside = (event) => {
       if (dropdownRef.current && !dropdownRef.current.contains(event.target)) {
@@ -107,10 +46,29 @@ export default function PlayerChart() {
     return () => document.removeEventListener('mousedown', handleClickOutside);
   }, []);
 
-  const filteredBatsman = batsmanData.filter((d) => d.player_name === playerName);
-  const filteredBowler = bowlerData.filter((d) => d.player_name === playerName);
+  // Only the selected player's rows are fetched; overs come back 0-based
+  useEffect(() => {
+    if (!playerId) return;
+    let cancelled = false;
+    fetch(`/api/players/${encodeURIComponent(playerId)}/over_stats`)
+      .then((res) => (res.ok ? res.json() : { batting: [], bowling: [] }))
+      .then((data) => {
+        if (cancelled) return;
+        setBatsmanData(fillOvers(data.batting, { min_runs: 0, max_runs: 0, avg_runs: 0 }));
+        setBowlerData(fillOvers(data.bowling, { total_wickets: 0 }));
+      })
+      .catch(() => {
+        if (cancelled) return;
+        setBatsmanData([]);
+        setBowlerData([]);
+      });
+    return () => {
+      cancelled = true;
+    };
+  }, [playerId]);
+
   const filteredPlayers = allPlayers.filter((player) =>
-    player.toLowerCase().includes(searchTerm.toLowerCase())
+    player.player_name.toLowerCase().includes(searchTerm.toLowerCase())
   );
 
   return (
@@ -142,14 +100,15 @@ export default function PlayerChart() {
               {filteredPlayers.length > 0 ? (
                 filteredPlayers.map((player) => (
                   <div
-                    key={player}
+                    key={player.player_id}
                     className="px-4 py-2 hover:bg-gray-100 cursor-pointer"
                     onMouseDown={() => {
-                      setPlayerName(player);
+                      setPlayerName(player.player_name);
+                      setPlayerId(player.player_id);
                       setIsDropdownOpen(false);
                     }}
                   >
-                    {player}
+                    {player.player_name}
                   </div>
                 ))
               ) : (
@@ -188,9 +147,9 @@ export default function PlayerChart() {
 
       {/* Chart Display */}
       <div className="bg-gray-50 rounded-xl border border-gray-200">
-        {role === 'batter' && filteredBatsman.length > 0 ? (
+        {role === 'batter' && batsmanData.length > 0 ? (
           <ResponsiveContainer width="100%" height={400} className="p-0 m-0">
-          <LineChart data={filteredBatsman}>
+          <LineChart data={batsmanData}>
               <XAxis
                 dataKey="over"
                 stroke="#333"
@@ -208,9 +167,9 @@ export default function PlayerChart() {
               <Line type="monotone" dataKey="avg_runs" stroke="#ff8c00" strokeWidth={2} dot />
             </LineChart>
           </ResponsiveContainer>
-        ) : role === 'bowler' && filteredBowler.length > 0 ? (
+        ) : role === 'bowler' && bowlerData.length > 0 ? (
 <ResponsiveContainer width="100%" height={400} className="p-0 m-0">
-<LineChart data={filteredBowler}>
+<LineChart data={bowlerData}>
               <XAxis
                 dataKey="over"
                 stroke="#333"